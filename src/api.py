@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict
 
@@ -17,6 +18,10 @@ from lib.components.azure_aks_pod import AKSPod
 from lib.ief.core import *
 from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
 from lib.MetricsExporter.exporter import MetricsExporter
+from lib.service.response_cache import get_response_cache, request_key
+from lib.service.ndjson import ndjson_line, stream_impacts
+from lib.service.jobs import get_job_manager
+from lib.service.batch import calculate_batch
 
 
 
@@ -33,14 +38,14 @@ class AggregatedComponentRequest(BaseModel):
     interval: str
     timespan: str
 
+class BatchRequest(BaseModel):
+    requests: List[AggregatedComponentRequest]
+
 app = FastAPI()
 
 aggregation = MetricAggregationType.AVERAGE
 
-@app.post("/metrics")
-async def get_metrics(request: AggregatedComponentRequest = Body(...)):
-    print(request)
-    data = {}
+def build_aggregated_component(request: AggregatedComponentRequest) -> AggregatedImpactNodesInterface:
     components = []
     for component in request.components:
         print(component)
@@ -49,7 +54,7 @@ async def get_metrics(request: AggregatedComponentRequest = Body(...)):
             node = AzureVM(name = component.name, model=ComputeServer_STATIC_IMP(), carbon_intensity_provider=None, auth_object=component.auth_params, resource_selectors=component.resource_selectors, metadata=component.metadata, interval=request.interval, timespan=request.timespan)
             components.append(node)
         elif component.type == 'AKSNode':
-            node = AKSNode(name = component.name, model = ComputeServer_STATIC_IMP(), carbon_intensity_provider=None, auth=component.auth_params, resource_selectors=component.resource_selectors, metadata=component.metadata, interval=request.interval, timespan=request.timespan)
+            node = AKSNode(name = component.name, model = ComputeServer_STATIC_IMP(), carbon_intensity_provider=None, auth_object=component.auth_params, resource_selectors=component.resource_selectors, metadata=component.metadata, interval=request.interval, timespan=request.timespan)
             components.append(node)
         elif component.type == 'AKSPod':
             pod = AKSPod(name = component.name, model = ComputeServer_STATIC_IMP(),  carbon_intensity_provider=None, auth_object=component.auth_params, resource_selectors=component.resource_selectors, metadata=component.metadata, interval=request.interval, timespan=request.timespan)
@@ -58,19 +63,84 @@ async def get_metrics(request: AggregatedComponentRequest = Body(...)):
             continue
 
     # Create an instance of the AggregatedImpactNodesInterface class for the aggregated component
-    aggregated_component = AggregatedImpactNodesInterface(
+    return AggregatedImpactNodesInterface(
         name=request.app_name,
         components=components,
         timespan=request.timespan,
         interval=request.interval
     )
 
-    # Calculate the metrics for the aggregated component and its child components
-    metrics = aggregated_component.calculate()
 
+async def calculate_metrics(request: AggregatedComponentRequest) -> Dict[str, SCIImpactMetricsInterface]:
+    # Calculate the metrics for the aggregated component and its child components, concurrently
+    aggregated_component = build_aggregated_component(request)
+    return await aggregated_component.calculate()
+
+
+@app.post("/metrics")
+async def get_metrics(response: Response, request: AggregatedComponentRequest = Body(...)):
+    print(request)
+    # identical requests (e.g. dashboards refreshing the same app) are served from the response cache
+    metrics, cache_status = await get_response_cache().get(request_key(request), lambda: calculate_metrics(request))
+    response.headers["X-Cache"] = cache_status
     return metrics
 
 
+@app.post("/metrics/batch")
+async def get_batch_metrics(request: BatchRequest = Body(...)):
+    print("batch of %s apps" % len(request.requests))
+    # the results are returned per app name
+    app_names = [app_request.app_name for app_request in request.requests]
+    duplicates = sorted(set(app_name for app_name in app_names if app_names.count(app_name) > 1))
+    if duplicates:
+        raise HTTPException(status_code=422, detail=f"Duplicate app_name in batch: {', '.join(duplicates)}")
+    # the resources and observations shared by several apps are fetched once for the whole batch
+    return await calculate_batch([build_aggregated_component(app_request) for app_request in request.requests])
+
+
+@app.post("/metrics/stream")
+async def stream_metrics(request: AggregatedComponentRequest = Body(...)):
+    print(request)
+    # one NDJSON line per resource, as the components complete ; the host nodes are sent once and referenced by id
+    aggregated_component = build_aggregated_component(request)
+    return StreamingResponse(stream_impacts(aggregated_component), media_type="application/x-ndjson")
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: AggregatedComponentRequest = Body(...)):
+    print(request)
+    # long windows (e.g. P30D backfills) are calculated in the background, one chunk (sub-window) at a time
+    job = await get_job_manager().submit(request, build_aggregated_component)
+    return job.state()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job["state"]
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    if job["result"] is None:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['state']['status']}")
+    return job["result"]
+
+
+@app.get("/jobs/{job_id}/progress")
+async def stream_job_progress(job_id: str):
+    # one NDJSON line per change of the job state, until it is finished
+    async def progress():
+        async for state in get_job_manager().progress(job_id):
+            yield ndjson_line(state)
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
 def main():
     uvicorn.run(f"{__name__}:app", host="127.0.0.1", port=8000)
 
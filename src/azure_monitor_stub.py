@@ -0,0 +1,126 @@
+# local stub of the Azure Monitor metrics batch API (metrics:getBatch), to test the batch observation mode offline
+#
+#   python azure_monitor_stub.py --port 8089
+#   AZURE_MONITOR_BATCH_ENDPOINT=http://localhost:8089 AZURE_MONITOR_OBSERVATION_MODE=batch python dev.py
+#
+# every resource gets deterministic datapoints, derived from a hash of its id
+import argparse
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from isoduration import parse_duration
+
+
+BATCH_PATH = re.compile(r"^/subscriptions/(?P<subscription_id>[^/]+)/metrics:getBatch$")
+MAX_RESOURCES = 50
+
+METRIC_UNITS = {
+    "Percentage CPU": "Percent",
+    "Available Memory Bytes": "Bytes",
+    "GPU Utilization": "Percent",
+}
+
+
+def stub_value(resource_id: str, metric_name: str, index: int) -> float:
+    seed = int(hashlib.sha256(f"{resource_id.lower()}|{metric_name}".encode()).hexdigest()[:8], 16)
+    if metric_name == "Available Memory Bytes":
+        return float((1 + seed % 8) * 1024 ** 3)
+    return float((seed + index * 7) % 100)
+
+
+def timestamps(starttime: str, endtime: str, interval: str):
+    start = datetime.strptime(starttime, "%Y-%m-%dT%H:%M:%SZ")
+    end = datetime.strptime(endtime, "%Y-%m-%dT%H:%M:%SZ")
+    step = (datetime(2000, 1, 1) + parse_duration(interval)) - datetime(2000, 1, 1)
+    if step <= timedelta(0):
+        step = timedelta(minutes=1)
+    current = start
+    while current < end:
+        yield current
+        current += step
+
+
+def batch_response(subscription_id: str, query: dict, resource_ids: list) -> dict:
+    starttime = query["starttime"][0]
+    endtime = query["endtime"][0]
+    interval = query.get("interval", ["PT1M"])[0]
+    namespace = query.get("metricnamespace", [""])[0]
+    metric_names = [name.strip() for name in query.get("metricnames", [""])[0].split(",") if name.strip()]
+    aggregation = query.get("aggregation", ["average"])[0].lower()
+
+    values = []
+    for resource_id in resource_ids:
+        metrics = []
+        for metric_name in metric_names:
+            data = [
+                {"timeStamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"), aggregation: stub_value(resource_id, metric_name, index)}
+                for index, timestamp in enumerate(timestamps(starttime, endtime, interval))
+            ]
+            metrics.append({
+                "id": f"{resource_id}/providers/Microsoft.Insights/metrics/{metric_name}",
+                "type": "Microsoft.Insights/metrics",
+                "name": {"value": metric_name, "localizedValue": metric_name},
+                "displayDescription": "",
+                "unit": METRIC_UNITS.get(metric_name, "Count"),
+                "timeseries": [{"metadatavalues": [], "data": data}],
+                "errorCode": "Success"
+            })
+        values.append({
+            "starttime": starttime,
+            "endtime": endtime,
+            "interval": interval,
+            "namespace": namespace,
+            "resourceregion": "stub",
+            "resourceid": resource_id,
+            "value": metrics
+        })
+    return {"values": values}
+
+
+class AzureMonitorBatchStubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        match = BATCH_PATH.match(url.path)
+        if match is None:
+            return self.send_json(404, {"error": {"code": "NotFound", "message": f"unknown path {url.path}"}})
+
+        query = parse_qs(url.query)
+        for parameter in ["starttime", "endtime", "metricnames", "api-version"]:
+            if parameter not in query:
+                return self.send_json(400, {"error": {"code": "BadRequest", "message": f"missing query parameter {parameter}"}})
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        resource_ids = body.get("resourceids", [])
+        if not resource_ids or len(resource_ids) > MAX_RESOURCES:
+            return self.send_json(400, {"error": {"code": "BadRequest", "message": f"resourceids must contain 1 to {MAX_RESOURCES} resource ids"}})
+
+        self.send_json(200, batch_response(match.group("subscription_id"), query, resource_ids))
+
+    def send_json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Azure Monitor metrics:getBatch stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), AzureMonitorBatchStubHandler)
+    print(f"Azure Monitor batch metrics stub listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
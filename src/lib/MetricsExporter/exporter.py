@@ -1,12 +1,14 @@
 import csv
 import sys
 import json
+import threading
 from typing import Dict, List
 from prometheus_client import start_http_server, Gauge, REGISTRY
 
 sys.path.append('./lib')
 from lib.components.azure_vm import AzureVM
 from lib.ief.core import ImpactNodeInterface, SCIImpactMetricsInterface
+from lib.ief.impact_frame import ImpactFrame
 
 
 # class MetricsExporter2:
@@ -59,13 +61,14 @@ class MetricsExporter:
         self.data = data
         self.labels = labels
         self.prefix = prefix
-        self.e_cpu_gauge = Gauge(f"{prefix}_E_CPU", "Energy consumed by CPU", self.labels)
-        self.e_mem_gauge = Gauge(f"{prefix}_E_MEM", "Energy consumed by memory", self.labels)
-        self.e_gpu_gauge = Gauge(f"{prefix}_E_GPU", "Energy consumed by GPU", self.labels)
-        self.e_gauge = Gauge(f"{prefix}_E", "Total energy consumed", self.labels)
-        self.i_gauge = Gauge(f"{prefix}_I", "Carbon intensity", self.labels)
-        self.m_gauge = Gauge(f"{prefix}_M", "Fixed metric value", self.labels)
-        self.sci_gauge = Gauge(f"{prefix}_SCI", "SCI metric", self.labels)
+        # sharded exporter : each resource is exported by a single shard, the gauges of the shards are summed
+        self.e_cpu_gauge = Gauge(f"{prefix}_E_CPU", "Energy consumed by CPU", self.labels, multiprocess_mode="livesum")
+        self.e_mem_gauge = Gauge(f"{prefix}_E_MEM", "Energy consumed by memory", self.labels, multiprocess_mode="livesum")
+        self.e_gpu_gauge = Gauge(f"{prefix}_E_GPU", "Energy consumed by GPU", self.labels, multiprocess_mode="livesum")
+        self.e_gauge = Gauge(f"{prefix}_E", "Total energy consumed", self.labels, multiprocess_mode="livesum")
+        self.i_gauge = Gauge(f"{prefix}_I", "Carbon intensity", self.labels, multiprocess_mode="livesum")
+        self.m_gauge = Gauge(f"{prefix}_M", "Fixed metric value", self.labels, multiprocess_mode="livesum")
+        self.sci_gauge = Gauge(f"{prefix}_SCI", "SCI metric", self.labels, multiprocess_mode="livesum")
 
     def set_data(self, data = {}):
         self.data = data
@@ -74,11 +77,19 @@ class MetricsExporter:
         with open(file_path, 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(self.labels + ["E_CPU", "E_MEM", "E_GPU", "E", "I", "M", "SCI"])
+            if isinstance(self.data, ImpactFrame):
+                columns = [self.data.column(metric) for metric in ["E_CPU", "E_MEM", "E_GPU", "E", "I", "M", "SCI"]]
+                for index in range(len(self.data)):
+                    writer.writerow(list(self._get_frame_labels(self.data, index).values()) + [float(column[index]) for column in columns])
+                return
             for key, value in self.data.items():
                 writer.writerow([getattr(value, label) for label in self.labels] + [value.E_CPU, value.E_MEM, value.E_GPU, value.E, value.I, value.M, value.SCI])
 
     def to_json(self, file_path):
         with open(file_path, 'w') as f:
+            if isinstance(self.data, ImpactFrame):
+                json.dump([self.data.row(index) for index in range(len(self.data))], f)
+                return
             json.dump(self.data, f, default=lambda x: x.__dict__)
 
     @staticmethod
@@ -86,6 +97,9 @@ class MetricsExporter:
         start_http_server(port)
 
     def to_prometheus(self):
+        if isinstance(self.data, ImpactFrame):
+            self._frame_to_prometheus(self.data)
+            return
         for key, value in self.data.items():
             # Set the value of each Gauge to the corresponding value in the data dictionary
             self.e_cpu_gauge.labels(**self._get_labels(value)).set(value.E_CPU)
@@ -96,9 +110,29 @@ class MetricsExporter:
             self.m_gauge.labels(**self._get_labels(value)).set(value.M)
             self.sci_gauge.labels(**self._get_labels(value)).set(value.SCI)
 
+    def _frame_to_prometheus(self, frame: ImpactFrame):
+        # read the metric columns once, and set the gauges row by row
+        gauges = [
+            (self.e_cpu_gauge, frame.column("E_CPU")),
+            (self.e_mem_gauge, frame.column("E_MEM")),
+            (self.e_gpu_gauge, frame.column("E_GPU")),
+            (self.e_gauge, frame.column("E")),
+            (self.i_gauge, frame.column("I")),
+            (self.m_gauge, frame.column("M")),
+            (self.sci_gauge, frame.column("SCI")),
+        ]
+        for index in range(len(frame)):
+            labels = self._get_frame_labels(frame, index)
+            for gauge, column in gauges:
+                gauge.labels(**labels).set(float(column[index]))
+
     def _get_labels(self, value):
         return {label: getattr(value, label) for label in self.labels}
 
+    def _get_frame_labels(self, frame: ImpactFrame, index: int):
+        # frame labels are read from the label columns, or from the resource metadata (e.g. namespace, controller)
+        return {label: frame.label(label, index) for label in self.labels}
+
 
 class AzureVMExporter(MetricsExporter):
     def __init__(self, data: Dict[str, SCIImpactMetricsInterface]):
@@ -114,6 +148,9 @@ class AKSPodExporter(MetricsExporter):
 
     def set_data(self, data={}):
         super().set_data(data)
+        if isinstance(data, ImpactFrame):
+            # metadata labels are resolved by the frame itself
+            return
         new_data = {}
         for resource, impactdata in self.data.items():
             metadata = impactdata.metadata
@@ -133,4 +170,17 @@ class AKSPodExporter(MetricsExporter):
             "controllerKind": value.metadata.get("controllerKind", ""),
             "namespace": value.metadata.get("namespace", ""),
             "node": value.metadata.get("node", "")
-        }
\ No newline at end of file
+        }
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def get_exporter(exporter_class) -> MetricsExporter:
+    # one exporter per class and process : the gauges of a prefix can only be registered once
+    with _exporters_lock:
+        exporter = _exporters.get(exporter_class)
+        if exporter is None:
+            exporter = exporter_class({})
+            _exporters[exporter_class] = exporter
+        return exporter
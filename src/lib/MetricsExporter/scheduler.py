@@ -0,0 +1,100 @@
+from typing import Awaitable, Callable
+import asyncio
+import os
+import random
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+EXPORT_PERIOD = float(os.environ.get("EXPORT_PERIOD", "60")) # seconds between two cycles of an exporter worker
+EXPORT_JITTER = float(os.environ.get("EXPORT_JITTER", "5")) # seconds, max offset of the ticks of a process from the wall-clock boundaries, so that replicas do not all query the upstreams at the same time
+EXPORT_DEADLINE = float(os.environ.get("EXPORT_DEADLINE", "0")) # seconds a cycle may run before it is cancelled ; 0 : the period
+
+CYCLE_LAG = Gauge("exporter_cycle_lag_seconds", "Delay between the scheduled tick and the start of the last cycle", ["worker"], multiprocess_mode="livemax")
+CYCLE_DURATION = Histogram("exporter_cycle_duration_seconds", "Duration of the exporter cycles", ["worker"], buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 300))
+CYCLES_SKIPPED = Counter("exporter_cycles_skipped", "Ticks skipped because the previous cycle was still running", ["worker"])
+CYCLES_TIMED_OUT = Counter("exporter_cycles_timed_out", "Cycles cancelled at their deadline", ["worker"])
+CYCLES_FAILED = Counter("exporter_cycles_failed", "Cycles that raised an error", ["worker"])
+
+_process_offset = None
+
+
+def process_offset(jitter: float = EXPORT_JITTER) -> float:
+    # drawn once per process : the workers of a process stay in phase, the processes (replicas) are spread
+    global _process_offset
+    if _process_offset is None:
+        _process_offset = random.uniform(0, jitter) if jitter > 0 else 0.0
+    return _process_offset
+
+
+class CycleScheduler:
+    """
+    Runs the cycles of an exporter worker on wall-clock aligned ticks (e.g. every minute, at the same offset in the minute),
+    instead of sleeping a fixed time after each cycle : the period does not drift with the duration of the cycles, and the
+    workers of a process stay in phase.
+
+    A cycle is cancelled at its deadline, and the ticks missed by a slow cycle are skipped (and counted) rather than run
+    back to back. The scheduler stops as soon as stop_event is set, cancelling the running cycle.
+    """
+
+    def __init__(self, name: str, period: float = EXPORT_PERIOD, deadline: float = EXPORT_DEADLINE, offset: float = None):
+        self.name = name
+        self.period = period
+        self.deadline = deadline if deadline > 0 else period
+        self.offset = (offset if offset is not None else process_offset()) % period
+
+    def next_tick(self, now: float) -> float:
+        # first tick strictly after now
+        return ((now - self.offset) // self.period + 1) * self.period + self.offset
+
+    async def wait_until(self, tick: float, stop_event: asyncio.Event) -> bool:
+        """
+        :return: True if stop_event was set before the tick.
+        """
+        delay = tick - time.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        return stop_event.is_set()
+
+    async def run_cycle(self, cycle: Callable[[], Awaitable], stop_event: asyncio.Event) -> None:
+        cycle_task = asyncio.ensure_future(cycle())
+        stop_task = asyncio.ensure_future(stop_event.wait())
+        try:
+            await asyncio.wait({cycle_task, stop_task}, timeout=self.deadline, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_task.cancel()
+            if not cycle_task.done():
+                cycle_task.cancel()
+                await asyncio.gather(cycle_task, return_exceptions=True)
+
+        if cycle_task.cancelled():
+            if not stop_event.is_set():
+                CYCLES_TIMED_OUT.labels(worker=self.name).inc()
+                print("%s : cycle cancelled after its deadline of %s seconds" % (self.name, self.deadline))
+        elif cycle_task.exception() is not None:
+            CYCLES_FAILED.labels(worker=self.name).inc()
+            print("Error in cycle of %s : %s" % (self.name, cycle_task.exception()))
+
+    async def run(self, cycle: Callable[[], Awaitable], stop_event: asyncio.Event) -> None:
+        """
+        Runs cycle on each tick, until stop_event is set.
+
+        :param cycle: coroutine function running one cycle (e.g. calculate and export the impacts).
+        """
+        tick = self.next_tick(time.time())
+        while not await self.wait_until(tick, stop_event):
+            started = time.time()
+            CYCLE_LAG.labels(worker=self.name).set(started - tick)
+            await self.run_cycle(cycle, stop_event)
+            CYCLE_DURATION.labels(worker=self.name).observe(time.time() - started)
+
+            next_tick = self.next_tick(time.time())
+            skipped = int(round((next_tick - tick) / self.period)) - 1
+            if skipped > 0:
+                CYCLES_SKIPPED.labels(worker=self.name).inc(skipped)
+                print("%s : cycle took %.1f seconds, %s ticks skipped" % (self.name, time.time() - started, skipped))
+            tick = next_tick
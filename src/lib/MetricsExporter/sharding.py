@@ -0,0 +1,146 @@
+from typing import Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import glob
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+import zlib
+
+
+EXPORTER_SHARDS = int(os.environ.get("EXPORTER_SHARDS", "1")) # exporter worker processes ; 1 : the impact nodes run in the exporter process
+EXPORTER_SHARD_RESTART_DELAY = float(os.environ.get("EXPORTER_SHARD_RESTART_DELAY", "10")) # seconds before a crashed shard is restarted
+EXPORTER_SHARD_STOP_TIMEOUT = float(os.environ.get("EXPORTER_SHARD_STOP_TIMEOUT", "30")) # seconds the shards have to stop, before they are killed
+
+
+def parse_shard(resource_selectors: Dict[str, object]) -> Tuple[int, int]:
+    # "shard" selector : "index/count", e.g. "0/4"
+    shard = resource_selectors.get("shard", None)
+    if not shard:
+        return None
+    index, count = str(shard).split("/")
+    return int(index), int(count)
+
+
+def in_shard(key: str, shard: Tuple[int, int]) -> bool:
+    # stable across processes and restarts, unlike hash()
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(str(key).encode("utf-8")) % count == index
+
+
+def shard_resources(resources: Dict[str, object], resource_selectors: Dict[str, object], key: Callable[[str, object], str] = None) -> Dict[str, object]:
+    """
+    Keeps the resources of the shard of the selectors (all of them without a "shard" selector).
+
+    :param key: (resource name, resource) -> shard key, e.g. the namespace of a pod ; the resource name by default.
+    """
+    shard = parse_shard(resource_selectors)
+    if shard is None:
+        return resources
+    return {name: resource for name, resource in resources.items() if in_shard(key(name, resource) if key is not None else name, shard)}
+
+
+def shard_selectors(impact_node, index: int, count: int) -> Dict[str, object]:
+    """
+    Resource selectors of an impact node for a shard, or None if the impact node does not run in that shard :
+
+    - impact nodes with a shard_key (Kubernetes nodes and pods) run in every shard, on their resources of the shard.
+    - impact nodes with several subscription_ids (Azure VMs) run in the shards of their subscriptions, on these subscriptions.
+    - the other impact nodes run in the first shard only.
+    """
+    resource_selectors = dict(impact_node.resource_selectors)
+    if getattr(impact_node, "shard_key", None) is not None:
+        resource_selectors["shard"] = "%s/%s" % (index, count)
+        return resource_selectors
+    subscription_ids = resource_selectors.get("subscription_ids", None)
+    if isinstance(subscription_ids, list) and len(subscription_ids) > 1:
+        shard_subscription_ids = [subscription_id for subscription_id in subscription_ids if in_shard(subscription_id, (index, count))]
+        if not shard_subscription_ids:
+            return None
+        resource_selectors["subscription_ids"] = shard_subscription_ids
+        return resource_selectors
+    return resource_selectors if index == 0 else None
+
+
+def run_shard(build_impact_nodes: Callable[[], List[object]], run: Callable[[List[object]], Awaitable], index: int, count: int) -> None:
+    # entry point of a shard process : builds the impact nodes, keeps the ones of the shard, and runs them until SIGTERM
+    impact_nodes = []
+    for impact_node in build_impact_nodes():
+        resource_selectors = shard_selectors(impact_node, index, count)
+        if resource_selectors is not None:
+            impact_node.resource_selectors = resource_selectors
+            impact_nodes.append(impact_node)
+    print("shard %s/%s (pid %s) : %s" % (index, count, os.getpid(), ", ".join(impact_node.name for impact_node in impact_nodes)))
+    if impact_nodes:
+        asyncio.run(run(impact_nodes))
+
+
+def prepare_multiprocess_dir() -> str:
+    # the shards write their metrics to mmap files in PROMETHEUS_MULTIPROC_DIR, which must be set before prometheus_client
+    # is imported by the shards, and emptied at startup
+    multiprocess_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR", None) or tempfile.mkdtemp(prefix="sci-exporter-")
+    os.makedirs(multiprocess_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(multiprocess_dir, "*.db")):
+        os.remove(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiprocess_dir
+    return multiprocess_dir
+
+
+def run_sharded_exporter(build_impact_nodes: Callable[[], List[object]], run: Callable[[List[object]], Awaitable], shards: int = EXPORTER_SHARDS, port: int = 8000) -> None:
+    """
+    Runs the exporter in shards worker processes, each one calculating its share of the resources (see shard_selectors),
+    and serves the metrics of all the shards from this process, merged by the prometheus_client multiprocess collector.
+
+    :param build_impact_nodes: picklable function building the impact nodes of the exporter ; called in each shard.
+    :param run: picklable coroutine function running the impact nodes until SIGTERM (e.g. metrics_exporter.main).
+    """
+    multiprocess_dir = prepare_multiprocess_dir()
+    from prometheus_client import CollectorRegistry, start_http_server, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=multiprocess_dir)
+    start_http_server(port, registry=registry)
+
+    # spawn : the shards do not inherit the threads and event loop state of this process
+    context = multiprocessing.get_context("spawn")
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    def start(index: int):
+        process = context.Process(target=run_shard, args=(build_impact_nodes, run, index, shards), name="exporter-shard-%s" % index, daemon=True)
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(shards)}
+    restart_at = {}
+    print("sharded exporter : %s shards, metrics in %s" % (shards, multiprocess_dir))
+    try:
+        while not stopping:
+            time.sleep(1)
+            for index, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                if index not in restart_at:
+                    # the gauges of a dead shard are no longer reported (live* multiprocess modes)
+                    multiprocess.mark_process_dead(process.pid, path=multiprocess_dir)
+                    print("shard %s (pid %s) exited with code %s ; restarting in %s seconds" % (index, process.pid, process.exitcode, EXPORTER_SHARD_RESTART_DELAY))
+                    restart_at[index] = time.monotonic() + EXPORTER_SHARD_RESTART_DELAY
+                elif time.monotonic() >= restart_at[index]:
+                    del restart_at[index]
+                    processes[index] = start(index)
+    finally:
+        # SIGTERM lets the shards stop their cycles (see CycleScheduler), then they are killed
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + EXPORTER_SHARD_STOP_TIMEOUT
+        for process in processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+            multiprocess.mark_process_dead(process.pid, path=multiprocess_dir)
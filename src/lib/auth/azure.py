@@ -1,5 +1,5 @@
 from lib.ief.core import AuthParams
-from azure.identity import DefaultAzureCredential
+from lib.auth.session import get_auth_session
 from azure.core.credentials import AccessToken
 from typing import Dict
 
@@ -10,7 +10,7 @@ class AzureManagedIdentityAuthParams(AuthParams):
 
     def get_credential(self) -> Dict[str, str]:
 
-        credential = DefaultAzureCredential()
+        credential = get_auth_session().credential
         #token = credential.get_token(self.resource)
         #return {'Authorization': f'Bearer {token.token}'}
         return credential
\ No newline at end of file
@@ -0,0 +1,180 @@
+from typing import Awaitable, Callable, Dict
+import asyncio
+import io
+import os
+import threading
+import time
+import weakref
+
+import yaml
+from azure.identity import DefaultAzureCredential, ClientSecretCredential
+from azure.mgmt.containerservice import ContainerServiceClient
+from kubernetes import client
+from kubernetes.config.kube_config import KubeConfigLoader
+
+from lib.components.azure_monitor import run_blocking
+from lib.components.azure_throttle import get_rate_limiter
+
+
+PROMETHEUS_SCOPE = "https://prometheus.monitor.azure.com/.default"
+
+AUTH_REFRESH_MARGIN = float(os.environ.get("AUTH_REFRESH_MARGIN", "300")) # seconds ; tokens are refreshed this long before they expire
+AUTH_REFRESH_INTERVAL = float(os.environ.get("AUTH_REFRESH_INTERVAL", "60")) # seconds, between two runs of the background refresh
+KUBECONFIG_MAX_AGE = float(os.environ.get("KUBECONFIG_MAX_AGE", "3600")) # seconds ; cluster configurations are reloaded after this age
+
+
+class KubernetesSession:
+    # Kubernetes configuration and ApiClient of a cluster, with the function that loads the configuration
+    def __init__(self, load_configuration: Callable[[], Awaitable[client.Configuration]], max_age: float):
+        self.load_configuration = load_configuration
+        self.max_age = max_age
+        self.api_client = None
+        self.loaded_at = None
+
+    def is_fresh(self, margin: float = 0) -> bool:
+        return self.api_client is not None and (time.monotonic() - self.loaded_at) < (self.max_age - margin)
+
+
+class AuthSession:
+    """
+    Process-wide authentication session : one Azure credential, access tokens cached per scope until they expire,
+    and one Kubernetes ApiClient per cluster until its configuration expires.
+    A background task of the running event loop refreshes the tokens and cluster configurations before they expire.
+    """
+
+    def __init__(self, refresh_margin: float = AUTH_REFRESH_MARGIN, refresh_interval: float = AUTH_REFRESH_INTERVAL):
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+        self._credential = None
+        self._tokens = {}
+        self._kubernetes_sessions: Dict[str, KubernetesSession] = {}
+        self._lock = threading.RLock()
+        self._cluster_locks = {}
+        self._refresh_tasks = weakref.WeakKeyDictionary()
+
+    @property
+    def credential(self):
+        with self._lock:
+            if self._credential is None:
+                try:
+                    self._credential = DefaultAzureCredential()
+                except Exception as e:
+                    print(f"Error loading DefaultAzureCredential: {e}")
+                    print("using service principal credential")
+                    self._credential = ClientSecretCredential(os.environ.get("AZURE_TENANT_ID", None), os.environ.get("AZURE_CLIENT_ID", None), os.environ.get("AZURE_CLIENT_SECRET", None))
+            return self._credential
+
+    def _token_is_fresh(self, scope: str, margin: float) -> bool:
+        token = self._tokens.get(scope)
+        return token is not None and token.expires_on - time.time() > margin
+
+    def get_token(self, scope: str) -> str:
+        """
+        Access token for the given scope, from the cache while it does not expire (blocking on a cache miss).
+        """
+        with self._lock:
+            if not self._token_is_fresh(scope, 0):
+                self._tokens[scope] = self.credential.get_token(scope)
+            return self._tokens[scope].token
+
+    async def get_token_async(self, scope: str) -> str:
+        self.start_background_refresh()
+        if self._token_is_fresh(scope, 0):
+            return self._tokens[scope].token
+        return await run_blocking(self.get_token, scope)
+
+    async def kubernetes_api_client(self, cluster_key: str, load_configuration: Callable[[], Awaitable[client.Configuration]], max_age: float = KUBECONFIG_MAX_AGE) -> client.ApiClient:
+        """
+        ApiClient of a cluster, loaded once with load_configuration and then reused until max_age.
+        The configuration is also set as the default Kubernetes configuration.
+
+        :param cluster_key: identifies the cluster, e.g. subscription/resource group/cluster name.
+        """
+        self.start_background_refresh()
+        kubernetes_session = self._kubernetes_sessions.get(cluster_key)
+        if kubernetes_session is not None and kubernetes_session.is_fresh():
+            return kubernetes_session.api_client
+
+        # concurrent callers of the same cluster wait for a single load
+        lock = self._cluster_locks.setdefault((cluster_key, asyncio.get_running_loop()), asyncio.Lock())
+        async with lock:
+            kubernetes_session = self._kubernetes_sessions.get(cluster_key)
+            if kubernetes_session is None:
+                kubernetes_session = KubernetesSession(load_configuration, max_age)
+                self._kubernetes_sessions[cluster_key] = kubernetes_session
+            if not kubernetes_session.is_fresh():
+                await self._load_kubernetes_session(cluster_key, kubernetes_session)
+        return kubernetes_session.api_client
+
+    def api_client(self, cluster_key: str) -> client.ApiClient:
+        # last ApiClient loaded for the cluster, e.g. for the watch caches that reconnect in a background thread
+        kubernetes_session = self._kubernetes_sessions.get(cluster_key)
+        if kubernetes_session is None or kubernetes_session.api_client is None:
+            raise Exception(f"Kubernetes cluster {cluster_key} is not authenticated")
+        return kubernetes_session.api_client
+
+    async def _load_kubernetes_session(self, cluster_key: str, kubernetes_session: KubernetesSession) -> None:
+        configuration = await kubernetes_session.load_configuration()
+        client.Configuration.set_default(configuration)
+        kubernetes_session.api_client = client.ApiClient(configuration)
+        kubernetes_session.loaded_at = time.monotonic()
+        print("Kubernetes configuration loaded for cluster %s" % cluster_key)
+
+    def start_background_refresh(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = self._refresh_tasks.get(loop)
+        if task is None or task.done():
+            self._refresh_tasks[loop] = loop.create_task(self._refresh_loop())
+
+    async def refresh(self) -> None:
+        # refreshes the tokens and cluster configurations that expire within the refresh margin
+        for scope in list(self._tokens.keys()):
+            if not self._token_is_fresh(scope, self.refresh_margin):
+                try:
+                    token = await run_blocking(self.credential.get_token, scope)
+                    with self._lock:
+                        self._tokens[scope] = token
+                except Exception as e:
+                    print(f"Error refreshing the token for {scope}: {e}")
+
+        for cluster_key, kubernetes_session in list(self._kubernetes_sessions.items()):
+            if kubernetes_session.api_client is not None and not kubernetes_session.is_fresh(self.refresh_margin):
+                try:
+                    await self._load_kubernetes_session(cluster_key, kubernetes_session)
+                except Exception as e:
+                    print(f"Error refreshing the Kubernetes configuration of cluster {cluster_key}: {e}")
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+
+async def load_aks_configuration(credential, subscription_id: str, resource_group_name: str, cluster_name: str) -> client.Configuration:
+    """
+    Kubernetes configuration of an AKS cluster, from its user credentials (kubeconfig) fetched from ARM.
+    """
+    container_service_client = ContainerServiceClient(credential, subscription_id)
+    credentials = await get_rate_limiter("arm").run(container_service_client.managed_clusters.list_cluster_user_credentials, resource_group_name, cluster_name, description=f"credentials of cluster {cluster_name}")
+    kubeconfig = credentials.kubeconfigs[0].value
+
+    kubeconfig_dict = yaml.safe_load(io.BytesIO(kubeconfig))
+    loader = KubeConfigLoader(config_dict=kubeconfig_dict)
+    configuration = client.Configuration()
+    loader.load_and_set(configuration)
+    return configuration
+
+
+_auth_session = None
+_auth_session_lock = threading.Lock()
+
+
+def get_auth_session() -> AuthSession:
+    global _auth_session
+    with _auth_session_lock:
+        if _auth_session is None:
+            _auth_session = AuthSession()
+        return _auth_session
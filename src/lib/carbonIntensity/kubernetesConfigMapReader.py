@@ -1,5 +1,5 @@
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, List
 from lib.ief.core import *
 
 from kubernetes import client, config
@@ -12,10 +12,67 @@ import os
 import io
 import base64
 import json
-from datetime import datetime
+import time
+import bisect
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
 
 from azure.mgmt.containerservice import ContainerServiceClient
-from azure.identity import DefaultAzureCredential
+from lib.auth.session import get_auth_session
+from lib.components.azure_monitor import run_blocking
+
+
+CARBON_INTENSITY_MAX_AGE = float(os.environ.get("CARBON_INTENSITY_MAX_AGE", "30")) # seconds, between two reads of the ConfigMap ; should be shorter than the exporter cycle
+
+
+def forecast_epoch(timestamp: datetime) -> float:
+    # naive datetimes are UTC, as the forecast timestamps
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class CarbonIntensityForecast:
+    """
+    Parsed carbon intensity forecast of a ConfigMap resourceVersion : the forecasts are sorted by time,
+    and their timestamps kept as a sorted epoch array, for bisect lookups of the closest forecast.
+    """
+
+    def __init__(self, forecasts: List[Dict[str, Any]], resource_version: str = None):
+        self.resource_version = resource_version
+        forecasts = sorted(forecasts, key=lambda forecast: forecast['timestamp'])
+        self.forecasts = forecasts
+        self.epochs = np.fromiter((forecast_epoch(datetime.strptime(forecast['timestamp'], '%Y-%m-%dT%H:%M:%SZ')) for forecast in forecasts), dtype=float, count=len(forecasts))
+
+    def __len__(self):
+        return len(self.forecasts)
+
+    def closest_indices(self, epochs: np.ndarray) -> np.ndarray:
+        # index of the closest forecast for each epoch ; on a tie, the earlier forecast
+        right = np.clip(np.searchsorted(self.epochs, epochs, side="left"), 1, len(self.epochs) - 1)
+        left = right - 1
+        return np.where(np.abs(epochs - self.epochs[left]) <= np.abs(self.epochs[right] - epochs), left, right)
+
+    def closest(self, timestamp: datetime) -> Dict[str, Any]:
+        if not self.forecasts:
+            return None
+        if len(self.forecasts) == 1:
+            return self.forecasts[0]
+        epoch = forecast_epoch(timestamp)
+        right = min(max(bisect.bisect_left(self.epochs, epoch), 1), len(self.epochs) - 1)
+        if abs(epoch - self.epochs[right - 1]) <= abs(self.epochs[right] - epoch):
+            return self.forecasts[right - 1]
+        return self.forecasts[right]
+
+    def closest_many(self, timestamps: List[datetime]) -> List[Dict[str, Any]]:
+        if not self.forecasts:
+            return [None] * len(timestamps)
+        if len(self.forecasts) == 1:
+            return [self.forecasts[0]] * len(timestamps)
+        epochs = np.fromiter((forecast_epoch(timestamp) for timestamp in timestamps), dtype=float, count=len(timestamps))
+        return [self.forecasts[index] for index in self.closest_indices(epochs)]
 
 
 class CarbonIntensityKubernetesConfigMap(CarbonIntensityPluginInterface):
@@ -23,8 +80,12 @@ class CarbonIntensityKubernetesConfigMap(CarbonIntensityPluginInterface):
         self.api_client = None
         self.namespace = None
         self.config_map_name = None
-        self.credential = DefaultAzureCredential()
+        self.credential = get_auth_session().credential
         self.resource_selectors = resource_selectors
+        self.max_age = CARBON_INTENSITY_MAX_AGE
+        self.forecast = None
+        self.read_at = None
+        self._lock = asyncio.Lock()
 
 
     def auth(self, auth_params: Dict[str, object]) -> None:
@@ -52,28 +113,41 @@ class CarbonIntensityKubernetesConfigMap(CarbonIntensityPluginInterface):
         # Create Kubernetes API client
         self.api_client = client.CoreV1Api()
 
-    async def get_current_carbon_intensity(self) -> float:
-        # Get the carbon-intensity ConfigMap from the namespace
-        config_map = self.api_client.read_namespaced_config_map(self.config_map_name, self.namespace)
-
-        # Decode the binary data
-        data = base64.b64decode(config_map.binary_data['data'])
+    async def read_forecast(self) -> CarbonIntensityForecast:
+        # one ConfigMap read per cycle ; the forecast is only decoded and parsed again when the ConfigMap resourceVersion changes
+        config_map = await run_blocking(self.api_client.read_namespaced_config_map, self.config_map_name, self.namespace)
+        resource_version = config_map.metadata.resource_version if config_map.metadata is not None else None
+        if self.forecast is not None and resource_version is not None and self.forecast.resource_version == resource_version:
+            return self.forecast
+
+        # Decode the binary data and parse the JSON data
+        forecasts = json.loads(base64.b64decode(config_map.binary_data['data']))
+        print("carbon intensity forecast loaded : %s forecasts, resourceVersion %s" % (len(forecasts), resource_version))
+        return CarbonIntensityForecast(forecasts, resource_version)
+
+    async def get_forecast(self) -> CarbonIntensityForecast:
+        # concurrent callers of the same cycle wait for a single read
+        async with self._lock:
+            if self.forecast is None or (time.monotonic() - self.read_at) >= self.max_age:
+                self.forecast = await self.read_forecast()
+                self.read_at = time.monotonic()
+        return self.forecast
 
-        # Parse the JSON data
-        forecasts = json.loads(data)
+    async def get_current_carbon_intensity(self) -> float:
+        forecast = await self.get_forecast()
 
         # Find the forecast closest to the current time
         now = datetime.utcnow()
-        closest_forecast = None
-        closest_delta = None
-        for forecast in forecasts:
-            forecast_time = datetime.strptime(forecast['timestamp'], '%Y-%m-%dT%H:%M:%SZ')
-            delta = abs(now - forecast_time)
-            if closest_delta is None or delta < closest_delta:
-                closest_forecast = forecast
-                closest_delta = delta
+        closest_forecast = forecast.closest(now)
 
         # Return the current carbon intensity value
         print("current time: %s" % now)
         print("closest forecast: %s" % closest_forecast)
-        return closest_forecast
\ No newline at end of file
+        return closest_forecast
+
+    async def get_carbon_intensities(self, timestamps: List[datetime]) -> List[Dict[str, Any]]:
+        """
+        Batch lookup : the forecasts closest to each of the given (UTC) timestamps, from a single read of the ConfigMap.
+        """
+        forecast = await self.get_forecast()
+        return forecast.closest_many(timestamps)
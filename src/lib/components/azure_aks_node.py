@@ -4,6 +4,11 @@ from lib.components.azure_vm import AzureVM
 from lib.ief.core import SCIImpactMetricsInterface
 from lib.auth.azure import AzureManagedIdentityAuthParams
 from lib.MetricsExporter.exporter import *
+from lib.components.sku_catalog import get_sku_catalog
+from lib.components.azure_monitor import get_monitor_client
+from lib.components.http_client import get_http_client
+from lib.components.prometheus import instant_query_params, range_query_params
+from lib.auth.session import get_auth_session, load_aks_configuration, PROMETHEUS_SCOPE
 
 
 from kubernetes import client, config
@@ -26,23 +31,22 @@ import itertools
 
 aggregation = MetricAggregationType.AVERAGE #for monitoring queries
 
-semaphore_max = 5 # to avoid throttling ; this is the max number of concurrent queries for Azure Monitor
-
 class AKSNode(AzureVM):
+    # selectors that filter the nodes of a cluster
+    filter_selectors = ("node_name", "nodepool_name")
+
     def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H"):
         super().__init__(name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval, timespan)
         self.type = "azure.compute.aks.node"
         self.resources = {}
         self.observations = {}
-        self.credential = DefaultAzureCredential()
         self.static_params = {}
-        self.exporter = AKSNodeExporter()
+        self.exporter = get_exporter(AKSNodeExporter)
         # Create an instance of AzureManagedIdentityAuthParams to authenticate with Azure using managed identity
 
-    def get_auth_token(self):
-        scope = "https://prometheus.monitor.azure.com/.default"
-        token = self.credential.get_token(scope)
-        return token.token
+    async def get_auth_token(self):
+        # cached by the auth session until it expires ; refreshed off the event loop
+        return await get_auth_session().get_token_async(PROMETHEUS_SCOPE)
 
     
     def list_supported_skus(self):
@@ -61,27 +65,14 @@ class AKSNode(AzureVM):
         subscription_id = self.resource_selectors.get("subscription_id", None)
         resource_group_name = self.resource_selectors.get("resource_group", None)
         cluster_name = self.resource_selectors.get("cluster_name", None)
-        container_service_client = ContainerServiceClient(self.credential, subscription_id)
-        
-        kubeconfig = container_service_client.managed_clusters.list_cluster_user_credentials(resource_group_name, cluster_name).kubeconfigs[0].value
-
-        kubeconfig_stream = io.BytesIO(kubeconfig)
-        kubeconfig_dict = yaml.safe_load(kubeconfig_stream)
-        
-
-        # Get the name of the current context and cluster from the kubeconfig dict
-        #current_context = kubeconfig_dict["current-context"]
-        #current_cluster = kubeconfig_dict["contexts"][0]["context"]["cluster"]
-
-
-        # Load the Kubernetes configuration from the kubeconfig
-        loader = KubeConfigLoader(config_dict=kubeconfig_dict)
-        configuration = client.Configuration()
-        loader.load_and_set(configuration)
-        client.Configuration.set_default(configuration)
+        # the cluster configuration is cached by the auth session, instead of fetching the kubeconfig from ARM every time
+        cluster_api_client = await get_auth_session().kubernetes_api_client(
+            "%s/%s/%s" % (subscription_id, resource_group_name, cluster_name),
+            lambda: load_aks_configuration(self.credential, subscription_id, resource_group_name, cluster_name)
+        )
 
         # Create a Kubernetes API client for the CoreV1Api
-        api_client = client.CoreV1Api()
+        api_client = client.CoreV1Api(cluster_api_client)
 
 
         # Query the Kubernetes API server for the list of nodes in the cluster
@@ -110,16 +101,14 @@ class AKSNode(AzureVM):
 
     async def fetch_observations(self) -> Dict[str, object]:
         subscription_id = self.resource_selectors.get("subscription_id", None)
-        monitor_client = MonitorManagementClient(self.credential, subscription_id)
+        monitor_client = get_monitor_client(self.credential, subscription_id)
         #node_id = self._get_node_id(node_name, resource_group_name)
 
         if self.resources == {} or self.resources == None: await self.fetch_resources()
         if self.static_params == {} or self.static_params == None: await self.lookup_static_params()
 
-        # Create a semaphore with an initial value of 3
-        semaphore = asyncio.Semaphore(semaphore_max) # to avoid throttling ; this is the max number of concurrent queries for Azure Monitor
-
-
+        if self.observation_window is not None:
+            self.observation_window.fetch_range()
 
         cpu_memory_tasks = []
         gpu_tasks = []
@@ -129,7 +118,7 @@ class AKSNode(AzureVM):
                 vm_name = resource.metadata.name
                 instance_memory = self.static_params[resource_name]['instance_memory']
 
-                cpu_memory_tasks.append(asyncio.create_task(self.fetch_cpu_memory_utilization(semaphore, vm_id, instance_memory, monitor_client)))
+                cpu_memory_tasks.append(asyncio.create_task(self.fetch_cpu_memory_utilization(vm_id, instance_memory, monitor_client)))
                 gpu_tasks.append(asyncio.create_task(self.fetch_gpu_utilization(resource, monitor_client)))
 
         cpu_memory_results = await asyncio.gather(*cpu_memory_tasks)
@@ -146,7 +135,11 @@ class AKSNode(AzureVM):
                     'average_memory_gb': memory_utilization,
                     'average_gpu_percentage': gpu_utilization
                 }
+                if self.time_resolved:
+                    self.observations[vm_name]['series'] = self.cpu_memory_series(resource.spec.provider_id.replace('azure://',''), self.static_params[resource_name]['instance_memory'])
 
+        if self.observation_window is not None:
+            self.observation_window.advance()
         return self.observations
 
  
@@ -169,38 +162,23 @@ class AKSNode(AzureVM):
 
         if self.resources == {} or self.resources == None: await self.fetch_resources()
 
-        # Create a list of coroutines to run concurrently using a list comprehension
-        coroutines = [
-            (
-                self.get_vm_sku_tdp(resource.metadata.labels.get("beta.kubernetes.io/instance-type", "")),
-                self.get_vm_resources(resource.metadata.labels.get("beta.kubernetes.io/instance-type", "")),
-                self.get_vm_te(resource.metadata.labels.get("beta.kubernetes.io/instance-type", ""))
-            )
-            for resource_name, resource in self.resources.items()
-        ]
-
-        # Run the coroutines concurrently using asyncio.gather
-        results = await asyncio.gather(*[coro for coro in itertools.chain(*coroutines)])
-
-        # Process the results and update the static_params dictionary
-        i = 0
+        # one batch lookup in the SKU catalog, for all the distinct node instance types
+        instance_types = {resource_name: resource.metadata.labels.get("beta.kubernetes.io/instance-type", "") for resource_name, resource in self.resources.items()}
+        sku_records = get_sku_catalog().lookup_many(instance_types.values())
+
         for resource_name, resource in self.resources.items():
             vm_name = resource.metadata.name
-            vm_sku_tdp = results[i]
-            rr, total_vcpus, instance_memory = results[i+1]
-            te = results[i+2]
+            record = sku_records[instance_types[resource_name]]
 
             self.static_params[vm_name] = {
-                'vm_sku': resource.metadata.labels.get("beta.kubernetes.io/instance-type", ""),
-                'vm_sku_tdp': vm_sku_tdp,
-                'rr': rr,
-                'total_vcpus': total_vcpus,
-                'te': te,
-                'instance_memory': instance_memory
+                'vm_sku': record.vm_sku,
+                'vm_sku_tdp': record.tdp,
+                'rr': record.instance_vcpus,
+                'total_vcpus': record.total_vcpus,
+                'te': record.te,
+                'instance_memory': record.instance_memory
             }
 
-            i += 3
-
         return self.static_params
 
 
@@ -228,24 +206,22 @@ class AKSNode(AzureVM):
     #     return self.static_params
 
 
-    def query_prometheus(self, prometheus_endpoint: str, query: str, timespan: str, interval: str) -> Dict[str, Any]:
-        url = f"{prometheus_endpoint}/api/v1/query"
-        params = {
-            "query": query,
-            "start": f"now()-{timespan}",
-            "end": "now()",
-            "step": interval
-        }
-
-        params = {"query" : query}
-        auth_token = self.get_auth_token()
+    async def query_prometheus(self, prometheus_endpoint: str, query: str, timespan: str, interval: str) -> Dict[str, Any]:
+        if self.time_resolved:
+            # range query : one sample per interval over the timespan
+            url = f"{prometheus_endpoint}/api/v1/query_range"
+            params = range_query_params(query, timespan, interval, now=self.window_end)
+        else:
+            url = f"{prometheus_endpoint}/api/v1/query"
+            params = instant_query_params(query, self.window_end)
+        auth_token = await self.get_auth_token()
         headers = {
             "Accept": "application/json",
             'Authorization': f'Bearer %s' % auth_token,
             'Content-Type' : 'application/x-www-form-urlencoded'
         }
 
-        response = requests.get(url, params=params, headers=headers)
+        response = await get_http_client().get_cached(url, params=params, headers=headers)
 
         if response.status_code != 200:
             raise Exception(f"Failed to query Prometheus: {response.text}")
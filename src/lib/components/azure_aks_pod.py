@@ -6,6 +6,10 @@ from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
 from lib.ief.core import *
 from lib.auth.azure import AzureManagedIdentityAuthParams
 from lib.MetricsExporter.exporter import *
+from lib.components.http_client import get_http_client
+from lib.components.prometheus import instant_query_params, range_query_params, sample_average
+from lib.components.observation_window import time_resolved_observations
+from lib.auth.session import get_auth_session, load_aks_configuration, PROMETHEUS_SCOPE
 
 from kubernetes import client, config
 from kubernetes.config.kube_config import KubeConfigLoader
@@ -31,7 +35,6 @@ class AKSPod(AzureImpactNode):
             self.name = name
             self.resources = []
             self.observations = {}
-            self.credential = DefaultAzureCredential()
             self.resource_selectors = resource_selectors
             self.carbon_intensity_provider = carbon_intensity_provider
             self.metadata = metadata
@@ -42,6 +45,8 @@ class AKSPod(AzureImpactNode):
             cluster_name = self.resource_selectors.get("cluster_name", None)
             nodepool_name = self.resource_selectors.get("nodepool_name", None)
             self.prometheus_endpoint = self.resource_selectors.get("prometheus_endpoint", None)
+            # time-resolved mode : Prometheus range queries, one sample per interval
+            self.time_resolved = time_resolved_observations(resource_selectors)
 
 
         def list_supported_skus(self):
@@ -50,35 +55,27 @@ class AKSPod(AzureImpactNode):
         async def lookup_static_params(self) -> Dict[str, Any]:
             return {}
 
-        def get_auth_token(self):
-            scope = "https://prometheus.monitor.azure.com/.default"
-            token = self.credential.get_token(scope)
-            return token.token
+        async def get_auth_token(self):
+            # cached by the auth session until it expires ; refreshed off the event loop
+            return await get_auth_session().get_token_async(PROMETHEUS_SCOPE)
 
 
         async def query_prometheus(self, prometheus_endpoint: str, query: str,  interval: str, timespan: str) -> Dict[str, Any]:
-            url = f"{prometheus_endpoint}/api/v1/query"
-          
-            #timespan = timespan.lower().replace("pt", "")
-            #interval = self.interval.lower().replace("pt", "")
- 
-          
-            params = {
-                "query": query,
-                "start": f"now()-{timespan}",
-                "end": "now()",
-                "step": interval
-            }
-
-            params = {"query" : query}
-            auth_token = self.get_auth_token()
+            if self.time_resolved:
+                # range query : one sample per interval over the timespan
+                url = f"{prometheus_endpoint}/api/v1/query_range"
+                params = range_query_params(query, timespan, interval, now=self.window_end)
+            else:
+                url = f"{prometheus_endpoint}/api/v1/query"
+                params = instant_query_params(query, self.window_end)
+            auth_token = await self.get_auth_token()
             headers = {
                 "Accept": "application/json",
                 'Authorization': f'Bearer %s' % auth_token,
                 'Content-Type' : 'application/x-www-form-urlencoded'
             }
 
-            response = requests.get(url, params=params, headers=headers)
+            response = await get_http_client().get_cached(url, params=params, headers=headers)
 
             if response.status_code != 200:
                 raise Exception(f"Failed to query Prometheus: {response.text}")
@@ -91,21 +88,13 @@ class AKSPod(AzureImpactNode):
             resource_group_name = self.resource_selectors.get("resource_group", None)
             cluster_name = self.resource_selectors.get("cluster_name", None)
 
-            container_service_client = ContainerServiceClient(self.credential, subscription_id)
-            
-            kubeconfig = container_service_client.managed_clusters.list_cluster_user_credentials(resource_group_name, cluster_name).kubeconfigs[0].value
-
-            kubeconfig_stream = io.BytesIO(kubeconfig)
-            kubeconfig_dict = yaml.safe_load(kubeconfig_stream)
-            
+            # the cluster configuration is cached by the auth session, instead of fetching the kubeconfig from ARM every time
+            cluster_api_client = await get_auth_session().kubernetes_api_client(
+                "%s/%s/%s" % (subscription_id, resource_group_name, cluster_name),
+                lambda: load_aks_configuration(self.credential, subscription_id, resource_group_name, cluster_name)
+            )
 
-            # Load the Kubernetes configuration from the kubeconfig
-            loader = KubeConfigLoader(config_dict=kubeconfig_dict)
-            configuration = client.Configuration()
-            loader.load_and_set(configuration)
-            client.Configuration.set_default(configuration)
-            
-            v1 = client.CoreV1Api()
+            v1 = client.CoreV1Api(cluster_api_client)
             pod_list = []
 
             if "namespace" in self.resource_selectors:
@@ -238,7 +227,7 @@ class AKSPod(AzureImpactNode):
                         pod_name = "non_pod_cpu_usage"
                     else:
                         pod_name = pod['metric']['pod']
-                    cpu_usage = pod['value'][1]
+                    cpu_usage = sample_average(pod)
                     cpu_utilization[pod_name] = float(cpu_usage)
             return cpu_utilization
 
@@ -259,7 +248,7 @@ class AKSPod(AzureImpactNode):
                         pod_name = "non_pod_memory_usage"
                     else:
                         pod_name = pod['metric']['pod']
-                    memory_usage = pod['value'][1]
+                    memory_usage = sample_average(pod)
                     if float(memory_usage) < 0:
                         memory_usage = 0
                     memory_utilization[pod_name] = float(memory_usage)
@@ -290,7 +279,8 @@ class AKSPod(AzureImpactNode):
 
 
         async def calculate(self, carbon_intensity = 100) -> Dict[str, SCIImpactMetricsInterface]:
-            if self.resources == {} or self.resources == None:
+            # the pods are a list
+            if not self.resources:
                 await self.fetch_resources()
             pod_list = self.resources
 
@@ -314,7 +304,9 @@ class AKSPod(AzureImpactNode):
                     "node_name" : node_name,
                     "prometheus_endpoint": self.resource_selectors.get("prometheus_endpoint", None)
                 }
-                node = AKSNode(name = node_name, model = self.inner_model,  carbon_intensity_provider=self.carbon_intensity_provider, auth_object=self.auth_object, resource_selectors=resource_selectors, metadata=self.metadata)
+                node = AKSNode(name = node_name, model = self.inner_model,  carbon_intensity_provider=self.carbon_intensity_provider, auth_object=self.auth_object, resource_selectors=resource_selectors, metadata=self.metadata, interval=self.interval, timespan=self.timespan)
+                # the node impact is calculated over the same window as the pods
+                node.window_end = self.window_end
                 
                 node_models[node_name] = node.inner_model
 
@@ -1,11 +1,16 @@
 from lib.ief.core import ImpactNodeInterface, ImpactModelPluginInterface, CarbonIntensityPluginInterface
-from azure.identity import DefaultAzureCredential
+from lib.auth.session import get_auth_session
+from lib.components.request_cache import credential_identity
 from abc import abstractmethod
 
 class AzureImpactNode(ImpactNodeInterface):
     def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H"):
         super().__init__(name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval, timespan)
-        self.credential = DefaultAzureCredential()
+        self.credential = get_auth_session().credential # process-wide credential
+
+    def credential_identity(self) -> str:
+        # identity of the credential and auth params of the component, for the shared cache and fetch keys
+        return credential_identity(id(self.credential), self.auth_object)
 
     def authenticate(self, auth_params):
         pass
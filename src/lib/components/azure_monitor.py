@@ -0,0 +1,154 @@
+from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import asyncio
+import functools
+import os
+import threading
+
+import requests
+from isoduration import parse_duration
+from azure.mgmt.monitor import MonitorManagementClient
+
+
+# max number of concurrent queries for Azure Monitor ; the thread pool is sized to run all of them at once
+AZURE_MONITOR_CONCURRENCY = int(os.environ.get("AZURE_MONITOR_CONCURRENCY", "5"))
+AZURE_MONITOR_MAX_WORKERS = int(os.environ.get("AZURE_MONITOR_MAX_WORKERS", str(max(AZURE_MONITOR_CONCURRENCY, 32))))
+
+_executor = ThreadPoolExecutor(max_workers=AZURE_MONITOR_MAX_WORKERS, thread_name_prefix="azure-monitor")
+
+_monitor_clients: Dict[str, MonitorManagementClient] = {}
+_monitor_clients_lock = threading.Lock()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking Azure SDK call in the bounded Azure Monitor thread pool, without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def get_monitor_client(credential, subscription_id: str) -> MonitorManagementClient:
+    # one client (and connection pool) per subscription, reused by all the components of the process
+    with _monitor_clients_lock:
+        monitor_client = _monitor_clients.get(subscription_id)
+        if monitor_client is None:
+            monitor_client = MonitorManagementClient(credential, subscription_id)
+            _monitor_clients[subscription_id] = monitor_client
+        return monitor_client
+
+
+# Azure Monitor metrics batch API (metrics:getBatch), see https://learn.microsoft.com/azure/azure-monitor/essentials/migrate-to-batch-api
+# set AZURE_MONITOR_BATCH_ENDPOINT to use another endpoint than the regional one, e.g. the local stub server (azure_monitor_stub.py)
+AZURE_MONITOR_BATCH_ENDPOINT = os.environ.get("AZURE_MONITOR_BATCH_ENDPOINT", None)
+AZURE_MONITOR_BATCH_API_VERSION = "2023-10-01"
+AZURE_MONITOR_BATCH_MAX_RESOURCES = 50 # max number of resource ids per getBatch request
+AZURE_MONITOR_METRICS_SCOPE = "https://metrics.monitor.azure.com/.default"
+
+
+def subscription_from_resource_id(resource_id: str) -> str:
+    # /subscriptions/{subscription_id}/resourceGroups/...
+    parts = resource_id.strip("/").split("/")
+    if len(parts) > 1 and parts[0].lower() == "subscriptions":
+        return parts[1]
+    return None
+
+
+def timespan_bounds(timespan: str, end: datetime = None) -> Tuple[str, str]:
+    # the batch API takes start and end times instead of an ISO 8601 duration
+    end = end or datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - parse_duration(timespan)
+    return start.strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def metric_series_from_sdk(response) -> List[Tuple[str, List[float]]]:
+    # (metric name, datapoint averages) pairs, from a MonitorManagementClient metrics.list response
+    return [
+        (metric.name.localized_value, [data.average for time_series in metric.timeseries for data in time_series.data])
+        for metric in response.value
+    ]
+
+
+def metric_points_from_sdk(response) -> List[Tuple[str, List[Tuple[datetime, float]]]]:
+    # (metric name, (timestamp, average) datapoints) pairs, from a MonitorManagementClient metrics.list response
+    return [
+        (metric.name.localized_value, [(data.time_stamp, data.average) for time_series in metric.timeseries for data in time_series.data])
+        for metric in response.value
+    ]
+
+
+def metric_points_from_batch(resource_values: dict) -> List[Tuple[str, List[Tuple[datetime, float]]]]:
+    # (metric name, (timestamp, average) datapoints) pairs, from one resource entry of a getBatch response
+    return [
+        (metric["name"].get("localizedValue") or metric["name"].get("value"), [(datetime.strptime(data["timeStamp"][:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc), data.get("average")) for time_series in metric.get("timeseries", []) for data in time_series.get("data", [])])
+        for metric in resource_values.get("value", [])
+    ]
+
+
+def metric_series_from_batch(resource_values: dict) -> List[Tuple[str, List[float]]]:
+    # (metric name, datapoint averages) pairs, from one resource entry of a getBatch response
+    return [
+        (metric["name"].get("localizedValue") or metric["name"].get("value"), [data.get("average") for time_series in metric.get("timeseries", []) for data in time_series.get("data", [])])
+        for metric in resource_values.get("value", [])
+    ]
+
+
+class MetricsBatchClient:
+    """
+    Client for the Azure Monitor metrics:getBatch API : fetches the metrics of up to 50 resources of the same subscription,
+    region and namespace per request.
+    """
+
+    def __init__(self, credential, endpoint: str = AZURE_MONITOR_BATCH_ENDPOINT):
+        self.credential = credential
+        self.endpoint = endpoint.rstrip("/") if endpoint else None
+        self.session = requests.Session()
+
+    def endpoint_for(self, region: str) -> str:
+        return self.endpoint or f"https://{region}.metrics.monitor.azure.com"
+
+    def get_batch(self, subscription_id: str, region: str, resource_ids: List[str], metricnamespace: str, metricnames: str, starttime: str, endtime: str, interval: str, aggregation: str = "average", raw_response_hook = None, with_timestamps: bool = False) -> Dict[str, list]:
+        """
+        Runs one getBatch request (blocking).
+
+        :param raw_response_hook: called with the HTTP response, as with the Azure SDK clients, e.g. to read the throttling headers.
+        :param with_timestamps: returns (timestamp, average) datapoints instead of the averages.
+        :return: a dictionary of (metric name, datapoints) pairs, per lower-cased resource id.
+        """
+        endpoint = self.endpoint_for(region)
+        url = f"{endpoint}/subscriptions/{subscription_id}/metrics:getBatch"
+        params = {
+            "starttime": starttime,
+            "endtime": endtime,
+            "interval": interval,
+            "metricnamespace": metricnamespace,
+            "metricnames": metricnames,
+            "aggregation": aggregation,
+            "api-version": AZURE_MONITOR_BATCH_API_VERSION
+        }
+        headers = {"Content-Type": "application/json"}
+        # bearer tokens are never sent over plain http, e.g. to the local stub server
+        if endpoint.startswith("https://"):
+            headers["Authorization"] = "Bearer %s" % self.credential.get_token(AZURE_MONITOR_METRICS_SCOPE).token
+
+        response = self.session.post(url, params=params, headers=headers, json={"resourceids": resource_ids})
+        if raw_response_hook is not None:
+            raw_response_hook(response)
+        if response.status_code != 200:
+            # the response is kept on the error, for the status code and Retry-After header
+            raise requests.HTTPError(f"Failed to query Azure Monitor batch metrics: {response.status_code} {response.text}", response=response)
+
+        metric_series = metric_points_from_batch if with_timestamps else metric_series_from_batch
+        return {resource_values["resourceid"].lower(): metric_series(resource_values) for resource_values in response.json().get("values", [])}
+
+
+_metrics_batch_client = None
+
+
+def get_metrics_batch_client(credential) -> MetricsBatchClient:
+    global _metrics_batch_client
+    with _monitor_clients_lock:
+        if _metrics_batch_client is None:
+            _metrics_batch_client = MetricsBatchClient(credential)
+        return _metrics_batch_client
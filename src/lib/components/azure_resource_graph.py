@@ -0,0 +1,116 @@
+from typing import Dict, List
+import threading
+
+from azure.mgmt.resourcegraph import ResourceGraphClient
+from azure.mgmt.resourcegraph.models import QueryRequest, QueryRequestOptions
+
+from lib.components.azure_throttle import get_rate_limiter
+
+
+RESOURCE_GRAPH_PAGE_SIZE = 1000 # max number of rows per Resource Graph page
+RESOURCE_GRAPH_MAX_SUBSCRIPTIONS = 1000 # max number of subscriptions per Resource Graph query
+
+# one projected query for the VM inventory : VM size, location and tags, with the ids of the GPU extensions of each VM
+VM_INVENTORY_QUERY = """resources
+| where type =~ 'microsoft.compute/virtualmachines'{filters}
+| project id, name, location, resourceGroup, subscriptionId, tags, vmSize = tostring(properties.hardwareProfile.vmSize), vmId = tolower(id)
+| join kind=leftouter (
+    resources
+    | where type =~ 'microsoft.compute/virtualmachines/extensions' and id endswith '/extensions/NVIDIA-GPU-Extension'
+    | project extensionId = id, vmId = tolower(substring(id, 0, indexof(id, '/extensions/')))
+    | summarize gpuExtensionIds = make_list(extensionId) by vmId
+) on vmId
+| project id, name, location, resourceGroup, subscriptionId, tags, vmSize, gpuExtensionIds
+| order by id asc"""
+
+
+def kql_string(value: str) -> str:
+    return "'%s'" % str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+
+class VMRecord:
+    """
+    Compact inventory record of a virtual machine, with the fields used by AzureVM instead of the full VirtualMachine model.
+    """
+    __slots__ = ("id", "name", "type", "location", "resource_group", "subscription_id", "tags", "vm_size", "gpu_extension_ids")
+
+    def __init__(self, id: str, name: str, location: str, resource_group: str, subscription_id: str, tags: Dict[str, str], vm_size: str, gpu_extension_ids: List[str]):
+        self.id = id
+        self.name = name
+        self.type = 'Microsoft.Compute/virtualMachines'
+        self.location = location
+        self.resource_group = resource_group
+        self.subscription_id = subscription_id
+        self.tags = tags or {}
+        self.vm_size = vm_size
+        self.gpu_extension_ids = gpu_extension_ids or []
+
+    @classmethod
+    def from_row(cls, row: Dict[str, object]) -> 'VMRecord':
+        return cls(row["id"], row["name"], row.get("location"), row.get("resourceGroup"), row.get("subscriptionId"), row.get("tags"), row.get("vmSize"), row.get("gpuExtensionIds"))
+
+
+_resource_graph_clients = {}
+_resource_graph_clients_lock = threading.Lock()
+
+
+def get_resource_graph_client(credential) -> ResourceGraphClient:
+    # Resource Graph queries are tenant-wide, one client per credential is enough
+    with _resource_graph_clients_lock:
+        resource_graph_client = _resource_graph_clients.get(id(credential))
+        if resource_graph_client is None:
+            resource_graph_client = ResourceGraphClient(credential)
+            _resource_graph_clients[id(credential)] = resource_graph_client
+        return resource_graph_client
+
+
+def vm_inventory_query(resource_group: str = None, name: str = None, tags: Dict[str, str] = None) -> str:
+    filters = ""
+    if resource_group:
+        filters += "\n| where resourceGroup =~ %s" % kql_string(resource_group)
+    if name:
+        filters += "\n| where name =~ %s" % kql_string(name)
+    for key, value in (tags or {}).items():
+        filters += "\n| where tags[%s] == %s" % (kql_string(key), kql_string(value))
+    return VM_INVENTORY_QUERY.format(filters=filters)
+
+
+async def query_resources(credential, query: str, subscription_ids: List[str]) -> List[Dict[str, object]]:
+    """
+    Runs a Resource Graph query across the given subscriptions, following the skip tokens until the last page.
+
+    :return: the rows of all the pages.
+    """
+    resource_graph_client = get_resource_graph_client(credential)
+    rate_limiter = get_rate_limiter("arm")
+
+    rows = []
+    for i in range(0, len(subscription_ids), RESOURCE_GRAPH_MAX_SUBSCRIPTIONS):
+        subscriptions = subscription_ids[i:i + RESOURCE_GRAPH_MAX_SUBSCRIPTIONS]
+        skip_token = None
+        while True:
+            request = QueryRequest(
+                subscriptions=subscriptions,
+                query=query,
+                options=QueryRequestOptions(skip_token=skip_token, top=RESOURCE_GRAPH_PAGE_SIZE, result_format="objectArray")
+            )
+            response = await rate_limiter.run(resource_graph_client.resources, request, description=f"Resource Graph page for {len(subscriptions)} subscriptions")
+            rows.extend(response.data)
+            skip_token = response.skip_token
+            if not skip_token:
+                break
+    return rows
+
+
+async def fetch_vm_inventory(credential, subscription_ids: List[str], resource_group: str = None, name: str = None, tags: Dict[str, str] = None) -> Dict[str, VMRecord]:
+    """
+    Fetches the virtual machines of many subscriptions with a single projected Resource Graph query.
+
+    :return: a dictionary of VMRecord, per lower-cased resource id (VM names are not unique across resource groups and subscriptions).
+    """
+    rows = await query_resources(credential, vm_inventory_query(resource_group, name, tags), subscription_ids)
+    vms = {}
+    for row in rows:
+        vm = VMRecord.from_row(row)
+        vms[vm.id.lower()] = vm
+    return vms
@@ -0,0 +1,224 @@
+from typing import Dict
+from collections import deque
+import asyncio
+import os
+import random
+import threading
+import time
+
+import requests
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+
+from lib.components.azure_monitor import run_blocking
+
+
+# initial, min and max number of concurrent requests per rate limiter
+AZURE_RATE_LIMIT_INITIAL = int(os.environ.get("AZURE_RATE_LIMIT_INITIAL", "5"))
+AZURE_RATE_LIMIT_MIN = int(os.environ.get("AZURE_RATE_LIMIT_MIN", "1"))
+AZURE_RATE_LIMIT_MAX = int(os.environ.get("AZURE_RATE_LIMIT_MAX", "50"))
+AZURE_RETRY_MAX_DELAY = float(os.environ.get("AZURE_RETRY_MAX_DELAY", "60")) # seconds
+
+RATE_LIMIT_HEADER_PREFIX = "x-ms-ratelimit-remaining-"
+RESOURCE_GRAPH_QUOTA_HEADER = "x-ms-user-quota-remaining"
+THROTTLED_STATUS_CODES = (429, 503)
+RETRIED_STATUS_CODES = (408, 429) # and the 5xx server errors
+TRANSIENT_ERRORS = (ServiceRequestError, ServiceResponseError, requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+
+
+def response_headers(response) -> Dict[str, str]:
+    # headers of an azure-core PipelineResponse, an azure-core HttpResponse or a requests Response
+    response = getattr(response, "http_response", response)
+    headers = getattr(response, "headers", None) or {}
+    return {key.lower(): value for key, value in headers.items()}
+
+
+def remaining_requests(headers: Dict[str, str]) -> int:
+    """
+    Lowest remaining quota announced by the ARM throttling headers, e.g.
+    x-ms-ratelimit-remaining-subscription-reads: 11999, or x-ms-ratelimit-remaining-resource: Microsoft.Compute/GetVM3Min;196,Microsoft.Compute/GetVM30Min;1198
+
+    :return: the lowest remaining count, or None if there is no throttling header.
+    """
+    remaining = None
+    for key, value in headers.items():
+        if not key.startswith(RATE_LIMIT_HEADER_PREFIX) and key != RESOURCE_GRAPH_QUOTA_HEADER:
+            continue
+        for item in str(value).split(","):
+            count = item.split(";")[-1].strip()
+            if count.isdigit():
+                remaining = int(count) if remaining is None else min(remaining, int(count))
+    return remaining
+
+
+def retry_after(headers: Dict[str, str]) -> float:
+    for key in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if key in headers:
+            try:
+                return float(headers[key]) / 1000
+            except ValueError:
+                pass
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return None
+
+
+def is_retryable(error: Exception, status_code: int) -> bool:
+    # throttled requests, server errors, and connection errors and timeouts without a response ; the other errors (e.g. 403, 404) are final
+    if status_code is not None:
+        return status_code in RETRIED_STATUS_CODES or status_code >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class AdaptiveRateLimiter:
+    """
+    Shared concurrency limiter for Azure requests.
+    The concurrency limit grows additively while requests succeed with enough remaining quota, and is cut multiplicatively
+    when ARM announces a low remaining quota or throttles a request (AIMD). Throttled requests pause the whole limiter
+    for the Retry-After duration, and retries use a capped, jittered exponential backoff.
+    """
+
+    def __init__(self, name: str, initial_limit: int = AZURE_RATE_LIMIT_INITIAL, min_limit: int = AZURE_RATE_LIMIT_MIN, max_limit: int = AZURE_RATE_LIMIT_MAX, additive_increase: float = 1.0, multiplicative_decrease: float = 0.5, low_remaining: int = 50, base_delay: float = 1.0, max_delay: float = AZURE_RETRY_MAX_DELAY, max_retries: int = 7):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.low_remaining = low_remaining
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.throttled_count = 0
+        self._waiters = deque()
+        self._lock = threading.Lock() # response hooks run in the Azure Monitor thread pool
+
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self.blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < self.current_limit():
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        free_slots = self.current_limit() - self.in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    def _decrease(self) -> None:
+        # one decrease per second at most, so that a burst of throttled responses counts as a single congestion signal
+        now = time.monotonic()
+        if now - self.last_decrease >= 1.0:
+            self.limit = max(float(self.min_limit), self.limit * self.multiplicative_decrease)
+            self.last_decrease = now
+
+    def on_response(self, response) -> None:
+        # raw_response_hook : adapts the concurrency limit to the remaining quota announced by ARM
+        headers = response_headers(response)
+        remaining = remaining_requests(headers)
+        with self._lock:
+            if remaining is not None and remaining < self.low_remaining:
+                self._decrease()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + self.additive_increase / max(self.limit, 1.0))
+
+    def on_throttled(self, headers: Dict[str, str]) -> float:
+        with self._lock:
+            self.throttled_count += 1
+            self._decrease()
+            wait = retry_after(headers)
+            if wait is not None:
+                wait = min(self.max_delay, wait)
+                self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        return wait
+
+    def backoff(self, attempt: int, wait: float = None) -> float:
+        if wait is not None:
+            # Retry-After is honored, with a small jitter so that the paused requests do not restart all at once
+            return wait + random.uniform(0, min(1.0, self.max_delay - wait) if wait < self.max_delay else 0)
+        # capped exponential backoff, with "equal jitter"
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def run(self, func, *args, description: str = "", capture_headers: bool = True, **kwargs):
+        """
+        Runs a blocking Azure call in the Azure Monitor thread pool, within the concurrency limit, with retries of the
+        throttled requests and transient errors. The other errors, and the last one once the retries are exhausted, are
+        raised as they are.
+
+        :param capture_headers: passes a raw_response_hook to the call, to read the ARM throttling headers.
+        :return: the result of the call.
+        """
+        if capture_headers:
+            kwargs["raw_response_hook"] = self.on_response
+
+        attempt = 0
+        while True:
+            await self.acquire()
+            try:
+                return await run_blocking(func, *args, **kwargs)
+            except Exception as e:
+                error = e
+            finally:
+                self.release()
+
+            response = getattr(error, "response", None)
+            headers = response_headers(response) if response is not None else {}
+            status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+
+            wait = None
+            if status_code in THROTTLED_STATUS_CODES or retry_after(headers) is not None:
+                wait = self.on_throttled(headers)
+                print(f"{self.name} : request throttled ({status_code}), concurrency limit is now {self.current_limit()}")
+            elif not is_retryable(error, status_code):
+                print(f"Error fetching {description}: {error}")
+                raise error
+
+            attempt += 1
+            if attempt >= self.max_retries:
+                print(f"Error fetching {description} after {attempt} attempts: {error}")
+                raise error
+            await asyncio.sleep(self.backoff(attempt, wait))
+
+
+_rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str = "arm") -> AdaptiveRateLimiter:
+    """
+    Process-wide rate limiters, shared by all the Azure-facing components :
+    "arm" for Azure Resource Manager reads, "azure_monitor" for Azure Monitor metrics queries.
+    """
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(name)
+        if rate_limiter is None:
+            rate_limiter = AdaptiveRateLimiter(name)
+            _rate_limiters[name] = rate_limiter
+        return rate_limiter
@@ -1,25 +1,37 @@
 from typing import Dict, List, Tuple
 from lib.ief.core import SCIImpactMetricsInterface
+from lib.ief.impact_frame import ImpactFrame
 from lib.components.azure_base import AzureImpactNode
+from lib.components.sku_catalog import get_sku_catalog
+from lib.components.azure_monitor import get_monitor_client
+from lib.components.azure_throttle import get_rate_limiter
+from lib.components.azure_resource_graph import fetch_vm_inventory
+from lib.components.azure_monitor import get_metrics_batch_client, metric_series_from_sdk, metric_points_from_sdk, subscription_from_resource_id, timespan_bounds, AZURE_MONITOR_BATCH_MAX_RESOURCES
+from lib.components.observation_window import ObservationWindow, incremental_observations, time_resolved_observations
+from lib.components.request_cache import get_request_cache
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.monitor import MonitorManagementClient
 from azure.mgmt.compute.models import VirtualMachine
 
 from azure.mgmt.monitor.models import MetricAggregationType
 
-import csv
-
 import time
 import asyncio
-
-import itertools
+import os
 
 aggregation = MetricAggregationType.AVERAGE #for monitoring queries
 
-semaphore_max = 5 # to avoid throttling ; this is the max number of concurrent queries for Azure Monitor
+# "single" : one Azure Monitor query per VM ; "batch" : VMs are grouped by subscription and region, and queried with the metrics:getBatch API
+observation_mode = os.environ.get("AZURE_MONITOR_OBSERVATION_MODE", "single")
+
+# "compute" : VMs are listed with the compute API, per subscription ; "resource_graph" : one projected Resource Graph query for all the subscriptions
+inventory_backend = os.environ.get("AZURE_VM_INVENTORY_BACKEND", "compute")
 
 
 class AzureVM(AzureImpactNode):
+    # selectors that filter the resources of a subscription, used by the impact planner to share the fetches of overlapping components
+    filter_selectors = ("resource_group", "name", "tags")
+
     def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H"):
         super().__init__(name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval, timespan)
         self.type = "azure.compute.vm"
@@ -27,6 +39,16 @@ class AzureVM(AzureImpactNode):
         self.observations = {}
         self.static_params = {}
         self.aggregation = aggregation
+        self.observation_mode = resource_selectors.get("observation_mode", observation_mode)
+        self.inventory_backend = resource_selectors.get("inventory_backend", inventory_backend)
+        # incremental mode : only the newest interval buckets are fetched, the window is kept in ring buffers
+        self.observation_window = ObservationWindow(timespan, interval) if incremental_observations(resource_selectors) else None
+        # time-resolved mode : the observations keep their per-interval series
+        self.time_resolved = time_resolved_observations(resource_selectors)
+        self.metric_points = {}
+        # process-wide rate limiters, shared with the other Azure components, to avoid throttling
+        self.arm_rate_limiter = get_rate_limiter("arm")
+        self.monitor_rate_limiter = get_rate_limiter("azure_monitor")
 
     def list_supported_skus(self):
         return ["D3V4"]
@@ -37,25 +59,36 @@ class AzureVM(AzureImpactNode):
         resource_group = self.resource_selectors.get("resource_group", None) 
         name = self.resource_selectors.get("name", None) 
         tags = self.resource_selectors.get("tags", None) 
+
+        if self.inventory_backend == "resource_graph":
+            subscription_ids = self.resource_selectors.get("subscription_ids", None) or [subscription_id]
+            self.resources = await fetch_vm_inventory(self.credential, subscription_ids, resource_group=resource_group, name=name, tags=tags)
+            return self.resources
+
         vms = {}
         compute_client = ComputeManagementClient(self.credential, subscription_id)
 
         if name and resource_group:
-            vm = compute_client.virtual_machines.get(resource_group, name)
+            vm = await self.arm_rate_limiter.run(compute_client.virtual_machines.get, resource_group, name, description=f"VM {resource_group}/{name}")
             vms[vm.name] = vm
         elif tags:
             filter_str = " and ".join([f"tagname eq '{k}' and tagvalue eq '{v}'" for k, v in tags.items()])
-            for vm in compute_client.virtual_machines.list_all(filter=filter_str):
+            for vm in await self.arm_rate_limiter.run(self.list_all_vms, compute_client, filter=filter_str, description=f"VMs of subscription {subscription_id}"):
                 vms[vm.name] = vm
         else:
-            for vm in compute_client.virtual_machines.list_all():
+            for vm in await self.arm_rate_limiter.run(self.list_all_vms, compute_client, description=f"VMs of subscription {subscription_id}"):
                 vms[vm.name] = vm
 
         self.resources = vms
         return self.resources
 
 
-    async def fetch_cpu_memory_utilization(self, semaphore, vm_id: str, instance_memory: int, monitor_client: MonitorManagementClient) -> Tuple[float, float]:
+    def list_all_vms(self, compute_client: ComputeManagementClient, **kwargs) -> List[VirtualMachine]:
+        # reads all the pages of the list, so that the whole listing runs (and is retried) as a single blocking call
+        return list(compute_client.virtual_machines.list_all(**kwargs))
+
+
+    async def fetch_cpu_memory_utilization(self, vm_id: str, instance_memory: int, monitor_client: MonitorManagementClient) -> Tuple[float, float]:
         """
         Fetches the average CPU and memory utilization for a virtual machine.
 
@@ -65,43 +98,90 @@ class AzureVM(AzureImpactNode):
         :return: A tuple containing the average CPU utilization and memory utilization in GB.
         """
 
-        # Acquire the semaphore before running the query
-        async with semaphore:
-            retry_count = 0
-            while retry_count < 7:
-                try:
-                    cpu_memory_data = monitor_client.metrics.list(
-                        resource_uri=vm_id,
-                        metricnames="Percentage CPU,Available Memory Bytes",
-                        aggregation=self.aggregation,
-                        interval=self.interval,
-                        timespan=self.timespan
-                    )
-                    break
-                except:
-                    retry_count += 1
-                    await asyncio.sleep(5 ** retry_count)
+        metric_series = await self.fetch_metric_series(monitor_client, vm_id, "Percentage CPU,Available Memory Bytes")
+
+        return self.summarize_cpu_memory(metric_series, instance_memory)
+
+
+    async def fetch_metric_series(self, monitor_client: MonitorManagementClient, resource_uri: str, metricnames: str) -> List[Tuple[str, List[float]]]:
+        """
+        Fetches the datapoints of a resource over the timespan ; in incremental mode, only the newest buckets are fetched,
+        and the datapoints of the whole window are read from the observation window.
+
+        :return: (metric name, datapoint averages) pairs.
+        """
+        if self.observation_window is None and not self.time_resolved:
+            return metric_series_from_sdk(await self.list_metrics(monitor_client, resource_uri, metricnames))
+
+        timespan = "%s/%s" % self.observation_window.fetch_bounds() if self.observation_window is not None else None
+        response = await self.list_metrics(monitor_client, resource_uri, metricnames, timespan=timespan)
+        return self.record_metric_points(resource_uri, metric_points_from_sdk(response))
+
+
+    def record_metric_points(self, resource_uri: str, metric_points) -> List[Tuple[str, List[float]]]:
+        """
+        Stores the timestamped datapoints of a resource : in the observation window in incremental mode, and for the
+        per-interval series of the observations in time-resolved mode.
+
+        :param metric_points: (metric name, (timestamp, average) datapoints) pairs.
+        :return: (metric name, datapoint averages) pairs, over the whole window.
+        """
+        if self.observation_window is not None:
+            for metric_name, points in metric_points:
+                for timestamp, average in points:
+                    self.observation_window.put(resource_uri, metric_name, timestamp, average)
+            metric_points = self.observation_window.points(resource_uri)
+        if self.time_resolved:
+            self.metric_points[resource_uri.lower()] = metric_points
+        return [(metric_name, [average for timestamp, average in points]) for metric_name, points in metric_points]
+
+
+    def cpu_memory_series(self, resource_uri: str, instance_memory: float) -> Dict[str, list]:
+        # per-interval CPU and memory datapoints of a virtual machine, as the "series" observation of the time-resolved mode
+        cpu_utilization = {}
+        consumed_memory_gb = {}
+        for metric_name, points in self.metric_points.get(resource_uri.lower(), []):
+            for timestamp, average in points:
+                if average is None:
                     continue
+                if metric_name == 'Percentage CPU':
+                    cpu_utilization[timestamp] = average
+                elif metric_name in ['Available Memory Bytes', 'Available Memory Bytes (Preview)']:
+                    consumed_memory_gb[timestamp] = instance_memory - (average / 1024 ** 3)
+
+        timestamps = sorted(set(cpu_utilization) | set(consumed_memory_gb))
+        return {
+            'timestamps': [timestamp.timestamp() for timestamp in timestamps],
+            'average_cpu_percentage': [cpu_utilization.get(timestamp) for timestamp in timestamps],
+            'memory_gb': [consumed_memory_gb.get(timestamp) for timestamp in timestamps]
+        }
 
+
+    def summarize_cpu_memory(self, metric_series, instance_memory: float) -> Tuple[float, float]:
+        """
+        Averages the CPU and memory datapoints of a virtual machine over the timespan.
+
+        :param metric_series: (metric name, datapoint averages) pairs.
+        :param instance_memory: The amount of memory allocated to the virtual machine in GB.
+        :return: A tuple containing the average CPU utilization and memory utilization in GB.
+        """
         total_cpu_utilization = 0
         data_points = 0
 
         total_memory_allocated = instance_memory
 
         average_consumed_memory_gb_items = []
-        for metric in cpu_memory_data.value:
-            if metric.name.localized_value == 'Percentage CPU':
-                for time_series in metric.timeseries:
-                    for data in time_series.data:
-                        if data.average is not None:
-                            total_cpu_utilization += data.average
-                            data_points += 1
-            elif metric.name.localized_value in ['Available Memory Bytes', 'Available Memory Bytes (Preview)']:
-                for time_series in metric.timeseries:
-                    for data in time_series.data:
-                        if data.average is not None:
-                            datapoint_average_consumed_memory_gb = total_memory_allocated - (data.average / 1024 ** 3)
-                            average_consumed_memory_gb_items.append(datapoint_average_consumed_memory_gb)
+        for metric_name, averages in metric_series:
+            if metric_name == 'Percentage CPU':
+                for average in averages:
+                    if average is not None:
+                        total_cpu_utilization += average
+                        data_points += 1
+            elif metric_name in ['Available Memory Bytes', 'Available Memory Bytes (Preview)']:
+                for average in averages:
+                    if average is not None:
+                        datapoint_average_consumed_memory_gb = total_memory_allocated - (average / 1024 ** 3)
+                        average_consumed_memory_gb_items.append(datapoint_average_consumed_memory_gb)
 
         average_cpu_utilization = total_cpu_utilization / data_points if data_points > 0 else 0
         cpu_utilization = average_cpu_utilization
@@ -112,6 +192,30 @@ class AzureVM(AzureImpactNode):
         return cpu_utilization, memory_utilization
 
 
+    async def list_metrics(self, monitor_client: MonitorManagementClient, resource_uri: str, metricnames: str, timespan: str = None):
+        """
+        Runs an Azure Monitor metrics query in the Azure Monitor thread pool, so that the queries of several resources run concurrently.
+        The number of concurrent queries and the retries are handled by the shared Azure Monitor rate limiter.
+
+        Identical queries of the impact nodes of the process share the request cache.
+
+        :return: the metrics.list response.
+        """
+        if timespan is None:
+            # a past window is queried by its start and end times
+            timespan = "%s/%s" % timespan_bounds(self.timespan, self.window_end) if self.window_end is not None else self.timespan
+        key = "azure_monitor:%s|%s|%s|%s|%s|%s" % (resource_uri.lower(), metricnames, getattr(self.aggregation, "value", self.aggregation), self.interval, timespan, self.credential_identity())
+        return await get_request_cache().get_or_fetch(key, lambda: self.monitor_rate_limiter.run(
+            monitor_client.metrics.list,
+            resource_uri=resource_uri,
+            metricnames=metricnames,
+            aggregation=self.aggregation,
+            interval=self.interval,
+            timespan=timespan,
+            description=f"metrics {metricnames} for {resource_uri}"
+        ))
+
+
     async def fetch_gpu_utilization(self, resource: object, monitor_client: MonitorManagementClient) -> float:
         """
         Fetches the average GPU utilization for a virtual machine.
@@ -121,47 +225,62 @@ class AzureVM(AzureImpactNode):
         :return: The average GPU utilization.
         """
         gpu_utilization = 0
-        if resource.resources is not None:
-            for extension in resource.resources:
-                if extension.type == 'Microsoft.Compute/virtualMachines/extensions' and extension.name == 'NVIDIA-GPU-Extension':
-                    gpu_data = monitor_client.metrics.list(
-                        resource_uri=extension.id,
-                        metricnames='GPU Utilization',
-                        aggregation=self.aggregation,
-                        interval=self.interval,
-                        timespan=self.timespan
-                    )
-
-                    if gpu_data.value:
-                        total_gpu_utilization = 0
-                        data_points = 0
-                        for metric in gpu_data.value:
-                            for time_series in metric.timeseries:
-                                for data in time_series.data:
-                                    if data.average is not None:
-                                        total_gpu_utilization += data.average
-                                        data_points += 1
-
-                        average_gpu_utilization = total_gpu_utilization / data_points if data_points > 0 else 0
-                        gpu_utilization = average_gpu_utilization
+        for extension_id in self.gpu_extension_ids(resource):
+            metric_series = await self.fetch_metric_series(monitor_client, extension_id, 'GPU Utilization')
+
+            if metric_series:
+                gpu_utilization = self.summarize_gpu(metric_series)
 
         return gpu_utilization
 
 
+    def summarize_gpu(self, metric_series) -> float:
+        # average GPU utilization over the timespan, from (metric name, datapoint averages) pairs
+        total_gpu_utilization = 0
+        data_points = 0
+        for metric_name, averages in metric_series:
+            for average in averages:
+                if average is not None:
+                    total_gpu_utilization += average
+                    data_points += 1
+
+        return total_gpu_utilization / data_points if data_points > 0 else 0
+
+
+    def gpu_extension_ids(self, resource: object) -> List[str]:
+        # Resource Graph inventory records already carry the ids of the GPU extensions
+        if hasattr(resource, 'gpu_extension_ids'):
+            return resource.gpu_extension_ids
+        if resource.resources is None:
+            return []
+        return [extension.id for extension in resource.resources if extension.type == 'Microsoft.Compute/virtualMachines/extensions' and extension.name == 'NVIDIA-GPU-Extension']
+
+
     async def fetch_observations(self) -> Dict[str, object]:
         """
         Fetches a dictionary of metric observations from Azure Monitor.
 
         :return: A dictionary containing metric observations.
         """
-        subscription_id = self.resource_selectors.get("subscription_id", None)
-        monitor_client = MonitorManagementClient(self.credential, subscription_id)
-
         if self.resources == {} or self.resources == None: await self.fetch_resources()
         if self.static_params == {} or self.static_params == None: await self.lookup_static_params()
 
-        # Create a semaphore with an initial value of 3
-        semaphore = asyncio.Semaphore(semaphore_max) # to avoid throttling ; this is the max number of concurrent queries for Azure Monitor
+        if self.observation_window is not None:
+            self.observation_window.fetch_range()
+
+        if self.observation_mode == "batch":
+            observations = await self.fetch_observations_batch()
+        else:
+            observations = await self.fetch_observations_single()
+
+        if self.observation_window is not None:
+            self.observation_window.advance()
+        return observations
+
+
+    async def fetch_observations_single(self) -> Dict[str, object]:
+        # one Azure Monitor query per VM
+        subscription_id = self.resource_selectors.get("subscription_id", None)
 
         tasks = []
         resource_names = []
@@ -170,8 +289,10 @@ class AzureVM(AzureImpactNode):
                 vm_id = resource.id
                 vm_name = resource.name
                 instance_memory = self.static_params[resource_name]['instance_memory']
+                # the inventory may span several subscriptions
+                monitor_client = get_monitor_client(self.credential, subscription_from_resource_id(vm_id) or subscription_id)
 
-                task = asyncio.create_task(self.fetch_cpu_memory_utilization(semaphore, vm_id, instance_memory, monitor_client))
+                task = asyncio.create_task(self.fetch_cpu_memory_utilization(vm_id, instance_memory, monitor_client))
                 tasks.append(task)
 
                 task = asyncio.create_task(self.fetch_gpu_utilization(resource, monitor_client))
@@ -191,12 +312,100 @@ class AzureVM(AzureImpactNode):
                 'memory_gb': memory_utilization,
                 'average_gpu_percentage': gpu_utilization
             }
+            if self.time_resolved:
+                self.observations[resource_name]['series'] = self.cpu_memory_series(self.resources[resource_name].id, self.static_params[resource_name]['instance_memory'])
+
+        return self.observations
+
+
+    async def fetch_batch_metrics(self, resource_ids: Dict[Tuple[str, str], List[str]], metricnamespace: str, metricnames: str) -> Dict[str, list]:
+        """
+        Fetches the metrics of many resources with the Azure Monitor metrics:getBatch API.
+
+        :param resource_ids: resource ids, grouped by (subscription id, region).
+        :return: a dictionary of (metric name, datapoint averages) pairs, per lower-cased resource id.
+        """
+        batch_client = get_metrics_batch_client(self.credential)
+        incremental = self.observation_window is not None
+        with_timestamps = incremental or self.time_resolved
+        starttime, endtime = self.observation_window.fetch_bounds() if incremental else timespan_bounds(self.timespan, self.window_end)
+
+        aggregation = str(getattr(self.aggregation, "value", self.aggregation)).lower()
+        tasks = []
+        for (subscription_id, region), ids in resource_ids.items():
+            for i in range(0, len(ids), AZURE_MONITOR_BATCH_MAX_RESOURCES):
+                chunk = ids[i:i + AZURE_MONITOR_BATCH_MAX_RESOURCES]
+                key = "azure_monitor_batch:%s|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s" % (subscription_id, region, ",".join(sorted(chunk)), metricnamespace, metricnames, starttime, endtime, self.interval, aggregation, with_timestamps, self.credential_identity())
+                tasks.append(asyncio.create_task(get_request_cache().get_or_fetch(key, lambda chunk=chunk, subscription_id=subscription_id, region=region: self.monitor_rate_limiter.run(
+                    batch_client.get_batch,
+                    subscription_id, region, chunk, metricnamespace, metricnames, starttime, endtime, self.interval, aggregation,
+                    with_timestamps=with_timestamps,
+                    description=f"batch metrics {metricnames} for {len(chunk)} resources in {subscription_id}/{region}"
+                ))))
+
+        metrics = {}
+        for result in await asyncio.gather(*tasks):
+            metrics.update(result)
+
+        if with_timestamps:
+            # the window of each resource is read from the observation window, as for the single queries
+            return {resource_id: self.record_metric_points(resource_id, metric_points) for resource_id, metric_points in metrics.items()}
+        return metrics
+
+
+    async def fetch_observations_batch(self) -> Dict[str, object]:
+        """
+        Fetches the same observations as fetch_observations, grouping the VMs by subscription and region,
+        and fetching up to 50 VMs per Azure Monitor request.
+
+        :return: A dictionary containing metric observations.
+        """
+        default_subscription_id = self.resource_selectors.get("subscription_id", None)
+
+        if self.resources == {} or self.resources == None: await self.fetch_resources()
+        if self.static_params == {} or self.static_params == None: await self.lookup_static_params()
+
+        vm_ids = {}
+        extension_ids = {}
+        vms = {resource_name: resource for resource_name, resource in self.resources.items() if resource.type == 'Microsoft.Compute/virtualMachines'}
+        for resource_name, resource in vms.items():
+            group = (subscription_from_resource_id(resource.id) or default_subscription_id, resource.location)
+            vm_ids.setdefault(group, []).append(resource.id)
+            for extension_id in self.gpu_extension_ids(resource):
+                extension_ids.setdefault(group, []).append(extension_id)
+
+        cpu_memory_metrics, gpu_metrics = await asyncio.gather(
+            self.fetch_batch_metrics(vm_ids, "Microsoft.Compute/virtualMachines", "Percentage CPU,Available Memory Bytes"),
+            self.fetch_batch_metrics(extension_ids, "Microsoft.Compute/virtualMachines/extensions", "GPU Utilization")
+        )
+
+        for resource_name, resource in vms.items():
+            instance_memory = self.static_params[resource_name]['instance_memory']
+            cpu_utilization, memory_utilization = self.summarize_cpu_memory(cpu_memory_metrics.get(resource.id.lower(), []), instance_memory)
+
+            gpu_utilization = 0
+            for extension_id in self.gpu_extension_ids(resource):
+                if gpu_metrics.get(extension_id.lower()):
+                    gpu_utilization = self.summarize_gpu(gpu_metrics[extension_id.lower()])
+
+            self.observations[resource_name] = {
+                'average_cpu_percentage': cpu_utilization,
+                'memory_gb': memory_utilization,
+                'average_gpu_percentage': gpu_utilization
+            }
+            if self.time_resolved:
+                self.observations[resource_name]['series'] = self.cpu_memory_series(self.resources[resource_name].id, self.static_params[resource_name]['instance_memory'])
 
         return self.observations
 
  
 
     async def calculate(self, carbon_intensity = 100) -> dict[str : SCIImpactMetricsInterface]:
+        frame = await self.calculate_frame(carbon_intensity=carbon_intensity)
+        return frame.to_metrics()
+
+
+    async def calculate_frame(self, carbon_intensity = 100) -> ImpactFrame:
         # if self.resources == {}: call fetch_resources
         if self.resources == {} or self.resources == None:
             await self.fetch_resources()
@@ -207,89 +416,50 @@ class AzureVM(AzureImpactNode):
         #always get updated observations
         await self.fetch_observations()
 
-        return await self.inner_model.calculate(observations=self.observations, carbon_intensity=self.carbon_intensity_provider, timespan=self.timespan, interval= self.interval, metadata=self.metadata, static_params=self.static_params)
+        return await self.inner_model.calculate_frame(observations=self.observations, carbon_intensity=self.carbon_intensity_provider, timespan=self.timespan, interval= self.interval, metadata=self.metadata, static_params=self.static_params)
 
 
     async def get_vm_sku_tdp(self, vm_sku: str) -> int:
-        # Get TDP for the VM sku, from the static data file
-        vm_sku_tdp = 180  # default value for unknown VM SKUs
-        with open('lib/static_data/azure_vm_tdp.csv', 'r') as f:
-            for line in f:
-                if vm_sku in line:
-                    vm_sku_tdp = line.split(',')[1]
-                    break
-        return vm_sku_tdp
+        # Get TDP for the VM sku, from the static data catalog
+        return get_sku_catalog().tdp(vm_sku)
 
 
     async def get_vm_resources(self, vm_sku: str) -> Tuple[int, float, float]:
-        # Get RR, TR and instance memory for the VM sku, from the static data file
-        rr = 2  # vCPUs
-        total_vcpus = 16
-        instance_memory = 0.0
-        with open('lib/static_data/ccf_azure_instances.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            vm_sku_short = ''.join(vm_sku.split('_')[1:])
-            for row in reader:
-                if row['Virtual Machine'].replace(" ", "").lower() == vm_sku_short.replace(" ", "").lower():
-                    rr = int(row['Instance vCPUs'])
-                    total_vcpus = float(row['Platform vCPUs (highest vCPU possible)'])
-                    instance_memory = float(row['Instance Memory'])
-                    break
-        return rr, total_vcpus, instance_memory
+        # Get RR, TR and instance memory for the VM sku, from the static data catalog
+        return get_sku_catalog().resources(vm_sku)
 
 
     async def get_vm_te(self, vm_sku: str) -> float:
-        # Get TE for the VM sku, from the static data file
-        te = 1200
-        with open('lib/static_data/ccf_coefficients-azure-embodied.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            vm_sku_short = vm_sku.split('_')[1]
-            for row in reader:
-                if row['type'].replace(" ", "").lower() == vm_sku_short.replace(" ", "").lower():
-                    te = float(row['total'])
-                    break
-        return te
+        # Get TE for the VM sku, from the static data catalog
+        return get_sku_catalog().te(vm_sku)
 
 
-    async def lookup_static_params(self) -> Dict[str, object]:
+    def vm_size(self, resource: object) -> str:
+        # VirtualMachine model, or compact VMRecord of the Resource Graph inventory
+        if hasattr(resource, 'vm_size'):
+            return resource.vm_size
+        return resource.hardware_profile.vm_size
 
-        if self.resources == {} or self.resources == None: await self.fetch_resources()
 
-        # Create a list of coroutines to run concurrently using a list comprehension
-        coroutines = [
-            (
-                self.get_vm_sku_tdp(resource.hardware_profile.vm_size),
-                self.get_vm_resources(resource.hardware_profile.vm_size),
-                self.get_vm_te(resource.hardware_profile.vm_size)
-            )
-            for resource_name, resource in self.resources.items()
-            if resource.type == 'Microsoft.Compute/virtualMachines'
-        ]
-
-        # Run the coroutines concurrently using asyncio.gather
-        results = await asyncio.gather(*[coro for coro in itertools.chain(*coroutines)])
-
-        # Process the results and update the static_params dictionary
-        i = 0
-        for resource_name, resource in self.resources.items():
-            if resource.type == 'Microsoft.Compute/virtualMachines':
-                vm_name = resource.name
-                vm_sku_tdp = results[i]
-                instance_vcpus, total_vcpus, instance_memory = results[i+1]
-                te = results[i+2]
+    async def lookup_static_params(self) -> Dict[str, object]:
 
-                self.static_params[vm_name] = {
-                    'vm_sku': resource.hardware_profile.vm_size,
-                    'vm_sku_tdp': vm_sku_tdp,
-                    'instance_vcpus': instance_vcpus,
-                    'total_vcpus': total_vcpus,
-                    'te': te,
-                    'instance_memory': instance_memory
-                }
+        if self.resources == {} or self.resources == None: await self.fetch_resources()
 
-                i += 3
+        # keyed as the resources : per VM name, or per lower-cased resource id for the Resource Graph inventory
+        vms = {resource_name: resource for resource_name, resource in self.resources.items() if resource.type == 'Microsoft.Compute/virtualMachines'}
+
+        # one batch lookup in the SKU catalog, for all the distinct VM sizes
+        sku_records = get_sku_catalog().lookup_many(self.vm_size(resource) for resource in vms.values())
+
+        for resource_name, resource in vms.items():
+            record = sku_records[self.vm_size(resource)]
+            self.static_params[resource_name] = {
+                'vm_sku': record.vm_sku,
+                'vm_sku_tdp': record.tdp,
+                'instance_vcpus': record.instance_vcpus,
+                'total_vcpus': record.total_vcpus,
+                'te': record.te,
+                'instance_memory': record.instance_memory
+            }
 
         return self.static_params
-
-
-
@@ -0,0 +1,97 @@
+from typing import Dict
+import asyncio
+import json
+import os
+import weakref
+
+import aiohttp
+
+from lib.components.request_cache import credential_identity, get_request_cache, normalize_url
+
+
+HTTP_CLIENT_TIMEOUT = float(os.environ.get("HTTP_CLIENT_TIMEOUT", "60")) # seconds, for the whole request
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CLIENT_CONNECT_TIMEOUT", "10")) # seconds
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST", "10")) # e.g. concurrent queries to the opencost API
+HTTP_CLIENT_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_CLIENT_KEEPALIVE_TIMEOUT", "60")) # seconds
+
+
+class HttpResponse:
+    """
+    Response of the async HTTP client, read in full ; same attributes as a requests Response (status_code, headers, text, json()).
+    """
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes, encoding: str = None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncHttpClient:
+    """
+    Shared async HTTP client for the opencost and Prometheus APIs : keep-alive connection pool, with a per-host limit
+    of concurrent connections, timeouts and gzip responses.
+    aiohttp sessions are bound to an event loop, so there is one session (and connection pool) per running loop.
+    """
+
+    def __init__(self, timeout: float = HTTP_CLIENT_TIMEOUT, connect_timeout: float = HTTP_CLIENT_CONNECT_TIMEOUT, max_connections: int = HTTP_CLIENT_MAX_CONNECTIONS, max_connections_per_host: int = HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST, keepalive_timeout: float = HTTP_CLIENT_KEEPALIVE_TIMEOUT):
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host, keepalive_timeout=self.keepalive_timeout, ttl_dns_cache=300)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers={"Accept-Encoding": "gzip, deflate"})
+            self._sessions[loop] = session
+        return session
+
+    async def get(self, url: str, params: Dict[str, str] = None, headers: Dict[str, str] = None) -> HttpResponse:
+        async with self.session().get(url, params=params, headers=headers) as response:
+            content = await response.read()
+            return HttpResponse(str(response.url), response.status, dict(response.headers), content, response.charset)
+
+    async def get_cached(self, url: str, params: Dict[str, str] = None, headers: Dict[str, str] = None, ttl: float = None) -> HttpResponse:
+        """
+        GET through the process-wide request cache : identical queries (same normalized url and parameters, e.g. the same
+        opencost window or Prometheus query) share one in-flight request, and successful responses are reused until the TTL.
+        The key includes a hash of the Authorization header, so that a response is only shared by callers with the same token.
+        """
+        authorization = next((value for name, value in (headers or {}).items() if name.lower() == "authorization"), None)
+        key = "%s|%s" % (normalize_url(url, params), credential_identity(authorization))
+        return await get_request_cache().get_or_fetch(key, lambda: self.get(url, params=params, headers=headers), ttl=ttl, cacheable=lambda response: response.status_code == 200)
+
+    async def post(self, url: str, data=None, params: Dict[str, str] = None, headers: Dict[str, str] = None) -> HttpResponse:
+        async with self.session().post(url, data=data, params=params, headers=headers) as response:
+            content = await response.read()
+            return HttpResponse(str(response.url), response.status, dict(response.headers), content, response.charset)
+
+    async def close(self) -> None:
+        # closes the session of the running loop
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+_http_client = None
+
+
+def get_http_client() -> AsyncHttpClient:
+    # process-wide client, shared by the opencost and Prometheus fetchers
+    global _http_client
+    if _http_client is None:
+        _http_client = AsyncHttpClient()
+    return _http_client
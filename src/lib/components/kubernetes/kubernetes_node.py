@@ -1,7 +1,17 @@
 import requests
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Tuple
 from lib.ief.core import *
+from lib.ief.impact_frame import ImpactFrame
 from lib.MetricsExporter.exporter import *
+from lib.components.sku_catalog import get_sku_catalog
+from lib.components.http_client import get_http_client
+from lib.components.prometheus import range_query_params
+from lib.components.kubernetes.watch_cache import ResourceWatchCache, get_watch_cache
+from lib.components.azure_monitor import run_blocking
+from lib.auth.session import get_auth_session, load_aks_configuration
+from lib.components.observation_window import ObservationWindow, incremental_observations, time_resolved_observations
+from lib.MetricsExporter.sharding import shard_resources
+from lib.components.kubernetes.opencost import allocation_bucket_start, merge_allocation_buckets, group_allocation_buckets, allocation_series
 
 
 from kubernetes import client, config
@@ -31,9 +41,10 @@ OPENCOST_API_URL = os.environ.get("OPENCOST_API_URL", "http://localhost:9003").r
 
 class KubernetesNode(ImpactNodeInterface):
 
-    exporter = AKSNodeExporter({})
+    exporter = get_exporter(AKSNodeExporter)
+    shard_key = "name" # sharded exporter : the nodes are split between the shards by name (see lib.MetricsExporter.sharding)
 
-    def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H", params={}):
+    def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H", params={}, node_snapshot=None):
         super().__init__(name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval, timespan, params)
         self.type = "kubernetes.node"
         self.resources = {}
@@ -43,7 +54,15 @@ class KubernetesNode(ImpactNodeInterface):
         self.metadata = metadata
         self.properties = {}
         self.prometheus_url = params.get("prometheus_server_endpoint", None)
-        self.credential = DefaultAzureCredential()
+        self.credential = get_auth_session().credential # process-wide credential
+        self.api_client = None
+        self.node_snapshot = node_snapshot # shared KubernetesNodeSnapshot ; when set, nodes are read from it instead of being fetched
+        self.watch_caches = {}
+        # incremental mode : only the newest interval steps are fetched, the window is kept in ring buffers
+        self.observation_window = ObservationWindow(timespan, interval) if incremental_observations(resource_selectors) else None
+        # time-resolved mode : the observations keep their per-interval series
+        self.time_resolved = time_resolved_observations(resource_selectors)
+        self.allocation_buckets = {}
 
 
     #     self.validate_configuration()
@@ -64,111 +83,85 @@ class KubernetesNode(ImpactNodeInterface):
     #     return resource_uri
 
 
-    async def azure_authenticate(self, auth_params: Dict[str, object] = {}) -> None:
+    def cluster_key(self) -> str:
+        return "%s/%s/%s" % (self.resource_selectors.get("subscription_id", None), self.resource_selectors.get("resource_group", None), self.resource_selectors.get("cluster_name", None))
+
+
+    async def azure_authenticate(self, auth_params: Dict[str, object] = {}) -> client.Configuration:
         subscription_id = self.resource_selectors.get("subscription_id", None)
         resource_group_name = self.resource_selectors.get("resource_group", None)
         cluster_name = self.resource_selectors.get("cluster_name", None)
-        container_service_client = ContainerServiceClient(self.credential, subscription_id)
-        
-        kubeconfig = container_service_client.managed_clusters.list_cluster_user_credentials(resource_group_name, cluster_name).kubeconfigs[0].value
-
-        kubeconfig_stream = io.BytesIO(kubeconfig)
-        kubeconfig_dict = yaml.safe_load(kubeconfig_stream)
-        
-
-        # Get the name of the current context and cluster from the kubeconfig dict
-        #current_context = kubeconfig_dict["current-context"]
-        #current_cluster = kubeconfig_dict["contexts"][0]["context"]["cluster"]
 
-
-        # Load the Kubernetes configuration from the kubeconfig
-        loader = KubeConfigLoader(config_dict=kubeconfig_dict)
-        configuration = client.Configuration()
-        loader.load_and_set(configuration)
-        client.Configuration.set_default(configuration)
+        configuration = await load_aks_configuration(self.credential, subscription_id, resource_group_name, cluster_name)
         print("Kubernetes azure auth configuration set successfully.")
+        return configuration
 
 
-    async def kubelogin_azure_authenticate(self):
+    async def kubelogin_azure_authenticate(self) -> client.Configuration:
 
         subscription_id = self.resource_selectors.get("subscription_id", None)
         resource_group_name = self.resource_selectors.get("resource_group", None)
         cluster_name = self.resource_selectors.get("cluster_name", None)
         # Authenticate with Azure and get the kubeconfig for the cluster
-
-        
-        TENANT_ID = os.environ.get("AZURE_TENANT_ID", None)
-        CLIENT_ID = os.environ.get("AZURE_CLIENT_ID", None)
-        CLIENT_SECRET = os.environ.get("AZURE_CLIENT_SECRET", None)
-        #check that the credentials are not None, otherwise use the default credential and send a warning message
-        try:
-            print("using default Azure credential")
-            credential = DefaultAzureCredential()
-        except Exception as e:
-            print(f"Error loading DefaultAzureCredential: {e}")
-            print("using service principal credential")
-            credential = ClientSecretCredential(TENANT_ID, CLIENT_ID, CLIENT_SECRET)
-
-        container_service_client = ContainerServiceClient(credential, subscription_id)
-
-        kubeconfig = container_service_client.managed_clusters.list_cluster_user_credentials(resource_group_name, cluster_name).kubeconfigs[0].value
-
-        # Load the kubeconfig into a dictionary
-        kubeconfig_stream = io.BytesIO(kubeconfig)
-        kubeconfig_dict = yaml.safe_load(kubeconfig_stream)
-
-
-        # Load the Kubernetes configuration from the updated kubeconfig
-        loader = KubeConfigLoader(config_dict=kubeconfig_dict)
-        configuration = client.Configuration()
-        loader.load_and_set(configuration)
-        client.Configuration.set_default(configuration)
+        # the credential of the auth session falls back to the service principal (AZURE_TENANT_ID, AZURE_CLIENT_ID, AZURE_CLIENT_SECRET)
+        configuration = await load_aks_configuration(get_auth_session().credential, subscription_id, resource_group_name, cluster_name)
         
         # Update the kubeconfig to use the service principal for authentication
         #subprocess.run(["kubelogin", "convert-kubeconfig", "-l", "spn", "--client-id", spn_client_id, "--client-secret", spn_client_secret])
-        subprocess.run(["kubelogin", "convert-kubeconfig", "-l", "spn"])
+        await run_blocking(subprocess.run, ["kubelogin", "convert-kubeconfig", "-l", "spn"])
 
         print("authentication successful using kubelogin_azure_authenticate")
+        return configuration
 
 
-    async def kub_authenticate(self, auth_params: Dict[str, object] = {}) -> None:
+    async def kub_authenticate(self, auth_params: Dict[str, object] = {}) -> client.Configuration:
         # Load the Kubernetes configuration from the default location
+        configuration = client.Configuration()
         try:
-            config.load_kube_config()
+            config.load_kube_config(client_configuration=configuration)
         except Exception as e:
             raise Exception(f"Error loading Kubernetes configuration: {e}")
         print("Kubernetes configuration loaded successfully.")
+        return configuration
 
-    async def authenticate(self, auth_params: Dict[str, object] = {}) -> None:
+    async def load_kubernetes_configuration(self) -> client.Configuration:
         try:
-            await self.kub_authenticate()
+            return await self.kub_authenticate()
         except Exception as e:
             print(f"Error authenticating to Kubernetes cluster: {e}")
             print("Trying to authenticate to Azure instead...")
             try:    
-                await self.kubelogin_azure_authenticate()
+                return await self.kubelogin_azure_authenticate()
             except Exception as e:
                 raise Exception(f"Error authenticating to Azure cluster: {e}")
+
+    async def authenticate(self, auth_params: Dict[str, object] = {}) -> None:
+        # the cluster configuration and ApiClient are cached by the process-wide auth session, and refreshed before they expire
+        self.api_client = await get_auth_session().kubernetes_api_client(self.cluster_key(), self.load_kubernetes_configuration)
         print("Kubernetes authentication successful.")
 
-    async def fetch_resources(self) -> Dict[str, Any]:
-        await self.authenticate()
-        
-        # Create a Kubernetes API client for the CoreV1Api
-        api_client = client.CoreV1Api()
+    async def get_watch_cache(self, kind: str) -> ResourceWatchCache:
+        # the cluster is authenticated once, when the shared watch cache is first used ; it is then kept up to date by the watch
+        if kind not in self.watch_caches:
+            await self.authenticate()
+            self.watch_caches[kind] = get_watch_cache(kind, self.cluster_key())
+        watch_cache = self.watch_caches[kind]
+        await watch_cache.wait_synced()
+        return watch_cache
 
-        # Create a Kubernetes API client for the CoreV1Api
-        #api_client = client.CoreV1Api()
+    async def fetch_resources(self) -> Dict[str, Any]:
+        # nodes are read from the local watch cache, instead of listing them from the API server every cycle
+        nodes_cache = await self.get_watch_cache("nodes")
 
-        # Query the Kubernetes API server for the list of nodes in the cluster
+        # Filter the nodes of the cluster with the selectors
         if "nodepool_name" in self.resource_selectors:
             nodepool_name = self.resource_selectors["nodepool_name"]
-            nodes = api_client.list_node(label_selector=f"nodepool.kubernetes.io/name={nodepool_name}").items
+            nodes = nodes_cache.list(label_selector=f"nodepool.kubernetes.io/name={nodepool_name}")
         elif "node_name" in self.resource_selectors:
             node_name = self.resource_selectors["node_name"]
-            nodes = api_client.list_node(label_selector=f"kubernetes.io/hostname={node_name}").items
+            nodes = nodes_cache.list(label_selector=f"kubernetes.io/hostname={node_name}")
         else:
-            nodes = api_client.list_node().items
+            nodes = nodes_cache.list()
 
         # Get the names and metadata of all nodes in the cluster
         node_resources = {}
@@ -176,6 +169,8 @@ class KubernetesNode(ImpactNodeInterface):
             node_name = node.metadata.name
             node_resources[node_name] = node
 
+        # sharded exporter : only the nodes of the shard
+        node_resources = shard_resources(node_resources, self.resource_selectors)
         self.resources = node_resources
         return node_resources
     
@@ -213,62 +208,100 @@ class KubernetesNode(ImpactNodeInterface):
         return node_properties
 
 
-    #fetch CPU, RAM & GPU usage metrics from opencost API
-    async def fetch_observations(self) -> Dict[str, object]:
-        if not self.resources or self.resources == {}:
-            await self.fetch_resources()
+    async def fetch_allocations(self, aggregate: str = None) -> Dict[str, dict]:
+        """
+        Fetches the opencost allocations of the timespan ; in incremental mode, only the newest interval steps are fetched,
+        and the allocations of the whole window are accumulated from the observation window.
 
-        
+        In time-resolved mode, the allocations of each step are also kept in allocation_buckets.
+
+        :param aggregate: opencost aggregation, e.g. "node" ; by default, one allocation per container.
+        :return: a dictionary of allocations, per allocation key.
+        """
         timespan = self.timespan.lower().replace("pt", "")
         interval = self.interval.lower().replace("pt", "")
 
-        url = "%s/allocation/compute?window=%s&resolution=%s&aggregate=node" % (OPENCOST_API_URL, timespan, interval)
+        if self.observation_window is None and not self.time_resolved:
+            url = "%s/allocation/compute?window=%s&resolution=%s" % (OPENCOST_API_URL, timespan, interval)
+        elif self.observation_window is None:
+            # time-resolved mode : one allocation set per interval step
+            url = "%s/allocation/compute?window=%s&resolution=%s&step=%s&accumulate=false" % (OPENCOST_API_URL, timespan, interval, interval)
+        else:
+            self.observation_window.fetch_range()
+            url = "%s/allocation/compute?window=%s,%s&resolution=%s&step=%s&accumulate=false" % ((OPENCOST_API_URL,) + self.observation_window.fetch_bounds() + (interval, interval))
+        if aggregate is not None:
+            url += "&aggregate=%s" % aggregate
         print("fetching CPU, RAM, GPU usage from opencost API : %s" % url)
 
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()["data"][0]
-            observations = {}
-            metadata = {}
-            for node_name, item in data.items():
-                if node_name in self.resources.keys():
-                    cpu_util = float(item["cpuCoreUsageAverage"]) * 100 #convert to percentage
-                    memory_gb = float(item["ramByteUsageAverage"] / (1024 ** 3)) #convert to GB
-
-                    rr =self.static_params[node_name]["instance_vcpus"]
-                    
-                    instance_vcpus = self.static_params[node_name].get("instance_vcpus", 2)
-                    if instance_vcpus <= 0: 
-                        instance_vcpus = 2
-                    tr = float(item["cpuCoreHours"]) / instance_vcpus # the actual time the server has run with the timestamp window
-                    
-                    observations[node_name] = {
-                    #     "average_cpu_percentage": cpu_util, 
-                    #   "average_memory_gb": avg_memory_gb,
-                    #     "average_gpu_percentage" : 0 #TODO: add gpu
-                                "average_cpu_percentage": cpu_util, 
-                                "cpuCoreUsageAverage" : float(item["cpuCoreUsageAverage"]), 
-                                "cpuCoreHours" : float(item["cpuCoreHours"]),
-                                #"tr" : tr, # for nodes, tr = cpuCoreHours / instance_vcpus
-                                "cpuCores" : float(item["cpuCores"]),
-                                "rr" : rr,  # for nodes, rr = instance_vcpus
-                                #"rr" : float(item["cpuCores"]),
-                                "memory_gb": memory_gb,
-                                "ramByteUsageAverage" : float(item["ramByteUsageAverage"]),
-                                "ramByteHours" : float(item["ramByteHours"]),
-                                "ramBytes" : float(item["ramBytes"]),
-                                "average_gpu_percentage" : 0, #gpu_utilization TODO
-                                "gpuCount" : float(item["gpuCount"]),
-                                "gpuHours" : float(item["gpuHours"])
-                      }
-                    metadata[node_name] = item["properties"]  
-
-            self.observations = observations
-            self.metadata = metadata
-            return observations
-        else:
+        response = await get_http_client().get_cached(url)
+        if response.status_code != 200:
             raise Exception(f"Error fetching observations from {url}: {response.status_code} {response.text}")
 
+        if self.observation_window is None and not self.time_resolved:
+            return response.json()["data"][0]
+
+        if self.observation_window is None:
+            buckets = group_allocation_buckets(response.json()["data"])
+        else:
+            # one allocation set per step
+            for allocation_set in response.json()["data"]:
+                for key, item in (allocation_set or {}).items():
+                    self.observation_window.put(key, "allocation", allocation_bucket_start(item), item)
+            self.observation_window.advance()
+            buckets = {key: self.observation_window.values(key, "allocation") for key in self.observation_window.resources("allocation")}
+
+        if self.time_resolved:
+            self.allocation_buckets = buckets
+        return {key: merge_allocation_buckets(items) for key, items in buckets.items()}
+
+
+    #fetch CPU, RAM & GPU usage metrics from opencost API
+    async def fetch_observations(self) -> Dict[str, object]:
+        if not self.resources or self.resources == {}:
+            await self.fetch_resources()
+
+        data = await self.fetch_allocations(aggregate="node")
+        observations = {}
+        metadata = {}
+        for node_name, item in data.items():
+            if node_name in self.resources.keys():
+                cpu_util = float(item["cpuCoreUsageAverage"]) * 100 #convert to percentage
+                memory_gb = float(item["ramByteUsageAverage"] / (1024 ** 3)) #convert to GB
+
+                rr =self.static_params[node_name]["instance_vcpus"]
+                
+                instance_vcpus = self.static_params[node_name].get("instance_vcpus", 2)
+                if instance_vcpus <= 0: 
+                    instance_vcpus = 2
+                tr = float(item["cpuCoreHours"]) / instance_vcpus # the actual time the server has run with the timestamp window
+                
+                observations[node_name] = {
+                #     "average_cpu_percentage": cpu_util, 
+                #   "average_memory_gb": avg_memory_gb,
+                #     "average_gpu_percentage" : 0 #TODO: add gpu
+                            "average_cpu_percentage": cpu_util, 
+                            "cpuCoreUsageAverage" : float(item["cpuCoreUsageAverage"]), 
+                            "cpuCoreHours" : float(item["cpuCoreHours"]),
+                            #"tr" : tr, # for nodes, tr = cpuCoreHours / instance_vcpus
+                            "cpuCores" : float(item["cpuCores"]),
+                            "rr" : rr,  # for nodes, rr = instance_vcpus
+                            #"rr" : float(item["cpuCores"]),
+                            "memory_gb": memory_gb,
+                            "ramByteUsageAverage" : float(item["ramByteUsageAverage"]),
+                            "ramByteHours" : float(item["ramByteHours"]),
+                            "ramBytes" : float(item["ramBytes"]),
+                            "average_gpu_percentage" : 0, #gpu_utilization TODO
+                            "gpuCount" : float(item["gpuCount"]),
+                            "gpuHours" : float(item["gpuHours"])
+                  }
+                if self.time_resolved:
+                    observations[node_name]["series"] = allocation_series(self.allocation_buckets.get(node_name, []))
+                metadata[node_name] = item["properties"]  
+
+        self.observations = observations
+        self.metadata = metadata
+        return observations
+
     # async def fetch_observations2(self) -> Dict[str, object]:
     #     if not self.resources or self.resources == {}:
     #         await self.fetch_resources()
@@ -310,6 +343,14 @@ class KubernetesNode(ImpactNodeInterface):
 
 
     async def calculate(self, carbon_intensity: float = 100) -> Dict[str, SCIImpactMetricsInterface]:
+        frame = await self.calculate_frame(carbon_intensity=carbon_intensity)
+        return frame.to_metrics()
+
+
+    async def calculate_frame(self, carbon_intensity: float = 100) -> ImpactFrame:
+        if self.node_snapshot is not None:
+            return await self.calculate_frame_from_snapshot()
+
         # if self.resources == {}: call fetch_resources
         #if self.resources == {} or self.resources == None:
         await self.fetch_resources()
@@ -320,91 +361,73 @@ class KubernetesNode(ImpactNodeInterface):
         #always get updated observations
         await self.fetch_observations()
 
-        return await self.inner_model.calculate(self.observations, carbon_intensity=self.carbon_intensity_provider, interval=self.interval, timespan=self.timespan, metadata=self.metadata, static_params=self.static_params)
+        return await self.inner_model.calculate_frame(self.observations, carbon_intensity=self.carbon_intensity_provider, interval=self.interval, timespan=self.timespan, metadata=self.metadata, static_params=self.static_params)
+
+
+    async def calculate_frame_from_snapshot(self) -> ImpactFrame:
+        # read the selected nodes from the shared cycle snapshot, instead of fetching the whole cluster again
+        snapshot = await self.node_snapshot.get()
+        node_names = snapshot.select_nodes(self.resource_selectors)
+
+        self.resources = {node_name: snapshot.resources[node_name] for node_name in node_names}
+        self.static_params = {node_name: snapshot.static_params[node_name] for node_name in node_names if node_name in snapshot.static_params}
+        self.observations = {node_name: snapshot.observations[node_name] for node_name in node_names if node_name in snapshot.observations}
+        self.metadata = {node_name: snapshot.metadata[node_name] for node_name in node_names if node_name in snapshot.metadata}
+
+        if len(self.observations) == len(snapshot.observations) and snapshot.frame is not None:
+            return snapshot.frame
+        return await self.inner_model.calculate_frame(self.observations, carbon_intensity=self.carbon_intensity_provider, interval=self.interval, timespan=self.timespan, metadata=self.metadata, static_params=self.static_params)
 
 
     async def query_prometheus(self, query: str, timestamp : str = '1h', interval : str = '5m') -> Dict[str, object]:
-        response = requests.get(f'{self.prometheus_url}/api/v1/query', params={'query': query, 'step' : interval})
+        response = await get_http_client().get_cached(f'{self.prometheus_url}/api/v1/query', params={'query': query, 'step' : interval})
         print(query)
         return response.json()['data']['result']
+
+    async def query_prometheus_range(self, query: str) -> List[Dict[str, object]]:
+        # one sample per interval over the timespan (matrix result), e.g. for the per-interval series of the time-resolved mode
+        response = await get_http_client().get_cached(f'{self.prometheus_url}/api/v1/query_range', params=range_query_params(query, self.timespan, self.interval))
+        if response.status_code != 200:
+            raise Exception(f"Failed to query Prometheus: {response.text}")
+        return response.json()['data']['result']
     
 
     
     async def get_vm_sku_tdp(self, vm_sku: str) -> int:
-        # Get TDP for the VM sku, from the static data file
-        vm_sku_tdp = 180  # default value for unknown VM SKUs
-        with open('lib/static_data/azure_vm_tdp.csv', 'r') as f:
-            for line in f:
-                if vm_sku in line:
-                    vm_sku_tdp = line.split(',')[1]
-                    break
-        return vm_sku_tdp
+        # Get TDP for the VM sku, from the static data catalog
+        return get_sku_catalog().tdp(vm_sku)
 
 
     async def get_vm_resources(self, vm_sku: str) -> Tuple[int, float, float]:
-        # Get RR, TR and instance memory for the VM sku, from the static data file
-        rr = 2  # vCPUs
-        total_vcpus = 16
-        instance_memory = 0.0
-        with open('lib/static_data/ccf_azure_instances.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            vm_sku_short = ''.join(vm_sku.split('_')[1:])
-            for row in reader:
-                if row['Virtual Machine'].replace(" ", "").lower() == vm_sku_short.replace(" ", "").lower():
-                    rr = int(row['Instance vCPUs'])
-                    total_vcpus = float(row['Platform vCPUs (highest vCPU possible)'])
-                    instance_memory = float(row['Instance Memory'])
-                    break
-        return rr, total_vcpus, instance_memory
+        # Get RR, TR and instance memory for the VM sku, from the static data catalog
+        return get_sku_catalog().resources(vm_sku)
 
 
     async def get_vm_te(self, vm_sku: str) -> float:
-        # Get TE for the VM sku, from the static data file
-        te = 1200
-        with open('lib/static_data/ccf_coefficients-azure-embodied.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            vm_sku_short = vm_sku.split('_')[1]
-            for row in reader:
-                if row['type'].replace(" ", "").lower() == vm_sku_short.replace(" ", "").lower():
-                    te = float(row['total'])
-                    break
-        return te
-
+        # Get TE for the VM sku, from the static data catalog
+        return get_sku_catalog().te(vm_sku)
 
 
     async def lookup_static_params(self) -> Dict[str, object]:
 
         if self.resources == {} or self.resources == None: 
             await self.fetch_resources()
-        # Create a list of coroutines to run concurrently using a list comprehension
-        coroutines = [
-            (
-                self.get_vm_sku_tdp(resource.metadata.labels.get("beta.kubernetes.io/instance-type", "")),
-                self.get_vm_resources(resource.metadata.labels.get("beta.kubernetes.io/instance-type", "")),
-                self.get_vm_te(resource.metadata.labels.get("beta.kubernetes.io/instance-type", ""))
-            )
-            for resource_name, resource in self.resources.items()
-        ]
-
-        # Run the coroutines concurrently using asyncio.gather
-        results = await asyncio.gather(*[coro for coro in itertools.chain(*coroutines)])
-        # Process the results and update the static_params dictionary
-        i = 0
+
+        # one batch lookup in the SKU catalog, for all the distinct node instance types
+        instance_types = {resource_name: resource.metadata.labels.get("beta.kubernetes.io/instance-type", "") for resource_name, resource in self.resources.items()}
+        sku_records = get_sku_catalog().lookup_many(instance_types.values())
+
         for resource_name, resource in self.resources.items():
             vm_name = resource.metadata.name
-            vm_sku_tdp = results[i]
-            instance_vcpus, platform_total_vcpus, instance_memory = results[i+1]
-            te = results[i+2]
+            record = sku_records[instance_types[resource_name]]
 
             self.static_params[vm_name] = {
-                'vm_sku': resource.metadata.labels.get("beta.kubernetes.io/instance-type", ""),
-                'vm_sku_tdp': vm_sku_tdp,
-                'instance_vcpus': instance_vcpus,
-                'total_vcpus': platform_total_vcpus,
-                'te': te,
-                'instance_memory': instance_memory
+                'vm_sku': record.vm_sku,
+                'vm_sku_tdp': record.tdp,
+                'instance_vcpus': record.instance_vcpus,
+                'total_vcpus': record.total_vcpus,
+                'te': record.te,
+                'instance_memory': record.instance_memory
             }
 
-            i += 3
-
         return self.static_params
@@ -4,9 +4,16 @@ from lib.components.azure_base import AzureImpactNode
 from lib.components.azure_aks_node import AKSNode
 from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
 from lib.ief.core import *
+from lib.ief.impact_frame import ImpactFrame
+from lib.ief.attribution import attribute_frame
 from lib.auth.azure import AzureManagedIdentityAuthParams
 from lib.components.kubernetes.kubernetes_node import KubernetesNode
+from lib.components.kubernetes.node_snapshot import KubernetesNodeSnapshot
+from lib.components.kubernetes.watch_cache import ResourceWatchCache
+from lib.components.kubernetes.opencost import index_pods, join_allocations, join_allocation_buckets, allocation_series
 from lib.MetricsExporter.exporter import *
+from lib.components.http_client import get_http_client
+from lib.MetricsExporter.sharding import shard_resources
 
 from kubernetes import client, config
 from kubernetes.config.kube_config import KubeConfigLoader
@@ -31,15 +38,15 @@ OPENCOST_API_URL = os.environ.get("OPENCOST_API_URL", "http://localhost:9003").r
 
 class KubernetesPod(KubernetesNode):
         
-        exporter = AKSPodExporter({})
+        exporter = get_exporter(AKSPodExporter)
+        shard_key = "namespace" # the pods of a namespace are calculated by the same shard
 
-        def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H", params={}):
-            super().__init__(name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval, timespan, params)
+        def __init__(self, name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval="PT5M", timespan="PT1H", params={}, node_snapshot=None):
+            super().__init__(name, model, carbon_intensity_provider, auth_object, resource_selectors, metadata, interval, timespan, params, node_snapshot)
             self.type = "kubernetes.pod"
             self.name = name
             self.resources = {}
             self.observations = {}
-            self.credential = DefaultAzureCredential()
             self.resource_selectors = resource_selectors
             self.carbon_intensity_provider = carbon_intensity_provider
             self.metadata = metadata
@@ -93,20 +100,20 @@ class KubernetesPod(KubernetesNode):
 
         async def fetch_resources(self) -> Dict[str, Any]:
 
-            await super().authenticate()
-            
-            v1 = client.CoreV1Api()
+            # pods and nodes are read from the local watch caches, instead of listing them from the API server every cycle
+            pods_cache = await self.get_watch_cache("pods")
+            nodes_cache = await self.get_watch_cache("nodes")
 
             pod_dict = {}
 
             if "namespace" in self.resource_selectors:
                 namespace = self.resource_selectors["namespace"]
-                pods = v1.list_namespaced_pod(namespace=namespace).items
+                pods = pods_cache.list(namespace=namespace)
             elif "label_selector" in self.resource_selectors:
                 label_selector = self.resource_selectors["label_selector"]
-                pods = v1.list_pod_for_all_namespaces(label_selector=label_selector).items
+                pods = pods_cache.list(label_selector=label_selector)
             else:
-                pods = v1.list_pod_for_all_namespaces().items
+                pods = pods_cache.list()
 
             nodes_uris = {}
             for item in pods:
@@ -131,14 +138,18 @@ class KubernetesPod(KubernetesNode):
                 #Get host node info
                 node_name = pod['node_name']
                 if node_name not in nodes_uris:
-                    node_uri = v1.read_node(node_name).spec.provider_id.replace("azure://", "")
-                    nodes_uris[node_name] = node_uri
+                    # pending pods have no node yet
+                    node = nodes_cache.get(node_name) if node_name else None
+                    nodes_uris[node_name] = (node.spec.provider_id or "").replace("azure://", "") if node is not None else None
                 pod['node_uri'] = nodes_uris[node_name]
                 pod['uri'] = item.metadata.uid
-                pod_dict[pod['name']] = pod
+                # namespace/name, as the watch cache : pods with the same name in different namespaces are distinct resources
+                pod['key'] = ResourceWatchCache.key(item)
+                pod_dict[pod['key']] = pod
             
 
-            self.resources = pod_dict
+            # sharded exporter : only the pods of the namespaces of the shard
+            self.resources = shard_resources(pod_dict, self.resource_selectors, key=lambda pod_key, pod: pod['namespace'])
             return self.resources
         
         def cpu_to_gb(self, cpu: str) -> float:
@@ -195,19 +206,19 @@ class KubernetesPod(KubernetesNode):
 
             # get CPU & RAM, requests & limits for each pod, in GB
             for pod in pods_list:
-                pod_name = pod['name']
-                pod_static_params[pod_name] = {}
-                pod_static_params[pod_name]['cpu_request'] = pod.get('cpu_request', None)
-                pod_static_params[pod_name]['cpu_limit'] = pod.get('cpu_limit', None)
-                pod_static_params[pod_name]['memory_request'] = pod.get('memory_request', None)
-                pod_static_params[pod_name]['memory_limit'] = pod.get('memory_limit', None)
-                pod_static_params[pod_name]['uri'] = pod.get('uri', 0)
+                pod_key = pod['key']
+                pod_static_params[pod_key] = {}
+                pod_static_params[pod_key]['cpu_request'] = pod.get('cpu_request', None)
+                pod_static_params[pod_key]['cpu_limit'] = pod.get('cpu_limit', None)
+                pod_static_params[pod_key]['memory_request'] = pod.get('memory_request', None)
+                pod_static_params[pod_key]['memory_limit'] = pod.get('memory_limit', None)
+                pod_static_params[pod_key]['uri'] = pod.get('uri', 0)
 
                 #convert to GB
-                pod_static_params[pod_name]['cpu_request'] = self.cpu_to_gb(pod_static_params[pod_name]['cpu_request'])
-                pod_static_params[pod_name]['cpu_limit'] = self.cpu_to_gb(pod_static_params[pod_name]['cpu_limit'])
-                pod_static_params[pod_name]['memory_request'] = self.memory_to_gb(pod_static_params[pod_name]['memory_request'])
-                pod_static_params[pod_name]['memory_limit'] = self.memory_to_gb(pod_static_params[pod_name]['memory_limit'])
+                pod_static_params[pod_key]['cpu_request'] = self.cpu_to_gb(pod_static_params[pod_key]['cpu_request'])
+                pod_static_params[pod_key]['cpu_limit'] = self.cpu_to_gb(pod_static_params[pod_key]['cpu_limit'])
+                pod_static_params[pod_key]['memory_request'] = self.memory_to_gb(pod_static_params[pod_key]['memory_request'])
+                pod_static_params[pod_key]['memory_limit'] = self.memory_to_gb(pod_static_params[pod_key]['memory_limit'])
             
             return pod_static_params
 
@@ -261,48 +272,41 @@ class KubernetesPod(KubernetesNode):
             if not self.resources or self.resources == {}:
                 await self.fetch_resources()
 
-            selected_pod_names = self.resources.keys()
-
-            timespan = self.timespan.lower().replace("pt", "")
-            interval = self.interval.lower().replace("pt", "")
-
-            url = "%s/allocation/compute?window=%s&resolution=%s" % (OPENCOST_API_URL, timespan, interval)
-            print("fetching CPU, RAM, GPU usage from opencost API : %s" % url)
-
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()["data"][0]
-                observations = {}
-                metadata = {}
-                for api_results_pod_name, item in data.items():
-                    for selected_pod_name in selected_pod_names:
-                        if selected_pod_name in api_results_pod_name: # if is a substring
-                            cpu_util = float(item["cpuCoreUsageAverage"]) * 100 #convert to percentage
-                            memory_gb = float(item["ramByteUsageAverage"] / (1024 ** 3)) #convert to GB
-
-                            observations[selected_pod_name] = {
-                                "average_cpu_percentage": cpu_util, 
-                                "cpuCoreUsageAverage" : float(item["cpuCoreUsageAverage"]), 
-                                "cpuCoreHours" : float(item["cpuCoreHours"]),
-                                #"tr" : float(item["cpuCoreHours"]),
-                                "cpuCores" : float(item["cpuCores"]),
-                                "rr" : float(item["cpuCores"]),
-                                "memory_gb": memory_gb,
-                                "ramByteUsageAverage" : float(item["ramByteUsageAverage"]),
-                                "ramByteHours" : float(item["ramByteHours"]),
-                                "ramBytes" : float(item["ramBytes"]),
-                                "average_gpu_percentage" : 0, #gpu_utilization TODO
-                                "gpuCount" : float(item["gpuCount"]),
-                                "gpuHours" : float(item["gpuHours"])
-                            }
-
-                            metadata[selected_pod_name] = item["properties"]
-                self.observations = observations
-
-                self.metadata = metadata
-                return observations
-            else:
-                raise Exception(f"Error fetching observations from {url}: {response.status_code} {response.text}")
+            data = await self.fetch_allocations()
+            observations = {}
+            metadata = {}
+            # allocations are joined to the selected pods by exact (namespace, pod) key
+            pods_index = index_pods(self.resources.values())
+            allocations = join_allocations(data, pods_index)
+            pod_buckets = join_allocation_buckets(self.allocation_buckets, pods_index) if self.time_resolved else {}
+            for pod_key, item in allocations.items():
+                cpu_util = float(item["cpuCoreUsageAverage"]) * 100 #convert to percentage
+                memory_gb = float(item["ramByteUsageAverage"] / (1024 ** 3)) #convert to GB
+
+                observations[pod_key] = {
+                    "average_cpu_percentage": cpu_util, 
+                    "cpuCoreUsageAverage" : float(item["cpuCoreUsageAverage"]), 
+                    "cpuCoreHours" : float(item["cpuCoreHours"]),
+                    #"tr" : float(item["cpuCoreHours"]),
+                    "cpuCores" : float(item["cpuCores"]),
+                    "rr" : float(item["cpuCores"]),
+                    "memory_gb": memory_gb,
+                    "ramByteUsageAverage" : float(item["ramByteUsageAverage"]),
+                    "ramByteHours" : float(item["ramByteHours"]),
+                    "ramBytes" : float(item["ramBytes"]),
+                    "average_gpu_percentage" : 0, #gpu_utilization TODO
+                    "gpuCount" : float(item["gpuCount"]),
+                    "gpuHours" : float(item["gpuHours"])
+                }
+
+                if self.time_resolved:
+                    observations[pod_key]["series"] = allocation_series(pod_buckets.get(pod_key, []))
+
+                metadata[pod_key] = item["properties"]
+            self.observations = observations
+
+            self.metadata = metadata
+            return observations
 
 
 
@@ -331,6 +335,10 @@ class KubernetesPod(KubernetesNode):
 
 
         async def calculate(self, carbon_intensity = 100) -> Dict[str, SCIImpactMetricsInterface]:
+            frame = await self.calculate_frame(carbon_intensity=carbon_intensity)
+            return frame.to_metrics()
+
+        async def calculate_frame(self, carbon_intensity = 100) -> ImpactFrame:
             #if self.resources == {} or self.resources == None:
             await self.fetch_resources()
             pod_list = self.resources.values()
@@ -338,84 +346,29 @@ class KubernetesPod(KubernetesNode):
             pod_observations = await self.fetch_observations()
             pod_static_params = await self.lookup_static_params()
 
-            node_names = set([pod['node_name'] for pod in pod_list])
-
-            # first we gather the infos for the nodes: models, static params, impacts
-            node_tasks = []
-            node_static_params_tasks = []
-            node_impact_metrics = {}
-            node_static_params = {}
-            node_models = {}
-            for node_name in node_names:
-                # create an KubernetesNode object for each node that hosts the selected pods
-                resource_selectors = {
-                    "subscription_id": self.resource_selectors.get("subscription_id", None),
-                    "resource_group": self.resource_selectors.get("resource_group", None),
-                    "cluster_name": self.resource_selectors.get("cluster_name", None),
-                    "node_name" : node_name,
-                    "prometheus_endpoint": self.resource_selectors.get("prometheus_endpoint", None)
-                }
-                node = KubernetesNode(name = node_name, 
-                                      model = self.inner_model,  
-                                      carbon_intensity_provider=self.carbon_intensity_provider, 
-                                      auth_object=self.auth_object, 
-                                      resource_selectors=resource_selectors, 
-                                      metadata=self.metadata,
-                                      interval=self.interval,
-                                      timespan=self.timespan
-                                      )
-                
-                node_models[node_name] = node.inner_model
-
-                node_task = asyncio.create_task(node.calculate())
-                node_static_param_task = asyncio.create_task(node.lookup_static_params())
-
-
-                node_tasks.append(node_task)
-                node_static_params_tasks.append(node_static_param_task)
-
-            node_static_params_results = await asyncio.gather(*node_static_params_tasks)
-            node_results = await asyncio.gather(*node_tasks)
-
-            for i, node_name in enumerate(node_names):
-                node_static_params[node_name] = node_static_params_results[i]
-                node_impact_metrics[node_name] = node_results[i]
-
-
-            # now we create an AttributedImpactNodeInterface object for each pod
-            # the AttributedImpactNodeInterface class is used to calculate the impact of a pod that shares node resources with other pods
-            pod_tasks = []
-            pods_impact = {}
+            # the nodes infos (static params, impacts) are read from the cycle snapshot, which fetches the whole cluster once instead of once per node
+            if self.node_snapshot is None:
+                self.node_snapshot = KubernetesNodeSnapshot.for_impact_node(self)
+            snapshot = await self.node_snapshot.get()
+            host_frame = snapshot.frame if snapshot.frame is not None else ImpactFrame([], {})
 
+            # the pods are attributed a share of their host node impact in one vectorized pass, joined to their node by node index
+            host_node_names = {}
             for pod in pod_list:
                 node_name = pod['node_name']
-                pod_name = pod['name']
-                if pod_name not in pod_observations.keys() or pod_name not in pod_static_params.keys() :
-                    Warning(f"Pod {pod_name} not found in observations or static params ; skipping")
-                    continue
-                pod_impact_object = AttributedImpactNodeInterface(name = pod_name,
-                                                                    host_node_impact_dict= node_impact_metrics[node_name],
-                                                                    carbon_intensity_provider=self.carbon_intensity_provider,
-                                                                    metadata=self.metadata[pod_name],
-                                                                    observations=pod_observations[pod_name],
-                                                                    timespan=self.timespan,
-                                                                    interval=self.interval,
-                                                                    static_params = pod_static_params[pod_name],
-                                                                    host_node_static_params=node_static_params[node_name],
-                                                                    host_node_model = node_models[node_name])
-                pod_task = asyncio.create_task(pod_impact_object.calculate())
-                pod_tasks.append(pod_task)
-
-            pod_results = await asyncio.gather(*pod_tasks)
-
-            for i, pod in enumerate(pod_list):
-                pod_name = pod['name']
-                if pod_name not in pod_observations.keys() or pod_name not in pod_static_params.keys() :
+                pod_key = pod['key']
+                if pod_key not in pod_observations.keys() or pod_key not in pod_static_params.keys() or node_name not in snapshot.static_params:
+                    Warning(f"Pod {pod_key} not found in observations or static params, or its node in the node snapshot ; skipping")
                     continue
-                try:
-                    pods_impact[pod_name] = pod_results[i][pod_name] or {}
-                except Exception as e:
-                    print(f"Error calculating pod impact for pod {pod_name} : {e} ; skipping")
-                    continue
-
-            return pods_impact
+                host_node_names[pod_key] = node_name
+
+            return await attribute_frame(host_frame,
+                                         host_node_names,
+                                         pod_observations,
+                                         host_static_params=snapshot.static_params,
+                                         host_node_model=snapshot.node.inner_model,
+                                         carbon_intensity_provider=self.carbon_intensity_provider,
+                                         static_params=pod_static_params,
+                                         metadata=self.metadata,
+                                         timespan=self.timespan,
+                                         interval=self.interval)
@@ -0,0 +1,91 @@
+from typing import Dict, List
+import asyncio
+import os
+import time
+
+from lib.ief.impact_frame import ImpactFrame
+from lib.components.kubernetes.kubernetes_node import KubernetesNode
+from lib.MetricsExporter.sharding import shard_resources
+
+
+NODE_SNAPSHOT_MAX_AGE = float(os.environ.get("NODE_SNAPSHOT_MAX_AGE", "30")) # seconds ; should be shorter than the exporter cycle
+
+
+class KubernetesNodeSnapshot:
+    """
+    Cycle-scoped snapshot of the cluster nodes : inventory, static params, observations and impacts are fetched once
+    for the whole cluster, and shared by the KubernetesNode / KubernetesPod impact nodes of the same cycle.
+    """
+
+    def __init__(self, node: KubernetesNode, max_age: float = NODE_SNAPSHOT_MAX_AGE):
+        self.node = node # cluster-wide KubernetesNode, without node selectors
+        self.max_age = max_age
+        self.refreshed_at = None
+        self.resources = {}
+        self.static_params = {}
+        self.observations = {}
+        self.metadata = {}
+        self.frame = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_impact_node(cls, impact_node, max_age: float = NODE_SNAPSHOT_MAX_AGE) -> 'KubernetesNodeSnapshot':
+        # build a snapshot covering the whole cluster of the given impact node
+        resource_selectors = {
+            "subscription_id": impact_node.resource_selectors.get("subscription_id", None),
+            "resource_group": impact_node.resource_selectors.get("resource_group", None),
+            "cluster_name": impact_node.resource_selectors.get("cluster_name", None),
+            "prometheus_endpoint": impact_node.resource_selectors.get("prometheus_endpoint", None)
+        }
+        for mode in ("incremental_observations", "time_resolved"):
+            if mode in impact_node.resource_selectors:
+                resource_selectors[mode] = impact_node.resource_selectors[mode]
+        node = KubernetesNode(name = "%s-nodes" % impact_node.name,
+                              model = impact_node.inner_model,
+                              carbon_intensity_provider=impact_node.carbon_intensity_provider,
+                              auth_object=impact_node.auth_object,
+                              resource_selectors=resource_selectors,
+                              metadata={},
+                              interval=impact_node.interval,
+                              timespan=impact_node.timespan,
+                              params=impact_node.params)
+        return cls(node, max_age=max_age)
+
+    def is_fresh(self) -> bool:
+        return self.refreshed_at is not None and (time.monotonic() - self.refreshed_at) < self.max_age
+
+    def invalidate(self) -> None:
+        self.refreshed_at = None
+
+    async def refresh(self) -> 'KubernetesNodeSnapshot':
+        node = self.node
+        node.static_params = {}
+        await node.fetch_resources()
+        await node.lookup_static_params()
+        await node.fetch_observations()
+
+        self.resources = node.resources
+        self.static_params = node.static_params
+        self.observations = node.observations
+        self.metadata = node.metadata
+        self.frame = await node.inner_model.calculate_frame(self.observations, carbon_intensity=node.carbon_intensity_provider, interval=node.interval, timespan=node.timespan, metadata=self.metadata, static_params=self.static_params)
+        self.refreshed_at = time.monotonic()
+        print("node snapshot refreshed : %s nodes" % len(self.resources))
+        return self
+
+    async def get(self) -> 'KubernetesNodeSnapshot':
+        # concurrent callers of the same cycle wait for a single refresh
+        async with self._lock:
+            if not self.is_fresh():
+                await self.refresh()
+        return self
+
+    def select_nodes(self, resource_selectors: Dict[str, object]) -> List[str]:
+        # same selectors as KubernetesNode.fetch_resources, applied to the snapshot inventory (which covers the whole cluster, whatever the shard)
+        if "nodepool_name" in resource_selectors:
+            label, value = "nodepool.kubernetes.io/name", resource_selectors["nodepool_name"]
+        elif "node_name" in resource_selectors:
+            label, value = "kubernetes.io/hostname", resource_selectors["node_name"]
+        else:
+            return list(shard_resources(self.resources, resource_selectors).keys())
+        return list(shard_resources({node_name: node for node_name, node in self.resources.items() if (node.metadata.labels or {}).get(label) == value}, resource_selectors).keys())
@@ -0,0 +1,130 @@
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+from datetime import datetime, timezone
+
+
+# usage fields of an opencost allocation, summed when the allocations of several containers are merged into their pod
+OPENCOST_USAGE_FIELDS = ["cpuCoreUsageAverage", "cpuCoreHours", "cpuCores", "ramByteUsageAverage", "ramByteHours", "ramBytes", "gpuCount", "gpuHours"]
+
+
+class AllocationKey(NamedTuple):
+    cluster: str
+    node: str
+    namespace: str
+    pod: str
+    container: str
+
+
+def parse_allocation_key(key: str, properties: Dict[str, object] = None) -> AllocationKey:
+    """
+    Parses the key of an opencost allocation (not aggregated), e.g. "cluster-one/aks-nodepool1-vmss000000/kube-system/coredns-5d78c9869d-4xj2z/coredns".
+    The allocation properties are used first when they are present.
+
+    :return: the AllocationKey, or None for the special allocations (__idle__, __unallocated__, __unmounted__ ...).
+    """
+    properties = properties or {}
+    parts = key.split("/")
+    if len(parts) != 5:
+        parts = [None] * 5
+    cluster, node, namespace, pod, container = [properties.get(field) or part for field, part in zip(AllocationKey._fields, parts)]
+    if not namespace or not pod or pod.startswith("__") or namespace.startswith("__"):
+        return None
+    return AllocationKey(cluster, node, namespace, pod, container)
+
+
+def index_pods(pods: Iterable[Dict[str, object]]) -> Dict[Tuple[str, str], str]:
+    # (namespace, pod name) -> key of the pod in the inventory (namespace/name)
+    return {(pod['namespace'], pod['name']): pod.get('key', "%s/%s" % (pod['namespace'], pod['name'])) for pod in pods}
+
+
+def join_allocations(data: Dict[str, dict], pods_index: Dict[Tuple[str, str], str]) -> Dict[str, dict]:
+    """
+    Hash join of the opencost allocations with the pod inventory, in linear time : each allocation key is parsed once
+    and looked up by exact (namespace, pod) ; the allocations of the containers of a pod are merged.
+
+    :param data: allocations of one opencost window, per allocation key.
+    :param pods_index: pod inventory index, as returned by index_pods.
+    :return: a dictionary of merged allocations, per pod key of the inventory.
+    """
+    allocations = {}
+    for key, item in data.items():
+        allocation_key = parse_allocation_key(key, item.get("properties"))
+        if allocation_key is None:
+            continue
+        pod_key = pods_index.get((allocation_key.namespace, allocation_key.pod))
+        if pod_key is None:
+            continue
+
+        allocation = allocations.get(pod_key)
+        if allocation is None:
+            allocations[pod_key] = dict(item)
+        else:
+            for field in OPENCOST_USAGE_FIELDS:
+                allocation[field] = float(allocation.get(field) or 0) + float(item.get(field) or 0)
+    return allocations
+
+
+def allocation_bucket_start(item: Dict[str, object]) -> datetime:
+    # start of the step of an allocation, e.g. "2023-07-05T10:00:00Z"
+    return datetime.strptime(item["start"][:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def allocation_minutes(item: Dict[str, object]) -> float:
+    if item.get("minutes") is not None:
+        return float(item["minutes"])
+    end = datetime.strptime(item["end"][:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return (end - allocation_bucket_start(item)).total_seconds() / 60
+
+
+def merge_allocation_buckets(items: List[Dict[str, object]]) -> Dict[str, object]:
+    """
+    Accumulates the allocations of consecutive steps of a resource into one allocation of the whole window,
+    the same way opencost accumulates them : hours are summed, usage averages are weighted by the running minutes,
+    and the allocated cores, bytes and GPUs are the hours divided by the running hours.
+    """
+    minutes = sum(allocation_minutes(item) for item in items)
+    hours = minutes / 60
+    merged = dict(items[-1])
+    merged["start"] = items[0].get("start")
+    merged["end"] = items[-1].get("end")
+    merged["minutes"] = minutes
+    for field in ["cpuCoreHours", "ramByteHours", "gpuHours"]:
+        merged[field] = sum(float(item.get(field) or 0) for item in items)
+    for field in ["cpuCoreUsageAverage", "ramByteUsageAverage"]:
+        merged[field] = sum(float(item.get(field) or 0) * allocation_minutes(item) for item in items) / minutes if minutes > 0 else 0.0
+    merged["cpuCores"] = merged["cpuCoreHours"] / hours if hours > 0 else 0.0
+    merged["ramBytes"] = merged["ramByteHours"] / hours if hours > 0 else 0.0
+    merged["gpuCount"] = merged["gpuHours"] / hours if hours > 0 else 0.0
+    return merged
+
+
+def group_allocation_buckets(data: List[Dict[str, dict]]) -> Dict[str, List[Dict[str, object]]]:
+    # steps of a non-accumulated opencost response (one allocation set per step), per allocation key, oldest first
+    buckets = {}
+    for allocation_set in data:
+        for key, item in (allocation_set or {}).items():
+            buckets.setdefault(key, []).append(item)
+    for items in buckets.values():
+        items.sort(key=lambda item: item.get("start") or "")
+    return buckets
+
+
+def join_allocation_buckets(buckets: Dict[str, List[Dict[str, object]]], pods_index: Dict[Tuple[str, str], str]) -> Dict[str, List[Dict[str, object]]]:
+    # per-step allocations joined to the pod inventory, as join_allocations for each step
+    steps = {}
+    for key, items in buckets.items():
+        for item in items:
+            steps.setdefault(item.get("start"), {})[key] = item
+    pod_buckets = {}
+    for start in sorted(steps, key=lambda start: start or ""):
+        for pod_key, item in join_allocations(steps[start], pods_index).items():
+            pod_buckets.setdefault(pod_key, []).append(item)
+    return pod_buckets
+
+
+def allocation_series(items: List[Dict[str, object]]) -> Dict[str, list]:
+    # per-step CPU and memory usage of a resource, as the "series" observation of the time-resolved mode
+    return {
+        "timestamps": [allocation_bucket_start(item).timestamp() for item in items],
+        "average_cpu_percentage": [float(item.get("cpuCoreUsageAverage") or 0) * 100 for item in items],
+        "memory_gb": [float(item.get("ramByteUsageAverage") or 0) / (1024 ** 3) for item in items]
+    }
@@ -0,0 +1,203 @@
+from typing import Callable, Dict, List
+import asyncio
+import os
+import threading
+import time
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+from lib.auth.session import get_auth_session
+
+
+WATCH_TIMEOUT_SECONDS = int(os.environ.get("KUBERNETES_WATCH_TIMEOUT_SECONDS", "300")) # server-side timeout of a watch request, it is then resumed from the last resourceVersion
+WATCH_SYNC_TIMEOUT = float(os.environ.get("KUBERNETES_WATCH_SYNC_TIMEOUT", "120")) # max time to wait for the initial list
+
+
+def split_selector(selector: str) -> List[str]:
+    # splits on the commas that are not inside a set, e.g. "app=web,tier in (a,b)" -> ["app=web", "tier in (a,b)"]
+    requirements, current, depth = [], "", 0
+    for char in selector:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            requirements.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        requirements.append(current.strip())
+    return requirements
+
+
+def parse_label_selector(selector: str) -> List[Callable[[Dict[str, str]], bool]]:
+    """
+    Parses a Kubernetes label selector (=, ==, !=, in, notin, exists, !exists) into predicates on a labels dictionary.
+    """
+    predicates = []
+    for requirement in split_selector(selector or ""):
+        if " notin " in requirement or " in " in requirement:
+            operator = " notin " if " notin " in requirement else " in "
+            key, values = requirement.split(operator, 1)
+            key, values = key.strip(), {value.strip() for value in values.strip().strip("()").split(",")}
+            if operator == " in ":
+                predicates.append(lambda labels, key=key, values=values: labels.get(key) in values)
+            else:
+                predicates.append(lambda labels, key=key, values=values: labels.get(key) not in values)
+        elif "!=" in requirement:
+            key, value = [part.strip() for part in requirement.split("!=", 1)]
+            predicates.append(lambda labels, key=key, value=value: labels.get(key) != value)
+        elif "=" in requirement:
+            key, value = [part.strip() for part in requirement.replace("==", "=").split("=", 1)]
+            predicates.append(lambda labels, key=key, value=value: labels.get(key) == value)
+        elif requirement.startswith("!"):
+            predicates.append(lambda labels, key=requirement[1:].strip(): key not in labels)
+        else:
+            predicates.append(lambda labels, key=requirement: key in labels)
+    return predicates
+
+
+def match_labels(labels: Dict[str, str], predicates: List[Callable[[Dict[str, str]], bool]]) -> bool:
+    labels = labels or {}
+    return all(predicate(labels) for predicate in predicates)
+
+
+class ResourceWatchCache:
+    """
+    Informer-style local cache of a Kubernetes resource kind : the objects are listed once, then kept up to date
+    by a watch resumed from the last resourceVersion, in a background thread. The cache is relisted when the
+    resourceVersion is too old (410 Gone).
+
+    :param list_method: returns the list method of the kind (e.g. CoreV1Api.list_node), bound to the current ApiClient of the cluster ;
+        it is resolved again on every reconnection, so that refreshed credentials are used.
+    """
+
+    def __init__(self, kind: str, list_method: Callable[[], Callable], timeout_seconds: int = WATCH_TIMEOUT_SECONDS):
+        self.kind = kind
+        self.list_method = list_method
+        self.timeout_seconds = timeout_seconds
+        self.items = {}
+        self.resource_version = None
+        self.list_count = 0
+        self.event_count = 0
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    @staticmethod
+    def key(obj) -> str:
+        # namespace/name for namespaced objects, name otherwise
+        if obj.metadata.namespace:
+            return "%s/%s" % (obj.metadata.namespace, obj.metadata.name)
+        return obj.metadata.name
+
+    def relist(self) -> None:
+        response = self.list_method()()
+        items = {self.key(obj): obj for obj in response.items}
+        with self._lock:
+            self.items = items
+            self.resource_version = response.metadata.resource_version
+            self.list_count += 1
+        self._synced.set()
+        print("%s watch cache : %s objects listed" % (self.kind, len(items)))
+
+    def apply_event(self, event: Dict[str, object]) -> None:
+        event_type, obj = event["type"], event["object"]
+        if event_type == "ERROR":
+            # the raw object is a Status ; 410 Gone means that the resourceVersion is too old
+            code = obj.get("code") if isinstance(obj, dict) else getattr(obj, "code", None)
+            raise ApiException(status=code or 500, reason="watch error")
+        with self._lock:
+            if event_type in ("ADDED", "MODIFIED"):
+                self.items[self.key(obj)] = obj
+            elif event_type == "DELETED":
+                self.items.pop(self.key(obj), None)
+            self.resource_version = obj.metadata.resource_version
+            self.event_count += 1
+
+    def run(self) -> None:
+        retry_count = 0
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self._watch = watch.Watch()
+                for event in self._watch.stream(self.list_method(), resource_version=self.resource_version, timeout_seconds=self.timeout_seconds, allow_watch_bookmarks=True):
+                    self.apply_event(event)
+                    if self._stopped.is_set():
+                        break
+                retry_count = 0
+            except ApiException as e:
+                if e.status == 410:
+                    self.resource_version = None
+                    continue
+                print(f"{self.kind} watch cache : error {e.status} {e.reason}")
+                retry_count += 1
+                time.sleep(min(60, 2 ** retry_count))
+            except Exception as e:
+                print(f"{self.kind} watch cache : error {e}")
+                retry_count += 1
+                time.sleep(min(60, 2 ** retry_count))
+
+    def start(self) -> 'ResourceWatchCache':
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.run, name="%s-watch-cache" % self.kind, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._watch is not None:
+            self._watch.stop()
+
+    async def wait_synced(self, timeout: float = WATCH_SYNC_TIMEOUT) -> None:
+        if self._synced.is_set():
+            return
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self._synced.wait, timeout):
+            raise Exception(f"Timeout waiting for the initial list of the {self.kind} watch cache")
+
+    def get(self, key: str):
+        with self._lock:
+            return self.items.get(key)
+
+    def list(self, namespace: str = None, label_selector: str = None) -> List[object]:
+        # selector filtering on the in-memory objects, instead of a list request to the API server
+        with self._lock:
+            items = list(self.items.values())
+        if namespace is not None:
+            items = [obj for obj in items if obj.metadata.namespace == namespace]
+        if label_selector:
+            predicates = parse_label_selector(label_selector)
+            items = [obj for obj in items if match_labels(obj.metadata.labels, predicates)]
+        return items
+
+
+_watch_caches: Dict[tuple, ResourceWatchCache] = {}
+_watch_caches_lock = threading.Lock()
+
+
+def get_watch_cache(kind: str, cluster_key: str) -> ResourceWatchCache:
+    """
+    Process-wide watch caches of "nodes" and "pods", per cluster, shared by the KubernetesNode and KubernetesPod components.
+    The cluster must be authenticated in the auth session before the first call.
+    """
+    if kind == "nodes":
+        method_name = "list_node"
+    elif kind == "pods":
+        method_name = "list_pod_for_all_namespaces"
+    else:
+        raise Exception(f"Unsupported watch cache kind : {kind}")
+
+    with _watch_caches_lock:
+        watch_cache = _watch_caches.get((kind, cluster_key))
+        if watch_cache is None:
+            list_method = lambda: getattr(client.CoreV1Api(get_auth_session().api_client(cluster_key)), method_name)
+            watch_cache = ResourceWatchCache(kind, list_method).start()
+            _watch_caches[(kind, cluster_key)] = watch_cache
+        return watch_cache
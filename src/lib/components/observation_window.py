@@ -0,0 +1,140 @@
+from typing import Dict, Iterable, List, Tuple
+from datetime import datetime, timedelta, timezone
+import math
+import os
+
+from isoduration import parse_duration
+
+
+# incremental mode : each cycle only fetches the newest interval buckets, and the window is rebuilt from the ring buffers
+INCREMENTAL_OBSERVATIONS = os.environ.get("INCREMENTAL_OBSERVATIONS", "false").lower() == "true"
+# time-resolved mode : observations also keep their per-interval series, and the SCI integrates energy x carbon intensity per interval
+TIME_RESOLVED_SCI = os.environ.get("TIME_RESOLVED_SCI", "false").lower() == "true"
+
+
+def duration_seconds(duration: str) -> float:
+    # e.g. PT1H -> 3600
+    return ((datetime(2000, 1, 1) + parse_duration(duration)) - datetime(2000, 1, 1)).total_seconds()
+
+
+def iso_duration(seconds: float) -> str:
+    # e.g. 86400 -> PT24H, 5400 -> PT1H30M ; hours and minutes, as read by the impact models
+    hours, remainder = divmod(int(round(seconds)), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    parts = [("%dH" % hours) if hours else "", ("%dM" % minutes) if minutes else "", ("%dS" % seconds) if seconds else ""]
+    return "PT%s" % ("".join(parts) or "0S")
+
+
+def incremental_observations(resource_selectors: Dict[str, object]) -> bool:
+    return str(resource_selectors.get("incremental_observations", INCREMENTAL_OBSERVATIONS)).lower() == "true"
+
+
+def time_resolved_observations(resource_selectors: Dict[str, object]) -> bool:
+    return str(resource_selectors.get("time_resolved", TIME_RESOLVED_SCI)).lower() == "true"
+
+
+class BucketRing:
+    """
+    Fixed-capacity ring buffer of bucket aggregates, indexed by bucket number (bucket start / interval).
+    A bucket fetched again (e.g. the last, partial bucket of the previous cycle) overwrites its slot.
+    """
+    __slots__ = ("capacity", "slots")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+
+    def put(self, bucket: int, value) -> None:
+        self.slots[bucket % self.capacity] = (bucket, value)
+
+    def items(self, first_bucket: int, last_bucket: int) -> List[Tuple[int, object]]:
+        # (bucket, value) pairs of the buckets in [first_bucket, last_bucket], oldest first
+        return sorted((slot for slot in self.slots if slot is not None and first_bucket <= slot[0] <= last_bucket), key=lambda slot: slot[0])
+
+    def values(self, first_bucket: int, last_bucket: int) -> List[object]:
+        return [value for bucket, value in self.items(first_bucket, last_bucket)]
+
+
+class ObservationWindow:
+    """
+    Sliding observation window of timespan, made of interval buckets : keeps one ring buffer per resource and metric,
+    and tells which time range to fetch at each cycle (the whole window on the first cycle, then only the newest buckets).
+    """
+
+    def __init__(self, timespan: str, interval: str):
+        self.timespan_seconds = duration_seconds(timespan)
+        self.interval_seconds = duration_seconds(interval)
+        self.capacity = int(math.ceil(self.timespan_seconds / self.interval_seconds)) + 2
+        self.buffers: Dict[Tuple[str, str], BucketRing] = {}
+        self.metric_names: Dict[str, List[str]] = {}
+        self.last_end = None
+        self.start = None
+        self.end = None
+
+    def bucket(self, timestamp: datetime) -> int:
+        return int(timestamp.timestamp() // self.interval_seconds)
+
+    def bucket_start(self, bucket: int) -> datetime:
+        return datetime.fromtimestamp(bucket * self.interval_seconds, tz=timezone.utc)
+
+    def fetch_range(self, now: datetime = None) -> Tuple[datetime, datetime]:
+        """
+        Time range to fetch for this cycle : from the start of the last (possibly partial) bucket of the previous cycle to now,
+        or the whole window on the first cycle, from the start of its first bucket.
+        """
+        end = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+        window_start = end - timedelta(seconds=self.timespan_seconds)
+        if self.last_end is None or self.last_end <= window_start:
+            # aligned on the bucket grid : the first bucket is fetched whole, not from the middle of its interval
+            start = self.bucket_start(self.bucket(window_start))
+        else:
+            start = self.bucket_start(self.bucket(self.last_end))
+        self.start, self.end = start, end
+        return start, end
+
+    def fetch_bounds(self) -> Tuple[str, str]:
+        # range of the current cycle, as start and end times
+        return self.start.strftime("%Y-%m-%dT%H:%M:%SZ"), self.end.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def advance(self) -> None:
+        # called once the fetched buckets are stored, so that a failed fetch is retried on the next cycle
+        self.last_end = self.end
+
+    def window_buckets(self) -> Tuple[int, int]:
+        end = self.end or datetime.now(timezone.utc)
+        return self.bucket(end - timedelta(seconds=self.timespan_seconds)), self.bucket(end)
+
+    def put(self, resource: str, metric: str, timestamp: datetime, value) -> None:
+        buffer = self.buffers.get((resource, metric))
+        if buffer is None:
+            buffer = BucketRing(self.capacity)
+            self.buffers[(resource, metric)] = buffer
+            self.metric_names.setdefault(resource, []).append(metric)
+        buffer.put(self.bucket(timestamp), value)
+
+    def values(self, resource: str, metric: str) -> List[object]:
+        buffer = self.buffers.get((resource, metric))
+        if buffer is None:
+            return []
+        return buffer.values(*self.window_buckets())
+
+    def series(self, resource: str) -> List[Tuple[str, List[object]]]:
+        # (metric name, bucket values) pairs of a resource, in the same shape as a full fetch
+        return [(metric, self.values(resource, metric)) for metric in self.metric_names.get(resource, [])]
+
+    def points(self, resource: str) -> List[Tuple[str, List[Tuple[datetime, object]]]]:
+        # same as series, with the start time of each bucket
+        first_bucket, last_bucket = self.window_buckets()
+        return [(metric, [(self.bucket_start(bucket), value) for bucket, value in self.buffers[(resource, metric)].items(first_bucket, last_bucket)]) for metric in self.metric_names.get(resource, [])]
+
+    def resources(self, metric: str) -> Iterable[str]:
+        # resources with at least one bucket of the metric in the window ; the others are dropped
+        first_bucket, last_bucket = self.window_buckets()
+        for (resource, buffer_metric), buffer in list(self.buffers.items()):
+            if buffer_metric != metric:
+                continue
+            if buffer.values(first_bucket, last_bucket):
+                yield resource
+            else:
+                del self.buffers[(resource, buffer_metric)]
+                self.metric_names[resource].remove(buffer_metric)
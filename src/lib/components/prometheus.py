@@ -0,0 +1,51 @@
+from typing import Dict, List
+from datetime import datetime, timezone
+
+from lib.components.observation_window import duration_seconds
+
+
+def iso_duration(duration: str) -> str:
+    # "1h" / "5m" (Prometheus and opencost durations) -> "PT1H" / "PT5M"
+    duration = duration.upper()
+    return duration if duration.startswith("P") else "PT" + duration
+
+
+def range_query_params(query: str, timespan: str, interval: str, now: datetime = None) -> Dict[str, str]:
+    """
+    Parameters of a Prometheus query_range over the timespan, with one sample per interval.
+    The end is aligned on the interval, so that the queries of the same interval are identical (and shared by the request cache).
+    """
+    step = duration_seconds(iso_duration(interval))
+    end = (now or datetime.now(timezone.utc)).timestamp() // step * step
+    start = end - duration_seconds(iso_duration(timespan))
+    return {"query": query, "start": "%d" % start, "end": "%d" % end, "step": "%ds" % step}
+
+
+def instant_query_params(query: str, time: datetime = None) -> Dict[str, str]:
+    # Parameters of a Prometheus instant query, evaluated at time (now when None)
+    params = {"query": query}
+    if time is not None:
+        params["time"] = "%d" % time.timestamp()
+    return params
+
+
+def sample_average(item: Dict[str, object]) -> float:
+    # value of an instant vector sample, or average of the values of a range vector (matrix) sample
+    if "values" in item:
+        values = [float(value) for timestamp, value in item["values"]]
+        return sum(values) / len(values) if values else 0.0
+    return float(item["value"][1])
+
+
+def matrix_series(result: List[Dict[str, object]], label: str) -> Dict[str, Dict[str, list]]:
+    # per-interval values of a query_range (matrix) result, per value of the label : {"timestamps": [epoch seconds], "values": [...]}
+    series = {}
+    for item in result:
+        key = item["metric"].get(label)
+        if key is None:
+            continue
+        series[key] = {
+            "timestamps": [float(timestamp) for timestamp, value in item.get("values", [])],
+            "values": [float(value) for timestamp, value in item.get("values", [])]
+        }
+    return series
@@ -0,0 +1,128 @@
+from typing import Awaitable, Callable, Dict, Tuple
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+REQUEST_CACHE_TTL = float(os.environ.get("REQUEST_CACHE_TTL", "30")) # seconds ; shorter than the exporter cycle, so that each cycle reads fresh data
+REQUEST_CACHE_MAX_ENTRIES = int(os.environ.get("REQUEST_CACHE_MAX_ENTRIES", "1024"))
+
+
+def normalize_url(url: str, params: Dict[str, object] = None) -> str:
+    # same key for the same query, whatever the order of the query parameters and whether they are in the url or in params
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + [(key, str(value)) for key, value in (params or {}).items()]
+    return "%s://%s%s?%s" % (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), urlencode(sorted(query)))
+
+
+def credential_identity(*credentials) -> str:
+    """
+    Short hash identifying the credentials of a request (e.g. the Authorization header, or the auth params and credential
+    of a component), for the cache keys : callers with different credentials never share a response.
+    """
+    payload = json.dumps(list(credentials), sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class RequestCache:
+    """
+    Short-lived cache of upstream responses (opencost, Prometheus, Azure Monitor), shared by the impact nodes of the process.
+    Concurrent identical requests share a single in-flight fetch (single flight), and the result is then reused until its TTL.
+    Errors are not cached.
+    """
+
+    def __init__(self, ttl: float = REQUEST_CACHE_TTL, max_entries: int = REQUEST_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.inflight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable], ttl: float = None, cacheable: Callable[[object], bool] = None):
+        """
+        :param key: normalized request key, e.g. normalize_url(url, params).
+        :param fetch: coroutine function fetching the response on a miss.
+        :param cacheable: tells whether a response can be cached (e.g. only the 200 responses) ; by default all of them.
+        """
+        loop = asyncio.get_running_loop()
+        # in-flight fetches are per event loop, as their futures
+        inflight_key = (id(loop), key)
+        while True:
+            entry = self.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+
+            future = self.inflight.get(inflight_key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                current_task = asyncio.current_task()
+                if future.cancelled() and not (hasattr(current_task, "cancelling") and current_task.cancelling()):
+                    # the leader was cancelled (e.g. by the timeout of its component), not this waiter : retry, one of the waiters becomes the leader
+                    continue
+                raise
+
+        self.misses += 1
+        future = loop.create_future()
+        self.inflight[inflight_key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            # the cancellation of the leader is not propagated to the waiters, which retry
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # the exception is retrieved by the waiters, if any
+            future.exception()
+            raise
+        else:
+            if cacheable is None or cacheable(value):
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                future.cancel()
+            if self.inflight.get(inflight_key) is future:
+                del self.inflight[inflight_key]
+
+
+_request_cache = None
+_request_cache_lock = threading.Lock()
+
+
+def get_request_cache() -> RequestCache:
+    # process-wide cache, shared by the impact nodes
+    global _request_cache
+    with _request_cache_lock:
+        if _request_cache is None:
+            _request_cache = RequestCache()
+        return _request_cache
@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, Tuple
+from functools import lru_cache
+import csv
+import os
+
+
+STATIC_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static_data")
+
+DEFAULT_TDP = 180  # default value for unknown VM SKUs
+DEFAULT_INSTANCE_VCPUS = 2
+DEFAULT_TOTAL_VCPUS = 16
+DEFAULT_INSTANCE_MEMORY = 0.0
+DEFAULT_TE = 1200
+
+
+def normalize(value: str) -> str:
+    return (value or "").replace(" ", "").lower()
+
+
+def parse_vcpus(value: str):
+    # constrained vCPU SKUs have fractional values in the data set (e.g. 0.5)
+    vcpus = float(value)
+    return int(vcpus) if vcpus.is_integer() else vcpus
+
+
+class SkuRecord:
+    """
+    Static params of a VM SKU, as found in the static data files (or the defaults for unknown SKUs).
+    """
+    __slots__ = ("vm_sku", "tdp", "instance_vcpus", "total_vcpus", "instance_memory", "te")
+
+    def __init__(self, vm_sku: str, tdp: float, instance_vcpus: int, total_vcpus: float, instance_memory: float, te: float):
+        self.vm_sku = vm_sku
+        self.tdp = tdp
+        self.instance_vcpus = instance_vcpus
+        self.total_vcpus = total_vcpus
+        self.instance_memory = instance_memory
+        self.te = te
+
+
+class SkuCatalog:
+    """
+    In-memory catalog of the VM SKUs static data : azure_vm_tdp.csv, ccf_azure_instances.csv and ccf_coefficients-azure-embodied.csv
+    are read once, and indexed by normalized key (no spaces, lower case) for O(1) lookups.
+    """
+
+    def __init__(self, data_dir: str = STATIC_DATA_DIR):
+        self.data_dir = data_dir
+        self.tdp_index = {}
+        self.resources_index = {}
+        self.te_index = {}
+        self._records = {}
+        self.load()
+
+    def load(self) -> None:
+        with open(os.path.join(self.data_dir, 'azure_vm_tdp.csv'), newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                # families without a known TDP fall back to the default value
+                if not row['TDP (W)'].strip():
+                    continue
+                # the first row of a SKU family wins, as with the previous line scan
+                self.tdp_index.setdefault(normalize(row['VM sku family']), float(row['TDP (W)']))
+
+        with open(os.path.join(self.data_dir, 'ccf_azure_instances.csv'), newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                self.resources_index.setdefault(normalize(row['Virtual Machine']), (
+                    parse_vcpus(row['Instance vCPUs']),
+                    float(row['Platform vCPUs (highest vCPU possible)']),
+                    float(row['Instance Memory'])
+                ))
+
+        with open(os.path.join(self.data_dir, 'ccf_coefficients-azure-embodied.csv'), newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                self.te_index.setdefault(normalize(row['type']), float(row['total']))
+
+        self._records = {}
+
+    def tdp(self, vm_sku: str) -> float:
+        return self.tdp_index.get(normalize(vm_sku), DEFAULT_TDP)
+
+    def resources(self, vm_sku: str) -> Tuple[int, float, float]:
+        # e.g. Standard_D2_v2 -> D2v2, matched against the "Virtual Machine" column
+        vm_sku_short = ''.join((vm_sku or "").split('_')[1:])
+        return self.resources_index.get(normalize(vm_sku_short), (DEFAULT_INSTANCE_VCPUS, DEFAULT_TOTAL_VCPUS, DEFAULT_INSTANCE_MEMORY))
+
+    def te(self, vm_sku: str) -> float:
+        # e.g. Standard_D2_v2 -> D2, matched against the "type" column
+        parts = (vm_sku or "").split('_')
+        if len(parts) < 2:
+            return DEFAULT_TE
+        return self.te_index.get(normalize(parts[1]), DEFAULT_TE)
+
+    def lookup(self, vm_sku: str) -> SkuRecord:
+        record = self._records.get(vm_sku)
+        if record is None:
+            instance_vcpus, total_vcpus, instance_memory = self.resources(vm_sku)
+            record = SkuRecord(vm_sku, self.tdp(vm_sku), instance_vcpus, total_vcpus, instance_memory, self.te(vm_sku))
+            self._records[vm_sku] = record
+        return record
+
+    def lookup_many(self, vm_skus: Iterable[str]) -> Dict[str, SkuRecord]:
+        # batch lookup : each distinct SKU is resolved once
+        return {vm_sku: self.lookup(vm_sku) for vm_sku in set(vm_skus)}
+
+
+@lru_cache(maxsize=None)
+def get_sku_catalog() -> SkuCatalog:
+    # process-wide catalog, loaded on first use
+    return SkuCatalog()
@@ -0,0 +1,69 @@
+from typing import Dict
+import warnings
+
+import numpy as np
+
+from lib.ief.core import CarbonIntensityPluginInterface, ImpactModelPluginInterface
+from lib.ief.impact_frame import ImpactFrame
+
+
+async def attribute_frame(host_frame: ImpactFrame, host_node_names: Dict[str, str], observations: Dict[str, dict], host_static_params: Dict[str, dict], host_node_model: ImpactModelPluginInterface, carbon_intensity_provider: CarbonIntensityPluginInterface = None, static_params: Dict[str, dict] = None, metadata: Dict[str, dict] = None, timespan: str = "PT1H", interval: str = "PT5M") -> ImpactFrame:
+    """
+    Vectorized version of AttributedImpactNodeInterface.calculate, for all the resources hosted by the nodes of host_frame
+    (e.g. the pods of a cluster) : the host static params are read once per node, joined to the resources by node index,
+    and E_CPU, E_MEM and M are computed for all the resources in one pass of the host node model.
+
+    :param host_frame: impacts of the host nodes.
+    :param host_node_names: resource name -> host node name ; the resources whose host node is not in host_frame, or without observations, are skipped.
+    :param host_static_params: static params per host node name.
+    :param host_node_model: model of the host nodes, with a calculate_batch method.
+    :return: the attributed impacts, with host_frame as host frame.
+    """
+    static_params = static_params if static_params is not None else {}
+    host_index = {host_name: index for index, host_name in enumerate(host_frame.names)}
+    names = [name for name, host_name in host_node_names.items() if host_name in host_index and name in observations]
+    size = len(names)
+
+    # host columns, one value per node, then gathered per resource by node index
+    host_params = [host_static_params.get(host_name, {}) for host_name in host_frame.names]
+    host_tdp = np.array([params.get("vm_sku_tdp", 200) for params in host_params], dtype=float)
+    host_te = np.array([params.get("te", 1200) for params in host_params], dtype=float)
+    host_total_vcpus = np.array([params.get("total_vcpus", 4) for params in host_params], dtype=float)
+    hosts = np.fromiter((host_index[host_node_names[name]] for name in names), dtype=np.int64, count=size)
+
+    cpu_util = np.empty(size)
+    memory_gb = np.empty(size)
+    rr = np.empty(size)
+    tr = np.empty(size)
+    for index, name in enumerate(names):
+        resource_observations = observations[name]
+        cpu_util[index] = resource_observations.get("average_cpu_percentage", 0)
+        memory_gb[index] = resource_observations.get("memory_gb", 0)
+        rr[index] = resource_observations.get("rr", 1)
+        resource_tr = resource_observations.get("tr", None)
+        tr[index] = np.nan if resource_tr is None else resource_tr
+
+    tdp = host_tdp[hosts]
+    for index, name in enumerate(names):
+        static_params.setdefault(name, {})["host_sku_tdp"] = float(tdp[index])
+
+    # no GPU attribution for now : E_GPU is 0
+    if any(observations[name].get("series") for name in names):
+        # time-resolved mode : per-interval energy x per-interval carbon intensity
+        columns = {"cpu_util": cpu_util, "memory_gb": memory_gb, "gpu_util": np.zeros(size)}
+        grid, series = host_node_model.series_columns(names, observations, columns)
+        carbon_intensity = await host_node_model.carbon_intensity_series(carbon_intensity_provider, grid, interval=interval)
+        results = host_node_model.calculate_series_batch(series["cpu_util"], series["memory_gb"], None, series["valid"], rr, tdp, host_te[hosts], host_total_vcpus[hosts], tr=tr, carbon_intensity=carbon_intensity, timespan=timespan)
+    else:
+        # the carbon intensity is read once for all the resources
+        if carbon_intensity_provider is None:
+            warnings.warn("Carbon Intensity Provider is not set, using default value of 100")
+            carbon_intensity = 100
+        else:
+            CI = await carbon_intensity_provider.get_current_carbon_intensity()
+            carbon_intensity = CI["value"]
+        results = host_node_model.calculate_batch(cpu_util=cpu_util, memory_gb=memory_gb, rr=rr, tdp=tdp, te=host_te[hosts], total_vcpus=host_total_vcpus[hosts], tr=tr, carbon_intensity=float(carbon_intensity), timespan=timespan)
+
+    frame = ImpactFrame(names, results, type="attributedimpactnode", model="attributedimpactfromnode", timespan=timespan, interval=interval, observations=observations, static_params=static_params, metadata=metadata, host_nodes={name: host_node_names[name] for name in names})
+    frame.host_frame = host_frame
+    return frame
@@ -2,6 +2,14 @@ from abc import ABC, abstractmethod
 from typing import Dict, List
 from pydantic import BaseModel
 from azure.mgmt.monitor.models import MetricAggregationType
+from datetime import datetime
+import asyncio
+import os
+
+
+AGGREGATION_MAX_CONCURRENCY = int(os.environ.get("AGGREGATION_MAX_CONCURRENCY", "4")) # components of an aggregated impact node calculated concurrently
+AGGREGATION_COMPONENT_TIMEOUT = float(os.environ.get("AGGREGATION_COMPONENT_TIMEOUT", "300")) # seconds
+AGGREGATION_PLAN = os.environ.get("AGGREGATION_PLAN", "true").lower() == "true" # fetch the resources shared by several components once (see lib.ief.planner)
 
 class AuthParams(ABC):
     @abstractmethod
@@ -113,6 +121,7 @@ class ImpactNodeInterface(ABC):
         self.observations = None
         self.interval = interval
         self.timespan = timespan
+        self.window_end = None # end of the timespan (datetime), now when None
         self.params = params
 
     # def run(self) -> Dict[str, object]:
@@ -147,6 +156,11 @@ class ImpactNodeInterface(ABC):
         await self.fetch_observations()
         return await self.inner_model.calculate(observations=self.observations, carbon_intensity=carbon_intensity, timespan=self.timespan, interval= self.interval, metadata=self.metadata)
 
+    async def calculate_frame(self, carbon_intensity : CarbonIntensityPluginInterface  = None) -> 'ImpactFrame':
+        # columnar version of calculate ; components that can compute an ImpactFrame directly override this
+        from lib.ief.impact_frame import ImpactFrame
+        return ImpactFrame.from_metrics(await self.calculate(carbon_intensity=carbon_intensity))
+
     def model_identifier(self) -> str:
         return self.inner_model.model_identifier()
 
@@ -156,7 +170,7 @@ class ImpactNodeInterface(ABC):
 
 
 class AggregatedImpactNodesInterface(ABC):
-    def __init__(self, name, components : List[ImpactNodeInterface], carbon_intensity_provider: CarbonIntensityPluginInterface = None, type=None, model=None, auth_object: AuthParams = {}, resource_selectors: Dict[str, List[str]] = {}, metadata: Dict[str, object] = {}, interval : str = "PT5M", timespan : str = "PT1H" ):
+    def __init__(self, name, components : List[ImpactNodeInterface], carbon_intensity_provider: CarbonIntensityPluginInterface = None, type=None, model=None, auth_object: AuthParams = {}, resource_selectors: Dict[str, List[str]] = {}, metadata: Dict[str, object] = {}, interval : str = "PT5M", timespan : str = "PT1H", max_concurrency : int = AGGREGATION_MAX_CONCURRENCY, component_timeout : float = AGGREGATION_COMPONENT_TIMEOUT, plan : bool = AGGREGATION_PLAN, window_end : datetime = None, planner = None ):
         self.components = components  
         self.resource_selectors = resource_selectors
         self.metadata = metadata
@@ -167,6 +181,13 @@ class AggregatedImpactNodesInterface(ABC):
         self.auth_object = auth_object
         self.interval = interval
         self.timespan = timespan
+        self.max_concurrency = max_concurrency # max number of components calculated concurrently
+        self.component_timeout = component_timeout # seconds, per component
+        self.plan = plan
+        self.shared_planner = planner # ImpactPlanner shared with other aggregated impact nodes (e.g. the apps of a batch), instead of one per calculation
+        self.planner = None
+        self.window_end = window_end # end of the timespan of the components, now when None
+        self.errors = {} # component index -> error
 
 
     def authenticate(self, auth_params: Dict[str, object]) -> None:
@@ -185,36 +206,97 @@ class AggregatedImpactNodesInterface(ABC):
         #lookup the static params for the model, corresponding to the fetched resources
         pass
 
-    def calculate(self, carbon_intensity: CarbonIntensityPluginInterface  = None) -> Dict[str, SCIImpactMetricsInterface]:
-        # Calculate the metrics for each child component and sum their metrics
-        resource_metrics = {}
-        metrics_list = []
-        node_metrics = []
+    async def calculate_component(self, component: ImpactNodeInterface, semaphore: asyncio.Semaphore) -> 'ImpactFrame':
+        # a component fetches its resources, static params and observations in calculate_frame, or reads them from the planned shared steps
+        async with semaphore:
+            if self.planner is not None:
+                return await asyncio.wait_for(self.planner.calculate_frame(component), timeout=self.component_timeout)
+            return await asyncio.wait_for(component.calculate_frame(carbon_intensity=self.carbon_intensity_provider), timeout=self.component_timeout)
+
+    def component_error(self, component: ImpactNodeInterface, error: BaseException) -> str:
+        if isinstance(error, asyncio.TimeoutError):
+            message = f"Timeout after {self.component_timeout} seconds"
+        else:
+            message = f"{type(error).__name__}: {error}"
+        print(f"Error calculating component {component.name} of {self.name} : {message}")
+        return message
+
+    def failed_components(self) -> Dict[str, str]:
+        # errors per component name, for display ; components with the same name are told apart by their index
+        names = [component.name for component in self.components]
+        return {(names[index] if names.count(names[index]) == 1 else "%s[%s]" % (names[index], index)): error for index, error in sorted(self.errors.items())}
+
+    def prepare_components(self) -> None:
+        # the components are calculated over the window of the aggregated impact node
         for component in self.components:
-            print (component)
-            component.fetch_resources()
-            
             component.interval = self.interval
             component.timespan = self.timespan
-            component.fetch_observations()
-
-            carbon_intensity_provider = self.carbon_intensity_provider
-            impact_metrics = component.calculate(carbon_intensity=carbon_intensity_provider)
-
-            node_metrics.append(impact_metrics)
-            for node_name, node_impact_metric in impact_metrics.items():
-            # store the component in the dict
-                metrics_list.append(node_impact_metric)
-
-        print(metrics_list)
-        # Calculate the total metrics for the aggregated component
-        E_CPU = sum(component.E_CPU for component in metrics_list)
-        E_MEM = sum(component.E_MEM for component in metrics_list)
-        E_GPU = sum(component.E_GPU for component in metrics_list)
-        E = sum(component.E for component in metrics_list)
-        I = carbon_intensity
-        M = sum(component.M for component in metrics_list)
-        SCI = sum(component.SCI for component in metrics_list)
+            component.window_end = self.window_end
+
+    async def iter_frames(self):
+        """
+        Calculates the components concurrently, at most max_concurrency at a time, each within component_timeout,
+        and yields them as they complete.
+        A failed (or timed out) component does not fail the others : its error is reported in self.errors, by component index.
+
+        :return: async iterator of (component index, component, impact frame), with a None frame for the failed components.
+        """
+        self.prepare_components()
+        if self.shared_planner is not None:
+            self.planner = self.shared_planner
+        elif self.plan:
+            from lib.ief.planner import ImpactPlanner
+            self.planner = ImpactPlanner(self.components)
+
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        self.errors = {}
+
+        async def calculate(index, component):
+            try:
+                return index, component, await self.calculate_component(component, semaphore), None
+            except Exception as error:
+                return index, component, None, error
+
+        tasks = [asyncio.ensure_future(calculate(index, component)) for index, component in enumerate(self.components)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                index, component, frame, error = await next_result
+                if error is not None:
+                    self.errors[index] = self.component_error(component, error)
+                yield index, component, frame
+        finally:
+            # the consumer stopped early (e.g. a closed stream)
+            for task in tasks:
+                task.cancel()
+
+    async def calculate_frames(self) -> List['ImpactFrame']:
+        """
+        Calculates the components concurrently (see iter_frames).
+
+        :return: the impact frames of the successful components, in the order of the components (several components may have the same name).
+        """
+        frames = {}
+        async for index, component, frame in self.iter_frames():
+            if frame is not None:
+                frames[index] = frame
+        return [frames[index] for index in sorted(frames)]
+
+    async def calculate(self, carbon_intensity: CarbonIntensityPluginInterface  = None) -> Dict[str, SCIImpactMetricsInterface]:
+        # Calculate the metrics for each child component and sum their metrics
+        from lib.ief.impact_frame import ImpactFrame
+        component_frames = await self.calculate_frames()
+
+        # Calculate the total metrics for the aggregated component, from the metric columns of all the components
+        frame = ImpactFrame.concat(component_frames)
+        totals = frame.totals()
+        E_CPU = totals["E_CPU"]
+        E_MEM = totals["E_MEM"]
+        E_GPU = totals["E_GPU"]
+        E = totals["E"]
+        # energy weighted carbon intensity of the components
+        I = float((frame.column("E") * frame.column("I")).sum() / E) if E > 0 else (float(frame.column("I").mean()) if len(frame) else 0.0)
+        M = totals["M"]
+        SCI = totals["SCI"]
 
         # Create a new SCIImpactMetricsInterface instance with the calculated metrics
         aggregated_metrics = {
@@ -232,9 +314,13 @@ class AggregatedImpactNodesInterface(ABC):
             'SCI': float(SCI)
         }
         aggregated_metadata = {'aggregated': "True"}
+        if self.errors:
+            # partial result : the totals only sum the successful components
+            aggregated_metadata['failed_components'] = self.failed_components()
         aggregated_observations = {}
         static_params = {}
-        aggregated_components = node_metrics
+        # the per-resource objects are only materialized here, for serialization
+        aggregated_components = [impact_frame.to_metrics() for impact_frame in component_frames]
 
         print(aggregated_metrics)
         toto = {}
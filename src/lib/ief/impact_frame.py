@@ -0,0 +1,174 @@
+from typing import Dict, Iterable, List
+import sys
+
+import numpy as np
+
+from lib.ief.core import SCIImpactMetricsInterface
+
+
+METRIC_COLUMNS = ["E_CPU", "E_MEM", "E_GPU", "E", "I", "M", "SCI"]
+
+
+class LabelColumn:
+    """
+    A column of string labels, stored as integer codes into a list of interned categories.
+    """
+    __slots__ = ("codes", "categories")
+
+    def __init__(self, values: Iterable[str] = ()):
+        index = {}
+        categories = []
+        codes = []
+        for value in values:
+            value = sys.intern(str(value)) if value is not None else ""
+            code = index.get(value)
+            if code is None:
+                code = len(categories)
+                index[value] = code
+                categories.append(value)
+            codes.append(code)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.categories = categories
+
+    @classmethod
+    def constant(cls, value: str, size: int) -> 'LabelColumn':
+        column = cls()
+        column.categories = [sys.intern(str(value))]
+        column.codes = np.zeros(size, dtype=np.int32)
+        return column
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.categories[self.codes[index]]
+
+    def __iter__(self):
+        categories = self.categories
+        return (categories[code] for code in self.codes)
+
+    def take(self, indices: np.ndarray) -> 'LabelColumn':
+        column = LabelColumn()
+        column.categories = self.categories
+        column.codes = self.codes[indices]
+        return column
+
+
+class ImpactFrame:
+    """
+    Columnar impact results for a set of resources : one float array per SCI metric, plus interned label columns.
+    The per-resource observations, static params and metadata dicts are referenced (not copied), and only used
+    when the results are materialized as SCIImpactMetricsInterface objects (see to_metrics).
+    """
+
+    def __init__(self, names: List[str], metrics: Dict[str, np.ndarray], type: str = "impactnode", model: str = "SCI Impact Model", timespan: str = "PT1H", interval: str = "PT5M", labels: Dict[str, LabelColumn] = None, observations: Dict[str, dict] = None, static_params: Dict[str, dict] = None, metadata: Dict[str, dict] = None, host_nodes: Dict[str, str] = None):
+        size = len(names)
+        self.names = list(names)
+        self.metrics = {column: np.asarray(metrics.get(column, np.zeros(size)), dtype=float) for column in METRIC_COLUMNS}
+        self.timespan = timespan
+        self.interval = interval
+        self.labels = {
+            "name": LabelColumn(self.names),
+            "type": LabelColumn.constant(type, size),
+            "model": LabelColumn.constant(model, size),
+        }
+        self.labels.update(labels or {})
+        self.observations = observations if observations is not None else {}
+        self.static_params = static_params if static_params is not None else {}
+        self.metadata = metadata if metadata is not None else {}
+        # pod name -> host node name, for attributed impacts
+        self.host_nodes = host_nodes if host_nodes is not None else {}
+        self.host_frame = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def column(self, metric: str) -> np.ndarray:
+        return self.metrics[metric]
+
+    def label(self, key: str, index: int) -> str:
+        if key in ("timespan", "interval"):
+            return getattr(self, key)
+        if key not in self.labels:
+            # labels that are not stored as columns are read from the resource metadata, once for the whole frame
+            self.labels[key] = LabelColumn(self.metadata.get(name, {}).get(key, "") for name in self.names)
+        return self.labels[key][index]
+
+    def totals(self) -> Dict[str, float]:
+        return {metric: float(values.sum()) for metric, values in self.metrics.items()}
+
+    def row(self, index: int) -> Dict[str, object]:
+        row = {key: self.label(key, index) for key in ("name", "type", "model", "timespan", "interval")}
+        for metric, values in self.metrics.items():
+            row[metric] = float(values[index])
+        return row
+
+    def to_metrics(self) -> Dict[str, SCIImpactMetricsInterface]:
+        # materialize the pydantic result objects, e.g. when the API needs to serialize them
+        host_metrics = self.host_frame.to_metrics() if self.host_frame is not None else {}
+        resource_metrics = {}
+        for index, name in enumerate(self.names):
+            host_node_name = self.host_nodes.get(name)
+            host_node = {host_node_name: host_metrics[host_node_name]} if host_node_name in host_metrics else {}
+            resource_metrics[name] = SCIImpactMetricsInterface(
+                metrics=self.row(index),
+                metadata=self.metadata.get(name, {}),
+                observations=self.observations.get(name, {}),
+                static_params=self.static_params.get(name, {}),
+                components_list=[],
+                host_node=host_node
+            )
+        return resource_metrics
+
+    @classmethod
+    def from_metrics(cls, resource_metrics: Dict[str, SCIImpactMetricsInterface]) -> 'ImpactFrame':
+        # build a frame from already materialized SCIImpactMetricsInterface objects
+        values = list(resource_metrics.values())
+        names = list(resource_metrics.keys())
+        metrics = {column: np.fromiter((getattr(value, column) for value in values), dtype=float, count=len(values)) for column in METRIC_COLUMNS}
+        frame = cls(
+            names,
+            metrics,
+            labels={
+                "name": LabelColumn(value.name for value in values),
+                "type": LabelColumn(value.type for value in values),
+                "model": LabelColumn(value.model for value in values),
+            },
+            timespan=values[0].timespan if values else "PT1H",
+            interval=values[0].interval if values else "PT5M",
+            observations={name: value.observations for name, value in resource_metrics.items()},
+            static_params={name: value.static_params for name, value in resource_metrics.items()},
+            metadata={name: value.metadata for name, value in resource_metrics.items()}
+        )
+        # attributed impacts (e.g. AKSPod) : the host node metrics of the resources become the host frame, shared by the resources of a node
+        host_metrics = {}
+        for name, value in resource_metrics.items():
+            for host_node_name, host_node in (value.host_node or {}).items():
+                frame.host_nodes[name] = host_node_name
+                host_metrics.setdefault(host_node_name, host_node)
+        if host_metrics:
+            frame.host_frame = cls.from_metrics(host_metrics)
+        return frame
+
+    @classmethod
+    def concat(cls, frames: List['ImpactFrame']) -> 'ImpactFrame':
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return cls([], {})
+        names = [name for frame in frames for name in frame.names]
+        metrics = {column: np.concatenate([frame.metrics[column] for frame in frames]) for column in METRIC_COLUMNS}
+        frame = cls(
+            names,
+            metrics,
+            labels={
+                "type": LabelColumn(value for frame in frames for value in frame.labels["type"]),
+                "model": LabelColumn(value for frame in frames for value in frame.labels["model"]),
+            },
+            timespan=frames[0].timespan,
+            interval=frames[0].interval
+        )
+        for part in frames:
+            frame.observations.update(part.observations)
+            frame.static_params.update(part.static_params)
+            frame.metadata.update(part.metadata)
+        return frame
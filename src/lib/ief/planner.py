@@ -0,0 +1,133 @@
+from typing import Awaitable, Callable, Dict, List
+import asyncio
+import copy
+import json
+
+from lib.components.request_cache import credential_identity
+
+
+def canonical(selectors: Dict[str, object]) -> str:
+    # same key for the same selectors, whatever their order
+    return json.dumps(selectors or {}, sort_keys=True, default=str)
+
+
+def fetch_identity(component) -> str:
+    # components share fetches only with the same credential and window
+    identity = getattr(component, "credential_identity", None)
+    credential = identity() if callable(identity) else credential_identity(getattr(component, "auth_object", None))
+    window_end = getattr(component, "window_end", None)
+    return "%s|%s" % (credential, window_end.isoformat() if window_end is not None else "now")
+
+
+class PlanNode:
+    __slots__ = ("key", "deps", "run")
+
+    def __init__(self, key: str, deps: List[str], run: Callable[..., Awaitable]):
+        self.key = key
+        self.deps = deps
+        self.run = run # called with the results of the deps, in order
+
+
+class ImpactPlanner:
+    """
+    Plans the calculation of a set of impact nodes (e.g. the components of an app) as a DAG of fetch and calculate steps,
+    where the steps shared by several components are planned (and run) once :
+
+    - components with filter_selectors (AzureVM, AKSNode) are grouped by class, credential, window and scope (the selectors
+      that are not filters, e.g. the subscription or the cluster). Identical selectors are resolved once, and the static params and observations
+      of the union of the resources of a group are fetched once ; each component is then calculated on its own resources.
+    - components with a node_snapshot (KubernetesNode, KubernetesPod) share one node snapshot per cluster.
+    - the other components are calculated on their own.
+    """
+
+    def __init__(self, components: List[object]):
+        self.nodes: Dict[str, PlanNode] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.component_keys = {}
+        for component in components:
+            self.component_keys[id(component)] = self.plan_component(component)
+
+    def add(self, key: str, deps: List[str], run: Callable[..., Awaitable]) -> PlanNode:
+        node = self.nodes.get(key)
+        if node is None:
+            node = PlanNode(key, list(deps), run)
+            self.nodes[key] = node
+        return node
+
+    def plan_component(self, component) -> str:
+        impact_key = "impact|%s|%s" % (component.name, id(component))
+        filter_selectors = getattr(component, "filter_selectors", None)
+
+        if filter_selectors is not None:
+            scope = {key: value for key, value in component.resource_selectors.items() if key not in filter_selectors}
+            group = "%s|%s|%s|%s|%s" % (type(component).__name__, canonical(scope), component.interval, component.timespan, fetch_identity(component))
+            resources_key = "resources|%s|%s" % (group, canonical(component.resource_selectors))
+            self.add(resources_key, [], lambda component=component: component.fetch_resources())
+            observations = self.add("observations|%s" % group, [], lambda *resources, component=component: self.fetch_observations(component, resources))
+            if resources_key not in observations.deps:
+                observations.deps.append(resources_key)
+            self.add(impact_key, [resources_key, observations.key], lambda resources, fetcher, component=component: self.calculate_from_fetcher(component, resources, fetcher))
+
+        elif hasattr(component, "node_snapshot"):
+            if component.node_snapshot is not None:
+                self.add(impact_key, [], lambda component=component: component.calculate_frame())
+            else:
+                selectors = {key: component.resource_selectors.get(key) for key in ("subscription_id", "resource_group", "cluster_name", "prometheus_endpoint", "incremental_observations", "time_resolved")}
+                snapshot_key = "snapshot|%s|%s|%s|%s" % (canonical(selectors), component.interval, component.timespan, fetch_identity(component))
+                self.add(snapshot_key, [], lambda component=component: self.node_snapshot(component))
+                self.add(impact_key, [snapshot_key], lambda snapshot, component=component: self.calculate_with_snapshot(component, snapshot))
+
+        else:
+            self.add(impact_key, [], lambda component=component: component.calculate_frame())
+
+        return impact_key
+
+    async def fetch_observations(self, component, resources: List[Dict[str, object]]):
+        # static params and observations of the union of the resources of a group, fetched once by a copy of one of its components
+        fetcher = copy.copy(component)
+        fetcher.resources = {}
+        for component_resources in resources:
+            fetcher.resources.update(component_resources)
+        fetcher.static_params = {}
+        fetcher.observations = {}
+        if hasattr(fetcher, "metric_points"):
+            fetcher.metric_points = {}
+        if fetcher.resources:
+            await fetcher.lookup_static_params()
+            await fetcher.fetch_observations()
+        print("planner : observations of %s resources fetched once for %s" % (len(fetcher.resources), component.name))
+        return fetcher
+
+    async def calculate_from_fetcher(self, component, resources: Dict[str, object], fetcher):
+        # the component is calculated on its own resources, from the shared static params and observations
+        component.resources = resources
+        component.static_params = {name: fetcher.static_params[name] for name in resources if name in fetcher.static_params}
+        component.observations = {name: fetcher.observations[name] for name in resources if name in fetcher.observations}
+        return await component.inner_model.calculate_frame(component.observations, carbon_intensity=component.carbon_intensity_provider, interval=component.interval, timespan=component.timespan, metadata=component.metadata, static_params=component.static_params)
+
+    async def node_snapshot(self, component):
+        from lib.components.kubernetes.node_snapshot import KubernetesNodeSnapshot
+        # the snapshot is refreshed once, by its first reader
+        return KubernetesNodeSnapshot.for_impact_node(component)
+
+    async def calculate_with_snapshot(self, component, snapshot):
+        component.node_snapshot = snapshot
+        return await component.calculate_frame()
+
+    async def run_node(self, node: PlanNode):
+        results = await asyncio.gather(*[self.result(dep) for dep in node.deps])
+        return await node.run(*results)
+
+    async def result(self, key: str):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.run_node(self.nodes[key]))
+            self.tasks[key] = task
+        # a consumer that is cancelled (e.g. on timeout) does not cancel the shared step
+        return await asyncio.shield(task)
+
+    async def calculate_frame(self, component):
+        """
+        :return: the ImpactFrame of a planned component.
+        """
+        return await self.result(self.component_keys[id(component)])
@@ -1,13 +1,47 @@
 from lib.ief.core import ImpactModelPluginInterface, SCIImpactMetricsInterface
 from lib.ief.core import CarbonIntensityPluginInterface
-from typing import Dict, List
+from lib.ief.impact_frame import ImpactFrame
+from typing import Dict, List, Tuple
 
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import re
 from isoduration import parse_duration
+import numpy as np
 import warnings
 
 
+EL_HOURS = 35040  # expected lifespan of the equipment, in hours (4 years)
+ENERGY_PER_GB = 0.38  # Watt per GB
+
+
+@lru_cache(maxsize=64)
+def timespan_to_hours(timespan: str) -> float:
+    # from the total duration, so that the days and seconds parts count as well (e.g. P1D, PT90S)
+    duration = parse_duration(timespan)
+    return ((datetime(2000, 1, 1) + duration) - datetime(2000, 1, 1)).total_seconds() / 3600.0
+
+
+@lru_cache(maxsize=64)
+def timespan_to_whole_hours(timespan: str) -> float:
+    # the GPU model only uses the hours component of the timespan
+    return float(parse_duration(timespan).time.hours)
+
+
+def tdp_coefficients(utilization: np.ndarray) -> np.ndarray:
+    # vectorized version of the utilization -> TDP coefficient table used by calculate_ecpu and calculate_egpu
+    return np.select(
+        [
+            utilization == 0,
+            (utilization > 0) & (utilization < 10),
+            (utilization >= 10) & (utilization < 50),
+            (utilization >= 50) & (utilization < 100),
+        ],
+        [0.0, 0.12, 0.32, 0.75],
+        default=1.02,
+    )
+
+
 class ComputeServer_STATIC_IMP(ImpactModelPluginInterface):
     def __init__(self):
         super().__init__()
@@ -47,17 +81,7 @@ class ComputeServer_STATIC_IMP(ImpactModelPluginInterface):
 
         if tr is None:
         # we assume the software has been running during the whole timespan
-        # for practical calculation, we convert to minutes first, to avoid gettting 0 hours for small durations as 5 minutes using direct hours conversion.
-            duration = parse_duration(timespan)
-            duration_in_minutes = float(duration.time.minutes)
-            duration_in_hours = duration_in_minutes / 60.0
-
-            if hasattr(duration.time, 'hours'):
-                duration_in_hours += float(duration.time.hours)
-
-            if hasattr(duration.time, 'days'):
-                duration_in_hours += float(duration.time.days) * 24.0
-            
+            duration_in_hours = timespan_to_hours(timespan)
         else:
             duration_in_hours = tr
         
@@ -71,18 +95,7 @@ class ComputeServer_STATIC_IMP(ImpactModelPluginInterface):
             warnings.warn("RAM size must be a positive number")
             return 0
 
-        duration = parse_duration(timespan)
-        duration_in_minutes = float(duration.time.minutes)
-        duration_in_hours = duration_in_minutes / 60.0
-
-        if hasattr(duration.time, 'hours'):
-            duration_in_hours += float(duration.time.hours)
-
-        if hasattr(duration.time, 'days'):
-            duration_in_hours += float(duration.time.days) * 24.0
-
-
-        energy_per_gb = 0.38  # Watt per GB
+        energy_per_gb = ENERGY_PER_GB
 
         energy_consumption = energy_per_gb * ram_size_gb_during_timespan / 1000 # kWh per GB * GB = kWh
         return energy_consumption
@@ -108,8 +121,7 @@ class ComputeServer_STATIC_IMP(ImpactModelPluginInterface):
 
 
         power_consumption = tdp * tdp_coefficient
-        duration = parse_duration(timespan)
-        duartion_in_hours = float(duration.time.hours)
+        duartion_in_hours = timespan_to_whole_hours(timespan)
         energy_consumption = gpu_count * (power_consumption * duartion_in_hours / 1000) # W * H / 1000 = KWH
         return energy_consumption
 
@@ -124,25 +136,14 @@ class ComputeServer_STATIC_IMP(ImpactModelPluginInterface):
             warnings.warn(f"TR is not set. we assume software was always running for the given timespan : {timespan}")
             tr = 1  # initial value is 1 hour , if non is found below
             
-            # we convert to minutes first, to avoid gettting 0 hours for small durations as 5 minutes using direct hours conversion.
-            duration = parse_duration(timespan)
-            duration_in_minutes = float(duration.time.minutes)
-            duration_in_hours = duration_in_minutes / 60.0
-
-            if hasattr(duration.time, 'hours'):
-                duration_in_hours += float(duration.time.hours)
-
-            if hasattr(duration.time, 'days'):
-                duration_in_hours += float(duration.time.days) * 24.0
-
-
+            duration_in_hours = timespan_to_hours(timespan)
             if duration_in_hours : tr = duration_in_hours
 
         else :
             tr = tr
 
         # EL: Expected lifespan of the equipment
-        el = 35040  # hours (4 years)
+        el = EL_HOURS  # hours (4 years)
 
         # RR: Resources reserved for use by the software
         rr = rr # vCPUs
@@ -163,78 +164,231 @@ class ComputeServer_STATIC_IMP(ImpactModelPluginInterface):
 
         return m
 
-    async def calculate(self, observations, carbon_intensity: CarbonIntensityPluginInterface= None, timespan : str = "PT1H", interval = 'PT5M', metadata : dict [str, object] = {}, static_params : dict[str, object]= {} ) -> dict[str, SCIImpactMetricsInterface]:
-        # Create an empty dictionary to store the metrics for each resource
-        resource_metrics = {}
-
-        if carbon_intensity is None:
-            warnings.warn("Carbon intensity provider is not set. Using static value of 100 gCO2e/kWh")
-            CI = 100
-        else:
-            CI = await carbon_intensity.get_current_carbon_intensity()
-            CI = CI["value"]
+    def calculate_batch(self, cpu_util, memory_gb, rr, tdp, te, total_vcpus, tr=None, gpu_util=None, carbon_intensity=100, timespan : str = "PT1H") -> Dict[str, np.ndarray]:
+        """
+        Vectorized version of calculate_ecpu, calculate_emem, calculate_egpu and calculate_m, for a whole fleet of resources.
+        Every argument is a column (one value per resource) ; tr values set to NaN (or tr=None) mean "running for the whole timespan".
+
+        :param carbon_intensity: a scalar, or one carbon intensity value per resource.
+        :return: a dictionary of columns : E_CPU, E_MEM, E_GPU, E, I, M, SCI.
+        """
+        cpu_util = np.asarray(cpu_util, dtype=float)
+        memory_gb = np.asarray(memory_gb, dtype=float)
+        rr = np.asarray(rr, dtype=float)
+        tdp = np.asarray(tdp, dtype=float)
+        te = np.asarray(te, dtype=float)
+        total_vcpus = np.asarray(total_vcpus, dtype=float)
+        tr = np.full_like(cpu_util, np.nan) if tr is None else np.asarray(tr, dtype=float)
+
+        # the timespan is parsed once for the whole batch
+        duration_in_hours = timespan_to_hours(timespan)
+        missing_tr = np.isnan(tr)
+
+        # E-CPU
+        invalid_cpu = (tdp <= 0) | (rr <= 0)
+        if invalid_cpu.any():
+            warnings.warn("TDP must be a positive number")
+        cpu_hours = np.where(missing_tr, duration_in_hours, tr)
+        ecpu = rr * ((tdp * tdp_coefficients(cpu_util)) * cpu_hours / 1000)
+        ecpu = np.where(invalid_cpu, 0.0, ecpu)
 
-        # Iterate over the observations for each resource
-        for resource_name, resource_observations in observations.items():
-            # Get the CPU utilization, memory utilization, and GPU utilization from the observations
-            cpu_util = resource_observations.get("average_cpu_percentage", 0)
-            mem_util = resource_observations.get("memory_gb", 0)
-            gpu_util = resource_observations.get("average_gpu_percentage", 0)
+        # E-MEM
+        invalid_mem = memory_gb <= 0
+        if invalid_mem.any():
+            warnings.warn("RAM size must be a positive number")
+        emem = np.where(invalid_mem, 0.0, ENERGY_PER_GB * memory_gb / 1000)
 
-            tdp = static_params.get(resource_name, {}).get("vm_sku_tdp", 200) or 200 # used for E-CPU and E-GPU metrics
+        # E-GPU (gpu_count is rr, as in calculate) ; without GPU observations (gpu_util=None), E-GPU is 0
+        if gpu_util is None:
+            egpu = np.zeros_like(cpu_util)
+        else:
+            gpu_util = np.asarray(gpu_util, dtype=float)
+            if ((tdp <= 0) | (rr <= 0)).any():
+                raise ValueError("TDP must be a positive number")
+            egpu = rr * ((tdp * tdp_coefficients(gpu_util)) * timespan_to_whole_hours(timespan) / 1000)
+
+        # M
+        m = self.calculate_m_batch(rr, te, total_vcpus, tr=tr, timespan=timespan)
+
+        i = np.broadcast_to(np.asarray(carbon_intensity, dtype=float), cpu_util.shape)
+        e = ecpu + emem + egpu
+
+        return {
+            'E_CPU': ecpu,
+            'E_MEM': emem,
+            'E_GPU': egpu,
+            'E': e,
+            'I': i,
+            'M': m,
+            'SCI': (e * i) + m
+        }
+
+    def calculate_m_batch(self, rr, te, total_vcpus, tr=None, timespan : str = "PT1H") -> np.ndarray:
+        # vectorized version of calculate_m ; tr values set to NaN mean "running for the whole timespan"
+        rr = np.asarray(rr, dtype=float)
+        tr = np.full_like(rr, np.nan) if tr is None else np.asarray(tr, dtype=float)
+        missing_tr = np.isnan(tr)
+        if missing_tr.any():
+            warnings.warn(f"TR is not set. we assume software was always running for the given timespan : {timespan}")
+        duration_in_hours = timespan_to_hours(timespan)
+        m_hours = np.where(missing_tr, duration_in_hours if duration_in_hours else 1, tr)
+        return (np.asarray(te, dtype=float) * 1000) * (m_hours / EL_HOURS) * (rr / np.asarray(total_vcpus, dtype=float))
+
+    def observation_columns(self, observations : dict[str, dict], static_params : dict[str, dict] = {}) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        # build the calculate_batch input columns from the per-resource observations and static params dicts, with the same defaults as calculate
+        names = list(observations.keys())
+        size = len(names)
+        columns = {
+            'cpu_util': np.empty(size),
+            'memory_gb': np.empty(size),
+            'gpu_util': np.empty(size),
+            'rr': np.empty(size),
+            'tr': np.empty(size),
+            'tdp': np.empty(size),
+            'te': np.empty(size),
+            'total_vcpus': np.empty(size),
+        }
+        for index, resource_name in enumerate(names):
+            resource_observations = observations[resource_name]
+            resource_static_params = static_params.get(resource_name, {})
+
+            columns['cpu_util'][index] = resource_observations.get("average_cpu_percentage", 0)
+            columns['memory_gb'][index] = resource_observations.get("memory_gb", 0)
+            columns['gpu_util'][index] = resource_observations.get("average_gpu_percentage", 0)
+            columns['tdp'][index] = float(resource_static_params.get("vm_sku_tdp", 200) or 200)
 
-            # resources resrved, aka cpu core used by software
-            # if we have cpucores used from observations, we use it 
             rr = resource_observations.get("rr", None)
             if rr is None:
-                rr = static_params.get(resource_name, {}).get("instance_vcpus", 2) or 2 #used to calculate E and M metrics
+                rr = resource_static_params.get("instance_vcpus", 2) or 2
                 warnings.warn(f"cpuCores (rr) is not set. we use rr = the vcpu allocated capacity, instead of the actual vcpu used : rr = instance_vcpus {rr}")
+            columns['rr'][index] = rr
+
+            tr = resource_observations.get("tr", None)
+            columns['tr'][index] = np.nan if tr is None else tr
+
+            columns['total_vcpus'][index] = resource_static_params.get("total_vcpus", 16) or 16
+            columns['te'][index] = resource_static_params.get("te", 1200) or 1200
+
+        return names, columns
+
+    def series_columns(self, names : List[str], observations : dict[str, dict], columns : Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Builds the per-interval input columns (one row per resource, one column per interval of the time grid) from the
+        "series" observations of the resources : {"timestamps": [epoch seconds], "average_cpu_percentage": [...], "memory_gb": [...], "average_gpu_percentage": [...]}.
+        Missing values, and the resources without series, use their timespan averaged observations ; the resources without series
+        are a single interval at the end of the grid.
+
+        :return: the sorted time grid (interval start epochs), and the cpu_util, memory_gb, gpu_util and valid 2D columns.
+        """
+        resource_series = [observations[resource_name].get("series") or {} for resource_name in names]
+        timestamps = [np.asarray(series.get("timestamps", []), dtype=float) for series in resource_series]
+        grid = np.unique(np.concatenate(timestamps)) if timestamps else np.empty(0)
+        if grid.size == 0:
+            grid = np.asarray([datetime.now(timezone.utc).timestamp()])
+
+        size = len(names)
+        series_columns = {column: np.repeat(columns[column][:, None], grid.size, axis=1) for column in ('cpu_util', 'memory_gb', 'gpu_util')}
+        valid = np.zeros((size, grid.size), dtype=bool)
+        for index, series in enumerate(resource_series):
+            if timestamps[index].size == 0:
+                valid[index, -1] = True
+                continue
+            positions = np.searchsorted(grid, timestamps[index])
+            valid[index, positions] = True
+            for column, observation_name in (('cpu_util', 'average_cpu_percentage'), ('memory_gb', 'memory_gb'), ('gpu_util', 'average_gpu_percentage')):
+                values = series.get(observation_name)
+                if values is None:
+                    continue
+                values = np.asarray([np.nan if value is None else value for value in values], dtype=float)
+                series_columns[column][index, positions] = np.where(np.isnan(values), columns[column][index], values)
+
+        series_columns['valid'] = valid
+        return grid, series_columns
+
+    def calculate_series_batch(self, cpu_util, memory_gb, gpu_util, valid, rr, tdp, te, total_vcpus, tr=None, carbon_intensity=100, timespan : str = "PT1H") -> Dict[str, np.ndarray]:
+        """
+        Time-resolved version of calculate_batch : the energy is computed per interval from the per-interval utilization (2D columns,
+        one row per resource), the time running of each resource (tr, or the timespan) being split evenly on its valid intervals,
+        and multiplied by the carbon intensity of each interval. M does not depend on the intervals.
+
+        :param gpu_util: None without GPU observations, as in calculate_batch.
+        :param carbon_intensity: a scalar, or one carbon intensity value per interval of the time grid.
+        :return: a dictionary of columns : E_CPU, E_MEM, E_GPU, E, I (energy weighted average), M, SCI.
+        """
+        valid = np.asarray(valid, dtype=bool)
+        shape = valid.shape
+        rr = np.asarray(rr, dtype=float)
+        tr = np.full(shape[0], np.nan) if tr is None else np.asarray(tr, dtype=float)
+        duration_in_hours = np.where(np.isnan(tr), timespan_to_hours(timespan), tr)
+
+        # share of the running time of each interval
+        weights = valid / np.maximum(valid.sum(axis=1), 1)[:, None]
+
+        def per_interval(column):
+            return np.broadcast_to(np.asarray(column, dtype=float)[:, None], shape).ravel()
+
+        cpu_util = np.where(valid, cpu_util, 0).ravel()
+        memory_gb = np.where(valid, memory_gb, 0).ravel()
+        gpu_util = None if gpu_util is None else np.where(valid, gpu_util, 0).ravel()
+
+        # one calculate_batch pass on all the (resource, interval) pairs ; E_CPU uses tr, E_MEM and E_GPU are weighted afterwards
+        results = self.calculate_batch(cpu_util, memory_gb, per_interval(rr), per_interval(tdp), per_interval(te), per_interval(total_vcpus), tr=(duration_in_hours[:, None] * weights).ravel(), gpu_util=gpu_util, carbon_intensity=0, timespan=timespan)
+        ecpu = results['E_CPU'].reshape(shape)
+        emem = results['E_MEM'].reshape(shape) * weights
+        egpu = results['E_GPU'].reshape(shape) * weights
+        e = ecpu + emem + egpu
+
+        intensity = np.broadcast_to(np.asarray(carbon_intensity, dtype=float), (shape[1],))
+        carbon = (e * intensity[None, :]).sum(axis=1)
+        energy = e.sum(axis=1)
+        mean_intensity = (weights * intensity[None, :]).sum(axis=1)
+
+        m = self.calculate_m_batch(rr, te, total_vcpus, tr=tr, timespan=timespan)
+
+        return {
+            'E_CPU': ecpu.sum(axis=1),
+            'E_MEM': emem.sum(axis=1),
+            'E_GPU': egpu.sum(axis=1),
+            'E': energy,
+            'I': np.divide(carbon, energy, out=mean_intensity.copy(), where=energy > 0),
+            'M': m,
+            'SCI': carbon + m
+        }
+
+    async def carbon_intensity_series(self, carbon_intensity: CarbonIntensityPluginInterface, grid : np.ndarray, interval : str = "PT5M") -> np.ndarray:
+        # carbon intensity at the middle of each interval, in one batch lookup when the provider supports it
+        if carbon_intensity is None:
+            warnings.warn("Carbon intensity provider is not set. Using static value of 100 gCO2e/kWh")
+            return np.full(grid.size, 100.0)
+        if hasattr(carbon_intensity, "get_carbon_intensities"):
+            middles = grid + timespan_to_hours(interval) * 3600 / 2
+            forecasts = await carbon_intensity.get_carbon_intensities([datetime.fromtimestamp(middle, tz=timezone.utc) for middle in middles])
+            return np.asarray([forecast["value"] if forecast is not None else 100 for forecast in forecasts], dtype=float)
+        CI = await carbon_intensity.get_current_carbon_intensity()
+        return np.full(grid.size, float(CI["value"]))
+
+    async def calculate_frame(self, observations, carbon_intensity: CarbonIntensityPluginInterface= None, timespan : str = "PT1H", interval = 'PT5M', metadata : dict [str, object] = {}, static_params : dict[str, object]= {} ) -> ImpactFrame:
+        resource_names, columns = self.observation_columns(observations, static_params)
+
+        if any(observations[resource_name].get("series") for resource_name in resource_names):
+            # time-resolved SCI : per-interval energy x per-interval carbon intensity, integrated in one vectorized pass
+            grid, series = self.series_columns(resource_names, observations, columns)
+            intensity = await self.carbon_intensity_series(carbon_intensity, grid, interval=interval)
+            results = self.calculate_series_batch(series['cpu_util'], series['memory_gb'], series['gpu_util'], series['valid'], columns['rr'], columns['tdp'], columns['te'], columns['total_vcpus'], tr=columns['tr'], carbon_intensity=intensity, timespan=timespan)
+            return ImpactFrame(resource_names, results, type='azurevm', model=self.name, timespan=timespan, interval=interval, observations=observations, static_params=static_params, metadata=metadata)
 
-            #time reserved for use by the software ; e.g : if the software is running for whole 5 minutes, then tr = 5
-            tr = resource_observations.get("tr", None) 
-            
-            # Calculate the E-CPU, E-Mem, and E-GPU metrics
-            ecpu = self.calculate_ecpu(cpu_util, timespan=timespan, tdp=tdp, core_count=rr, tr=tr)
-            emem = self.calculate_emem(mem_util) #memory model uses only the average memory utilization in GB (calculated for the given timespan))
-            egpu = self.calculate_egpu(gpu_util, timespan=timespan, tdp=tdp, gpu_count=rr)
-
-            # Calculate the M and SCI metrics
-            i = float(CI)
-
-
-            total_vcpus = static_params.get(resource_name, {}).get("total_vcpus", 16) or 16
-            te = static_params.get(resource_name, {}).get("te", 1200) or 1200
-
-            m = self.calculate_m(timespan=timespan, rr=rr, total_vcpus=total_vcpus, te=te, tr=tr)
-
-            # Create a dictionary with the metric names and values for this resource
-            impact_metrics = {
-                'type': 'azurevm',
-                'name': resource_name,
-                'model': self.name,
-                'timespan' : timespan,
-                'interval' : interval,
-                'E_CPU': float(ecpu),
-                'E_MEM': float(emem),
-                'E_GPU': float(egpu),
-                'E': float(ecpu) + float(emem) + float(egpu),
-                'I': float(i),
-                'M': float(m),
-                'SCI': float(((ecpu + emem + egpu) * i) + m)
-            }
-
-            resource_metadata = metadata.get(resource_name, {}) 
-            metric_obj = SCIImpactMetricsInterface(metrics=impact_metrics, metadata=resource_metadata, observations=resource_observations, components_list=[], static_params=static_params.get(resource_name, {}))
-            print(metric_obj)
-            resource_metrics[resource_name] = metric_obj
-
-            # Remove any metrics with None values
-            #resource_metrics[resource_name] = {k: v for k, v in resource_metrics[resource_name].items() if v is not None}
-
-        # Create an instance of the ImpactMetricInterface with the calculated metrics
+        if carbon_intensity is None:
+            warnings.warn("Carbon intensity provider is not set. Using static value of 100 gCO2e/kWh")
+            CI = 100
+        else:
+            CI = await carbon_intensity.get_current_carbon_intensity()
+            CI = CI["value"]
 
-        print("coucou")
-        #metrics.metrics = resource_metrics
+        # compute the E-CPU, E-Mem, E-GPU, M and SCI metrics for all the resources in one vectorized pass
+        results = self.calculate_batch(timespan=timespan, carbon_intensity=float(CI), **columns)
 
+        return ImpactFrame(resource_names, results, type='azurevm', model=self.name, timespan=timespan, interval=interval, observations=observations, static_params=static_params, metadata=metadata)
 
-        return resource_metrics
\ No newline at end of file
+    async def calculate(self, observations, carbon_intensity: CarbonIntensityPluginInterface= None, timespan : str = "PT1H", interval = 'PT5M', metadata : dict [str, object] = {}, static_params : dict[str, object]= {} ) -> dict[str, SCIImpactMetricsInterface]:
+        frame = await self.calculate_frame(observations, carbon_intensity=carbon_intensity, timespan=timespan, interval=interval, metadata=metadata, static_params=static_params)
+        return frame.to_metrics()
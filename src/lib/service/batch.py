@@ -0,0 +1,41 @@
+from typing import Dict, List
+import asyncio
+import os
+
+from lib.ief.core import AggregatedImpactNodesInterface, SCIImpactMetricsInterface
+from lib.ief.planner import ImpactPlanner
+
+
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "8")) # apps of a batch calculated concurrently
+
+
+async def calculate_batch(aggregated_components: List[AggregatedImpactNodesInterface], max_concurrency: int = BATCH_MAX_CONCURRENCY) -> Dict[str, SCIImpactMetricsInterface]:
+    """
+    Calculates many aggregated impact nodes (e.g. the apps of a report) with one ImpactPlanner for all their components :
+    the resources, static params and observations shared by several apps (same subscription, cluster, window, ...) are
+    fetched once for the whole batch. Each app is then aggregated as by AggregatedImpactNodesInterface.calculate.
+
+    :return: the aggregated metrics, per app name ; the app names must be unique.
+    """
+    app_names = [aggregated_component.name for aggregated_component in aggregated_components]
+    if len(set(app_names)) != len(app_names):
+        raise Exception("Duplicate app names in batch : %s" % ", ".join(sorted(set(app_name for app_name in app_names if app_names.count(app_name) > 1))))
+    planned = [aggregated_component for aggregated_component in aggregated_components if aggregated_component.plan]
+    for aggregated_component in planned:
+        aggregated_component.prepare_components()
+    planner = ImpactPlanner([component for aggregated_component in planned for component in aggregated_component.components])
+    for aggregated_component in planned:
+        aggregated_component.shared_planner = planner
+    print("batch : %s apps, %s components, %s planned steps" % (len(aggregated_components), sum(len(aggregated_component.components) for aggregated_component in aggregated_components), len(planner.nodes)))
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def calculate(aggregated_component: AggregatedImpactNodesInterface) -> Dict[str, SCIImpactMetricsInterface]:
+        async with semaphore:
+            return await aggregated_component.calculate()
+
+    metrics = {}
+    # a failed component is reported in the metadata of its app (see AggregatedImpactNodesInterface.calculate_frames)
+    for app_metrics in await asyncio.gather(*[calculate(aggregated_component) for aggregated_component in aggregated_components]):
+        metrics.update(app_metrics)
+    return metrics
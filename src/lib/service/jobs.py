@@ -0,0 +1,261 @@
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+from datetime import datetime, timezone
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+from lib.components.observation_window import duration_seconds, iso_duration
+from lib.ief.core import AggregatedImpactNodesInterface
+from lib.service.ndjson import json_default
+from lib.service.response_cache import model_payload, request_key
+
+
+JOBS_DIR = os.environ.get("JOBS_DIR", "./jobs") # job results and chunk results, on local disk
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2")) # chunks calculated concurrently, for all the jobs of the process
+JOB_CHUNK = os.environ.get("JOB_CHUNK", "P1D") # sub-window of a chunk
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+def job_chunks(timespan: str, chunk: str = JOB_CHUNK, now: datetime = None) -> List[Tuple[str, datetime]]:
+    """
+    Splits a timespan into sub-windows of chunk, oldest first. The window ends on the last chunk boundary before now,
+    so that the chunks of repeated jobs are identical (and read from disk instead of being calculated again).
+
+    :return: (timespan, end) of the chunks.
+    """
+    total = duration_seconds(timespan)
+    step = min(duration_seconds(chunk), total)
+    end = (now or datetime.now(timezone.utc)).timestamp() // step * step
+    chunks = []
+    remaining = total
+    while remaining > 0:
+        seconds = min(step, remaining)
+        chunks.append((iso_duration(seconds), datetime.fromtimestamp(end, tz=timezone.utc)))
+        end -= seconds
+        remaining -= seconds
+    return list(reversed(chunks))
+
+
+def with_timespan(request, timespan: str):
+    # copy of a pydantic request (v2 or v1) for a sub-window
+    return request.model_copy(update={"timespan": timespan}) if hasattr(request, "model_copy") else request.copy(update={"timespan": timespan})
+
+
+def read_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_json(path: str, value) -> None:
+    # written to a temporary file first, so that a reader never sees a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+    with open(temporary_path, "w") as file:
+        json.dump(value, file, default=json_default)
+    os.replace(temporary_path, path)
+
+
+def sum_chunks(chunk_metrics: List[Dict[str, object]]) -> Dict[str, float]:
+    # totals of the aggregated metrics of the chunks ; the carbon intensity is weighted by energy, as in AggregatedImpactNodesInterface
+    totals = {metric: float(sum(metrics[metric] for metrics in chunk_metrics)) for metric in ("E_CPU", "E_MEM", "E_GPU", "E", "M", "SCI")}
+    E = totals["E"]
+    intensities = [metrics["I"] for metrics in chunk_metrics]
+    totals["I"] = float(sum(metrics["E"] * metrics["I"] for metrics in chunk_metrics) / E) if E > 0 else (float(sum(intensities) / len(intensities)) if intensities else 0.0)
+    return totals
+
+
+class Job:
+    """
+    Calculation of an AggregatedComponentRequest, split into chunks (sub-windows of the timespan).
+    """
+
+    def __init__(self, job_id: str, request, build: Callable[..., AggregatedImpactNodesInterface], chunks: List[Tuple[str, datetime]]):
+        self.id = job_id
+        self.request = request
+        self.build = build # request -> AggregatedImpactNodesInterface
+        self.chunks = chunks
+        self.chunk_results: List[Dict[str, object]] = [None] * len(chunks)
+        self.errors: Dict[int, str] = {}
+        self.cached_chunks = 0
+        self.status = JOB_PENDING
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.result = None
+        self.changed = asyncio.Event()
+
+    @property
+    def done_chunks(self) -> int:
+        return sum(1 for result in self.chunk_results if result is not None) + len(self.errors)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def notify(self) -> None:
+        # wakes up the progress streams
+        self.updated_at = time.time()
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def state(self) -> Dict[str, object]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "app_name": self.request.app_name,
+            "timespan": self.request.timespan,
+            "interval": self.request.interval,
+            "chunks": len(self.chunks),
+            "done_chunks": self.done_chunks,
+            "cached_chunks": self.cached_chunks,
+            "failed_chunks": {str(index): error for index, error in self.errors.items()},
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+    def summarize(self) -> Dict[str, object]:
+        chunks = []
+        for (timespan, end), result in zip(self.chunks, self.chunk_results):
+            if result is not None:
+                chunks.append({"timespan": timespan, "end": end.isoformat(), "metrics": result})
+        start = self.chunks[0][1].timestamp() - duration_seconds(self.chunks[0][0]) if self.chunks else None
+        return {
+            "job_id": self.id,
+            "app_name": self.request.app_name,
+            "timespan": self.request.timespan,
+            "interval": self.request.interval,
+            "start": datetime.fromtimestamp(start, tz=timezone.utc).isoformat() if start is not None else None,
+            "end": self.chunks[-1][1].isoformat() if self.chunks else None,
+            "metrics": sum_chunks([chunk["metrics"] for chunk in chunks]),
+            "failed_chunks": {str(index): error for index, error in self.errors.items()},
+            "chunks": chunks
+        }
+
+
+class JobManager:
+    """
+    Runs the jobs of the API process : their chunks are queued and calculated by a bounded pool of workers, and the
+    results are written to disk. A chunk already calculated (same components, selectors, sub-window and interval) by a
+    previous job is read from disk instead.
+    """
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, workers: int = JOB_WORKERS, chunk: str = JOB_CHUNK):
+        self.jobs_dir = jobs_dir
+        self.workers = max(1, workers)
+        self.chunk = chunk
+        self.jobs: Dict[str, Job] = {}
+        self.queue = None
+        self.worker_tasks = []
+
+    def job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, "jobs", "%s.json" % job_id)
+
+    def chunk_path(self, job: Job, index: int) -> str:
+        timespan, end = job.chunks[index]
+        payload = model_payload(with_timespan(job.request, timespan))
+        payload["window_end"] = end.isoformat()
+        return os.path.join(self.jobs_dir, "chunks", "%s.json" % request_key(payload))
+
+    def start_workers(self) -> None:
+        # the queue and the workers are created on the first submit, in the event loop of the API
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.worker_tasks = [task for task in self.worker_tasks if not task.done()]
+        while len(self.worker_tasks) < self.workers:
+            self.worker_tasks.append(asyncio.ensure_future(self.worker()))
+
+    async def submit(self, request, build: Callable[..., AggregatedImpactNodesInterface]) -> Job:
+        job = Job(uuid.uuid4().hex, request, build, job_chunks(request.timespan, self.chunk))
+        self.jobs[job.id] = job
+        self.start_workers()
+        for index in range(len(job.chunks)):
+            self.queue.put_nowait((job, index))
+        print("job %s submitted : %s chunks of %s" % (job.id, len(job.chunks), self.chunk))
+        return job
+
+    async def worker(self) -> None:
+        while True:
+            job, index = await self.queue.get()
+            try:
+                await self.run_chunk(job, index)
+            except Exception as error:
+                job.errors[index] = f"{type(error).__name__}: {error}"
+                print(f"Error calculating chunk {index} of job {job.id} : {job.errors[index]}")
+            finally:
+                self.queue.task_done()
+            if job.done_chunks == len(job.chunks):
+                await self.finish(job)
+            else:
+                job.notify()
+
+    async def run_chunk(self, job: Job, index: int) -> None:
+        job.status = JOB_RUNNING
+        path = self.chunk_path(job, index)
+        result = await asyncio.to_thread(read_json, path)
+        if result is not None:
+            job.cached_chunks += 1
+            job.chunk_results[index] = result
+            return
+
+        timespan, end = job.chunks[index]
+        aggregated_component = job.build(with_timespan(job.request, timespan))
+        aggregated_component.window_end = end
+        metrics = await aggregated_component.calculate()
+        result = model_payload(metrics[aggregated_component.name])
+        job.chunk_results[index] = result
+        # partial chunks (failed components) are calculated again by the next job
+        if not aggregated_component.errors:
+            await asyncio.to_thread(write_json, path, result)
+
+    async def finish(self, job: Job) -> None:
+        job.result = job.summarize()
+        job.status = JOB_FAILED if len(job.errors) == len(job.chunks) else JOB_COMPLETED
+        await asyncio.to_thread(write_json, self.job_path(job.id), {"state": job.state(), "result": job.result})
+        print("job %s %s : %s chunks, %s from disk, %s failed" % (job.id, job.status, len(job.chunks), job.cached_chunks, len(job.errors)))
+        job.notify()
+
+    async def get(self, job_id: str) -> Dict[str, object]:
+        """
+        :return: the state and result of a job, read from disk for the jobs of previous processes, or None if unknown.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return {"state": job.state(), "result": job.result}
+        if not all(character in "0123456789abcdef" for character in job_id):
+            return None
+        return await asyncio.to_thread(read_json, self.job_path(job_id))
+
+    async def progress(self, job_id: str) -> AsyncIterator[Dict[str, object]]:
+        # job states, on each change, until the job is finished
+        job = self.jobs.get(job_id)
+        if job is None:
+            stored = await self.get(job_id)
+            if stored is not None:
+                yield stored["state"]
+            return
+        while True:
+            changed = job.changed
+            yield job.state()
+            if job.finished:
+                return
+            await changed.wait()
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+        return _job_manager
@@ -0,0 +1,118 @@
+from typing import AsyncIterator, Dict, Tuple
+import json
+
+from lib.ief.core import AggregatedImpactNodesInterface
+from lib.ief.impact_frame import METRIC_COLUMNS, ImpactFrame
+
+
+def json_default(value):
+    # numpy scalars and arrays in observations and static params
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def ndjson_line(record: Dict[str, object]) -> str:
+    return json.dumps(record, default=json_default, separators=(",", ":")) + "\n"
+
+
+def resource_record(kind: str, frame: ImpactFrame, index: int) -> Dict[str, object]:
+    name = frame.names[index]
+    record = {"kind": kind}
+    record.update(frame.row(index))
+    record["metadata"] = frame.metadata.get(name, {})
+    record["observations"] = frame.observations.get(name, {})
+    record["static_params"] = frame.static_params.get(name, {})
+    return record
+
+
+class HostNodeIds:
+    """
+    Ids of the host nodes emitted in a stream : each host node is emitted once, the first time one of its resources is,
+    and the resources reference it by id. Hosts of different frames with the same name (e.g. the same node pool in two
+    clusters) get different ids.
+    """
+
+    def __init__(self):
+        self.ids: Dict[Tuple[int, str], str] = {}
+        self.used = set()
+        self.frames = [] # the host frames are kept referenced, so that their id() is not reused during the stream
+
+    def get(self, host_frame: ImpactFrame, host_name: str) -> Tuple[str, bool]:
+        """
+        :return: the id of the host node, and whether it is new (i.e. must be emitted).
+        """
+        key = (id(host_frame), host_name)
+        host_id = self.ids.get(key)
+        if host_id is not None:
+            return host_id, False
+        host_id = host_name
+        suffix = 1
+        while host_id in self.used:
+            suffix += 1
+            host_id = "%s#%s" % (host_name, suffix)
+        self.ids[key] = host_id
+        self.used.add(host_id)
+        if not any(frame is host_frame for frame in self.frames):
+            self.frames.append(host_frame)
+        return host_id, True
+
+
+async def stream_impacts(aggregated_component: AggregatedImpactNodesInterface) -> AsyncIterator[str]:
+    """
+    Calculates an aggregated component and streams its impacts as NDJSON, one line per record, as the components complete :
+
+    - {"kind": "request", ...} : first line, sent before any calculation.
+    - {"kind": "host_node", "id": ..., <metrics>, "metadata", "observations", "static_params"} : a host node, emitted once,
+      before the first resource it hosts.
+    - {"kind": "resource", "component": ..., "component_index": ..., <metrics>, "metadata", "observations", "static_params", "host_node": <id or null>}
+    - {"kind": "error", "component": ..., "component_index": ..., "error": ...} : a failed component.
+    - {"kind": "aggregate", <metrics>, "metadata"} : last line, the totals of the aggregated component.
+
+    The frames are dropped as soon as they are streamed, only the running totals are kept.
+    """
+    yield ndjson_line({"kind": "request", "name": aggregated_component.name, "type": aggregated_component.type, "timespan": aggregated_component.timespan, "interval": aggregated_component.interval, "components": [component.name for component in aggregated_component.components]})
+
+    host_ids = HostNodeIds()
+    totals = dict.fromkeys(METRIC_COLUMNS, 0.0)
+    weighted_intensity = 0.0
+    intensity_sum = 0.0
+    count = 0
+    async for component_index, component, frame in aggregated_component.iter_frames():
+        if frame is None:
+            yield ndjson_line({"kind": "error", "component": component.name, "component_index": component_index, "error": aggregated_component.errors.get(component_index)})
+            continue
+
+        host_frame = frame.host_frame
+        host_index = {name: index for index, name in enumerate(host_frame.names)} if host_frame is not None else {}
+        for index, name in enumerate(frame.names):
+            host_id = None
+            host_name = frame.host_nodes.get(name)
+            if host_name in host_index:
+                host_id, new_host = host_ids.get(host_frame, host_name)
+                if new_host:
+                    host_record = resource_record("host_node", host_frame, host_index[host_name])
+                    host_record["id"] = host_id
+                    yield ndjson_line(host_record)
+            record = resource_record("resource", frame, index)
+            record["component"] = component.name
+            record["component_index"] = component_index
+            record["host_node"] = host_id
+            yield ndjson_line(record)
+
+        for metric, value in frame.totals().items():
+            totals[metric] += value
+        weighted_intensity += float((frame.column("E") * frame.column("I")).sum())
+        intensity_sum += float(frame.column("I").sum())
+        count += len(frame)
+
+    # same totals as AggregatedImpactNodesInterface.calculate
+    E = totals["E"]
+    totals["I"] = weighted_intensity / E if E > 0 else (intensity_sum / count if count else 0.0)
+    metadata = {"aggregated": "True"}
+    if aggregated_component.errors:
+        metadata["failed_components"] = aggregated_component.failed_components()
+    aggregate = {"kind": "aggregate", "name": aggregated_component.name, "type": aggregated_component.type, "model": aggregated_component.inner_model, "timespan": aggregated_component.timespan, "interval": aggregated_component.interval}
+    aggregate.update(totals)
+    aggregate["metadata"] = metadata
+    yield ndjson_line(aggregate)
@@ -0,0 +1,118 @@
+from typing import Awaitable, Callable, Dict, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+METRICS_CACHE_TTL = float(os.environ.get("METRICS_CACHE_TTL", "60")) # seconds a response is fresh
+METRICS_CACHE_STALE_TTL = float(os.environ.get("METRICS_CACHE_STALE_TTL", "300")) # seconds a stale response is still served, while it is recalculated in the background
+METRICS_CACHE_MAX_ENTRIES = int(os.environ.get("METRICS_CACHE_MAX_ENTRIES", "256"))
+
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+CACHE_STALE = "STALE"
+
+
+def model_payload(model) -> Dict[str, object]:
+    # dict of a pydantic model (v2 or v1)
+    return model.model_dump() if hasattr(model, "model_dump") else model.dict()
+
+
+def partial_response(response) -> bool:
+    # a response with failed components (e.g. an upstream outage) only sums the successful ones
+    values = response.values() if isinstance(response, dict) else []
+    return any((getattr(value, "metadata", None) or {}).get("failed_components") for value in values)
+
+
+def request_key(request) -> str:
+    """
+    Canonical hash of an AggregatedComponentRequest (or of its dict) : the same app, components (in any order), selectors,
+    auth params, timespan and interval give the same key.
+    """
+    payload = dict(request) if isinstance(request, dict) else model_payload(request)
+    payload["components"] = sorted(payload.get("components", []), key=lambda component: json.dumps(component, sort_keys=True, default=str))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    TTL cache of the /metrics responses, bounded in entries (LRU), with stale-while-revalidate : a response older than ttl
+    (but not than ttl + stale_ttl) is served at once, and recalculated in the background. Concurrent misses of the same
+    request share a single calculation. Partial responses (with failed components) are not cached, so that the next request
+    calculates them again.
+    """
+
+    def __init__(self, ttl: float = METRICS_CACHE_TTL, stale_ttl: float = METRICS_CACHE_STALE_TTL, max_entries: int = METRICS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict() # key -> (calculated_at, response)
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def set(self, key: str, response) -> None:
+        self.entries[key] = (time.monotonic(), response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def refresh(self, key: str, calculate: Callable[[], Awaitable]) -> asyncio.Task:
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._calculate(key, calculate))
+            self.inflight[key] = task
+        return task
+
+    async def _calculate(self, key: str, calculate: Callable[[], Awaitable]):
+        try:
+            response = await calculate()
+            if partial_response(response):
+                # a stale response is not served in place of a recalculation that failed either
+                self.entries.pop(key, None)
+            else:
+                self.set(key, response)
+            return response
+        finally:
+            self.inflight.pop(key, None)
+
+    async def get(self, key: str, calculate: Callable[[], Awaitable]) -> Tuple[object, str]:
+        """
+        :param calculate: coroutine function calculating the response on a miss, or in the background when it is stale.
+        :return: the response, and the cache status (HIT, STALE or MISS).
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], CACHE_HIT
+            if age < self.ttl + self.stale_ttl:
+                self.entries.move_to_end(key)
+                self.stale_hits += 1
+                task = self.refresh(key, calculate)
+                # errors of the background recalculation are only logged ; the stale response is served until it expires
+                task.add_done_callback(lambda task: task.cancelled() or task.exception() is None or print(f"Error recalculating cached response {key}: {task.exception()}"))
+                return entry[1], CACHE_STALE
+            del self.entries[key]
+
+        self.misses += 1
+        return await asyncio.shield(self.refresh(key, calculate)), CACHE_MISS
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -4,6 +4,7 @@ import time
 
 import asyncio
 import os
+import signal
 
 #add lib to path
 sys.path.append('./lib')
@@ -12,9 +13,13 @@ from lib.components.azure_aks_node import AKSNode
 from lib.components.azure_aks_pod import AKSPod
 from lib.components.kubernetes.kubernetes_node import KubernetesNode
 from lib.components.kubernetes.kubernetes_pod import KubernetesPod
+from lib.components.kubernetes.node_snapshot import KubernetesNodeSnapshot
+from lib.components.http_client import get_http_client
 from lib.ief.core import *
 from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
 from lib.MetricsExporter.exporter import *
+from lib.MetricsExporter.scheduler import CycleScheduler
+from lib.MetricsExporter.sharding import EXPORTER_SHARDS, run_sharded_exporter
 from lib.carbonIntensity.kubernetesConfigMapReader import CarbonIntensityKubernetesConfigMap
 
 auth_params = {
@@ -77,24 +82,32 @@ async def process_impact_node(impact_node: ImpactNodeInterface, stop_event: asyn
     await impact_node.fetch_resources()
     await impact_node.lookup_static_params()
 
-    # fetch the observations and calculate + export the impact every 5 minutes
-    while not stop_event.is_set():
+    async def cycle():
+        # fetch the observations and calculate the impact ; when running calculate, the observations are fetched again
+        # the columnar ImpactFrame is exported directly, without building one pydantic object per resource
+        impact_metrics = await impact_node.calculate_frame()
 
-        # fetch the observations and calculate the impact ; when running calculate, the observations are fetched again        
-        impact_metrics = await impact_node.calculate()
-
-        print(impact_metrics)
+        print("%s : %s resources calculated" % (impact_node.name, len(impact_metrics)))
 
         # export the metrics to prometheus
         #exporter = MetricsExporter(impact_metrics)
         impact_node.exporter.set_data(impact_metrics)
         impact_node.exporter.to_prometheus()
-        await asyncio.sleep(60) # wait for 1 minutes before exporting the metrics again
+
+    # fetch the observations and calculate + export the impact on each tick of the scheduler (every EXPORT_PERIOD seconds, aligned on the wall clock)
+    await CycleScheduler(impact_node.name).run(cycle, stop_event)
 
 
 async def main(impact_nodes: List[ImpactNodeInterface]):
     # Create an event to signal the worker when to stop
     stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop_event.set)
+        except NotImplementedError:
+            # e.g. on Windows : KeyboardInterrupt still stops the process
+            pass
 
     # Create the worker tasks
     tasks = []
@@ -103,7 +116,10 @@ async def main(impact_nodes: List[ImpactNodeInterface]):
         tasks.append(task)
 
     # Wait for the tasks to finish
-    await asyncio.gather(*tasks)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await get_http_client().close()
 
 
 
@@ -116,9 +132,8 @@ params = {
 
     
 
-# Program entry point
-if __name__ == '__main__':
-
+def build_impact_nodes() -> List[ImpactNodeInterface]:
+    # called once by the exporter process, or once per shard process in sharded mode
     if carbonIntensityProvider_name == "CarbonIntensityKubernetesConfigMap":
         print("Using CarbonIntensityKubernetesConfigMap")
         carbonIntensityProvider = CarbonIntensityKubernetesConfigMap(node_resource_selectors)
@@ -129,9 +144,6 @@ if __name__ == '__main__':
         carbonIntensityProvider = None
     
 
-    #static method
-    MetricsExporter.start_http_server(port=8000)
-
     # 1. Create the impact nodes for which you want to calculate the impact
     # impact_nodes = [
     #     AzureVM(name = "myazurevm", model = ComputeServer_STATIC_IMP(),  
@@ -182,7 +194,24 @@ if __name__ == '__main__':
                 interval=interval,
                 params=params)
     ]
-    
-    # 2. Run the main function
-    asyncio.run(main(impact_nodes))
 
+    # the node and pod workers of a cycle share the same cluster-wide node snapshot (inventory, static params, observations)
+    node_snapshot = KubernetesNodeSnapshot.for_impact_node(impact_nodes[0])
+    for impact_node in impact_nodes:
+        impact_node.node_snapshot = node_snapshot
+
+    return impact_nodes
+
+
+# Program entry point
+if __name__ == '__main__':
+
+    if EXPORTER_SHARDS > 1:
+        # the resources are split between EXPORTER_SHARDS worker processes, and this process serves their merged metrics
+        run_sharded_exporter(build_impact_nodes, main, shards=EXPORTER_SHARDS, port=8000)
+    else:
+        #static method
+        MetricsExporter.start_http_server(port=8000)
+
+        # 2. Run the main function
+        asyncio.run(main(build_impact_nodes()))
@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+import asyncio
+import threading
+
+import pytest
+
+import azure_monitor_stub
+from lib.components import azure_vm
+from lib.components.azure_monitor import MetricsBatchClient, timespan_bounds
+from lib.components.azure_resource_graph import VMRecord
+from lib.components.azure_vm import AzureVM
+from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
+
+
+WINDOW_END = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def stub_endpoint():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), azure_monitor_stub.AzureMonitorBatchStubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%s" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def inventory():
+    # more VMs than a getBatch request takes, in two subscriptions and regions, some with a GPU extension
+    vms = {}
+    for index in range(120):
+        subscription_id, location = ("sub-a", "westeurope") if index % 3 else ("sub-b", "northeurope")
+        vm_id = "/subscriptions/%s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm%s" % (subscription_id, index)
+        gpu_extension_ids = ["%s/extensions/NVIDIA-GPU-Extension" % vm_id] if index % 7 == 0 else []
+        vms[vm_id.lower()] = VMRecord(vm_id, "vm%s" % index, location, "rg", subscription_id, {}, "Standard_D4s_v3", gpu_extension_ids)
+    return vms
+
+
+def azure_vm_component(observation_mode):
+    vm = AzureVM("vms", ComputeServer_STATIC_IMP(), None, {}, {"subscription_id": "sub-a", "observation_mode": observation_mode}, {}, interval="PT5M", timespan="PT1H")
+    vm.window_end = WINDOW_END
+    vm.resources = inventory()
+    vm.static_params = {name: {"instance_memory": 16} for name in vm.resources}
+    return vm
+
+
+async def stub_list_metrics(self, monitor_client, resource_uri, metricnames, timespan=None):
+    # single mode : the metrics.list response of the same stub data, as the Azure SDK returns it
+    starttime, endtime = timespan_bounds(self.timespan, self.window_end)
+    query = {"starttime": [starttime], "endtime": [endtime], "interval": [self.interval], "metricnames": [metricnames]}
+    resource_values = azure_monitor_stub.batch_response("stub", query, [resource_uri])["values"][0]
+    return SimpleNamespace(value=[
+        SimpleNamespace(name=SimpleNamespace(localized_value=metric["name"]["localizedValue"]), timeseries=[SimpleNamespace(data=[SimpleNamespace(time_stamp=data["timeStamp"], average=data["average"]) for data in time_series["data"]]) for time_series in metric["timeseries"]])
+        for metric in resource_values["value"]
+    ])
+
+
+def test_batch_observations_match_single_mode(monkeypatch, stub_endpoint):
+    batch_client = MetricsBatchClient(None, endpoint=stub_endpoint)
+    requests = []
+    get_batch = batch_client.get_batch
+
+    def counting_get_batch(*args, **kwargs):
+        requests.append(args[2])
+        return get_batch(*args, **kwargs)
+
+    monkeypatch.setattr(batch_client, "get_batch", counting_get_batch)
+    monkeypatch.setattr(azure_vm, "get_metrics_batch_client", lambda credential: batch_client)
+    monkeypatch.setattr(AzureVM, "list_metrics", stub_list_metrics)
+
+    batch = asyncio.run(azure_vm_component("batch").fetch_observations())
+    single = asyncio.run(azure_vm_component("single").fetch_observations())
+
+    assert sorted(batch) == sorted(single) == sorted(inventory())
+    for name, observations in single.items():
+        assert batch[name] == pytest.approx(observations), name
+    assert any(observations["average_gpu_percentage"] > 0 for observations in batch.values())
+    # 80 + 40 VMs and 12 + 6 GPU extensions, per subscription and region, at most 50 resources per request
+    assert sorted(len(resource_ids) for resource_ids in requests) == [6, 12, 30, 40, 50]
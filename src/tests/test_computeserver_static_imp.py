@@ -0,0 +1,88 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
+
+
+OBSERVATIONS = {
+    "cpu-only": {"average_cpu_percentage": 35, "memory_gb": 6, "average_gpu_percentage": 0},
+    "gpu": {"average_cpu_percentage": 70, "memory_gb": 24, "average_gpu_percentage": 85, "rr": 4},
+    "idle": {"average_cpu_percentage": 0, "memory_gb": 0},
+    "reserved": {"average_cpu_percentage": 5, "memory_gb": 2, "average_gpu_percentage": 12, "rr": 1, "tr": 0.25},
+    "no-tdp": {"average_cpu_percentage": 100, "memory_gb": 8, "average_gpu_percentage": 40},
+    "zero-tdp": {"average_cpu_percentage": 55, "memory_gb": 4},
+}
+STATIC_PARAMS = {
+    "cpu-only": {"vm_sku_tdp": 150, "instance_vcpus": 8, "total_vcpus": 32, "te": 1500},
+    "gpu": {"vm_sku_tdp": 300, "instance_vcpus": 24, "total_vcpus": 48, "te": 2500},
+    "reserved": {"vm_sku_tdp": 120, "instance_vcpus": 2},
+    # SKUs missing from the catalog
+    "no-tdp": {"vm_sku_tdp": None, "instance_vcpus": None, "total_vcpus": None, "te": None},
+    "zero-tdp": {"vm_sku_tdp": 0, "instance_vcpus": 4},
+}
+
+
+def per_resource(model, observations, static_params, timespan, carbon_intensity=100):
+    # the per-resource path : calculate_ecpu, calculate_emem, calculate_egpu and calculate_m, with the defaults of observation_columns
+    results = {}
+    for name, resource_observations in observations.items():
+        resource_static_params = static_params.get(name, {})
+        tdp = resource_static_params.get("vm_sku_tdp", 200) or 200
+        rr = resource_observations.get("rr", None)
+        if rr is None:
+            rr = resource_static_params.get("instance_vcpus", 2) or 2
+        tr = resource_observations.get("tr", None)
+        ecpu = model.calculate_ecpu(resource_observations.get("average_cpu_percentage", 0), timespan=timespan, tdp=tdp, core_count=rr, tr=tr)
+        emem = model.calculate_emem(resource_observations.get("memory_gb", 0))
+        egpu = model.calculate_egpu(resource_observations.get("average_gpu_percentage", 0), timespan=timespan, tdp=tdp, gpu_count=rr)
+        m = model.calculate_m(timespan=timespan, rr=rr, total_vcpus=resource_static_params.get("total_vcpus", 16) or 16, te=resource_static_params.get("te", 1200) or 1200, tr=tr)
+        e = ecpu + emem + egpu
+        results[name] = {"E_CPU": ecpu, "E_MEM": emem, "E_GPU": egpu, "E": e, "I": carbon_intensity, "M": m, "SCI": e * carbon_intensity + m}
+    return results
+
+
+@pytest.mark.parametrize("timespan", ["PT5M", "PT1H", "PT2H30M", "P1D"])
+def test_calculate_batch_matches_per_resource(timespan):
+    model = ComputeServer_STATIC_IMP()
+    names, columns = model.observation_columns(OBSERVATIONS, STATIC_PARAMS)
+    batch = model.calculate_batch(timespan=timespan, carbon_intensity=100, **columns)
+    expected = per_resource(model, OBSERVATIONS, STATIC_PARAMS, timespan)
+
+    assert names == list(OBSERVATIONS)
+    for index, name in enumerate(names):
+        for metric, value in expected[name].items():
+            assert batch[metric][index] == pytest.approx(value), (name, metric)
+
+
+def test_calculate_frame_matches_per_resource():
+    model = ComputeServer_STATIC_IMP()
+    metrics = asyncio.run(model.calculate(OBSERVATIONS, timespan="PT1H", static_params=STATIC_PARAMS))
+    expected = per_resource(model, OBSERVATIONS, STATIC_PARAMS, "PT1H")
+
+    for name, value in metrics.items():
+        for metric, expected_value in expected[name].items():
+            assert getattr(value, metric) == pytest.approx(expected_value), (name, metric)
+
+
+def test_calculate_batch_without_tdp_or_gpu():
+    # columns given directly : an empty TDP gives no CPU energy, as calculate_ecpu ; without GPU observations E_GPU is 0
+    model = ComputeServer_STATIC_IMP()
+    cpu_util, memory_gb, rr, tdp, te, total_vcpus = [30, 60], [4, 0], [2, 4], [0, 200], [1200, 1500], [16, 32]
+    batch = model.calculate_batch(cpu_util, memory_gb, rr, tdp, te, total_vcpus, timespan="PT1H")
+
+    for index in range(2):
+        assert batch["E_CPU"][index] == pytest.approx(model.calculate_ecpu(cpu_util[index], tdp=tdp[index], timespan="PT1H", core_count=rr[index]))
+        assert batch["E_MEM"][index] == pytest.approx(model.calculate_emem(memory_gb[index]))
+        assert batch["M"][index] == pytest.approx(model.calculate_m(timespan="PT1H", rr=rr[index], total_vcpus=total_vcpus[index], te=te[index]))
+    assert np.all(batch["E_GPU"] == 0)
+
+
+def test_calculate_m_batch_matches_calculate_m():
+    model = ComputeServer_STATIC_IMP()
+    rr, te, total_vcpus, tr = [1, 2, 8], [1200, 2500, 800], [4, 16, 8], [np.nan, 0.5, 3]
+    m = model.calculate_m_batch(rr, te, total_vcpus, tr=tr, timespan="PT6H")
+
+    for index in range(3):
+        assert m[index] == pytest.approx(model.calculate_m(timespan="PT6H", rr=rr[index], total_vcpus=total_vcpus[index], te=te[index], tr=None if np.isnan(tr[index]) else tr[index]))
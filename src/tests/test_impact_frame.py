@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+import asyncio
+
+from lib.components.azure_aks_node import AKSNode
+from lib.ief.core import AggregatedImpactNodesInterface
+from lib.ief.impact_frame import ImpactFrame
+
+from test_ndjson import aks_pod, node_calculate
+
+
+def test_from_metrics_round_trip_keeps_host_node(monkeypatch):
+    resource_metrics = asyncio.run(aks_pod(monkeypatch).calculate())
+    assert all(value.host_node for value in resource_metrics.values())
+
+    round_trip = ImpactFrame.from_metrics(resource_metrics).to_metrics()
+
+    assert list(round_trip) == list(resource_metrics)
+    for name, value in resource_metrics.items():
+        assert round_trip[name].model_dump() == value.model_dump()
+
+
+def test_aggregated_components_keep_host_node(monkeypatch):
+    metrics = asyncio.run(AggregatedImpactNodesInterface("app", [aks_pod(monkeypatch)]).calculate())
+
+    components = metrics["app"].components
+    assert len(components) == 1
+    assert sorted(components[0]) == ["web-0", "web-1"]
+    assert all(list(value.host_node) == ["aks-node-0"] for value in components[0].values())
+
+
+def test_host_nodes_use_the_window_of_the_pods(monkeypatch):
+    windows = []
+
+    async def calculate(self, carbon_intensity=None):
+        windows.append((self.timespan, self.interval, self.window_end))
+        return await node_calculate(self, carbon_intensity)
+
+    pod = aks_pod(monkeypatch)
+    monkeypatch.setattr(AKSNode, "calculate", calculate)
+    window_end = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    asyncio.run(AggregatedImpactNodesInterface("app", [pod], timespan="PT24H", interval="PT1H", window_end=window_end).calculate())
+
+    assert windows == [("PT24H", "PT1H", window_end)]
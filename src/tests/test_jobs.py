@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+import asyncio
+
+import pytest
+
+from lib.ief.core import AggregatedImpactNodesInterface, ImpactNodeInterface
+from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
+from lib.service.jobs import job_chunks, sum_chunks
+from lib.service.response_cache import model_payload
+
+
+class StaticVM(ImpactNodeInterface):
+    # VM with constant utilization over any window
+    def authenticate(self, auth_params):
+        pass
+
+    async def fetch_resources(self):
+        return {"vm1": {}}
+
+    async def fetch_observations(self):
+        # no memory : E_MEM of the model does not scale with the window
+        return {"vm1": {"average_cpu_percentage": 30, "memory_gb": 0, "average_gpu_percentage": 60}}
+
+    async def calculate_frame(self, carbon_intensity=None):
+        static_params = {"vm1": {"vm_sku_tdp": 150, "instance_vcpus": 4, "total_vcpus": 16, "te": 1500}}
+        return await self.inner_model.calculate_frame(await self.fetch_observations(), timespan=self.timespan, interval=self.interval, static_params=static_params)
+
+
+def calculate(timespan, window_end):
+    aggregated_component = AggregatedImpactNodesInterface("app", [StaticVM("vm", model=ComputeServer_STATIC_IMP())], timespan=timespan, interval="PT5M", window_end=window_end)
+    return model_payload(asyncio.run(aggregated_component.calculate())["app"])
+
+
+def test_job_chunks_timespans():
+    now = datetime(2026, 1, 3, 12, 30, tzinfo=timezone.utc)
+    assert [timespan for timespan, end in job_chunks("P2D", "P1D", now=now)] == ["PT24H", "PT24H"]
+    assert [timespan for timespan, end in job_chunks("PT90M", "PT1H", now=now)] == ["PT30M", "PT1H"]
+
+
+def test_sum_of_chunks_equals_direct_calculation():
+    chunks = job_chunks("PT6H", "PT1H", now=datetime(2026, 1, 1, 12, 30, tzinfo=timezone.utc))
+    totals = sum_chunks([calculate(timespan, end) for timespan, end in chunks])
+    direct = calculate("PT6H", chunks[-1][1])
+
+    assert direct["E_CPU"] > 0 and direct["E_GPU"] > 0
+    for metric in ("E_CPU", "E_GPU", "E", "I", "M", "SCI"):
+        assert totals[metric] == pytest.approx(direct[metric])
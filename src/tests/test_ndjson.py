@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+from lib.components.azure_aks_node import AKSNode
+from lib.components.azure_aks_pod import AKSPod
+from lib.ief.core import AggregatedImpactNodesInterface, SCIImpactMetricsInterface
+from lib.service.ndjson import stream_impacts
+
+
+NODE_METRICS = {"type": "azure.compute.aks.node", "name": "aks-node-0", "model": "computeserver_static_imp", "timespan": "PT1H", "interval": "PT5M", "E_CPU": 0.2, "E_MEM": 0.01, "E_GPU": 0.0, "E": 0.21, "I": 100.0, "M": 5.0, "SCI": 26.0}
+
+
+async def node_calculate(self, carbon_intensity=None):
+    return {"aks-node-0": SCIImpactMetricsInterface(metrics=NODE_METRICS, metadata={"pool": "system"}, observations={"average_cpu_percentage": 40}, static_params={"vm_sku_tdp": 200})}
+
+
+async def node_static_params(self):
+    return {"aks-node-0": {"vm_sku_tdp": 200, "total_vcpus": 8, "te": 1200}}
+
+
+def aks_pod(monkeypatch):
+    monkeypatch.setattr(AKSNode, "calculate", node_calculate)
+    monkeypatch.setattr(AKSNode, "lookup_static_params", node_static_params)
+    pod = AKSPod("pods", None, None, {}, {"cluster_name": "aks"}, {})
+    pods = [{"name": name, "namespace": "default", "node_name": "aks-node-0", "cpu_request": "500m", "memory_request": "1Gi", "uri": name} for name in ("web-0", "web-1")]
+
+    async def fetch_resources():
+        pod.resources = pods
+        return pods
+
+    async def fetch_observations():
+        return {pod["name"]: {"average_cpu_percentage": 20, "memory_gb": 0.5, "rr": 1} for pod in pods}
+
+    monkeypatch.setattr(pod, "fetch_resources", fetch_resources)
+    monkeypatch.setattr(pod, "fetch_observations", fetch_observations)
+    return pod
+
+
+async def collect(aggregated_component):
+    return [json.loads(line) async for line in stream_impacts(aggregated_component)]
+
+
+def test_stream_emits_shared_host_node_once(monkeypatch):
+    records = asyncio.run(collect(AggregatedImpactNodesInterface("app", [aks_pod(monkeypatch)])))
+
+    host_records = [record for record in records if record["kind"] == "host_node"]
+    resource_records = [record for record in records if record["kind"] == "resource"]
+    assert len(host_records) == 1
+    assert host_records[0]["id"] == "aks-node-0"
+    assert host_records[0]["SCI"] == NODE_METRICS["SCI"]
+    assert sorted(record["name"] for record in resource_records) == ["web-0", "web-1"]
+    assert all(record["host_node"] == "aks-node-0" for record in resource_records)
+    # the host node is emitted before the first resource it hosts
+    assert records.index(host_records[0]) < records.index(resource_records[0])
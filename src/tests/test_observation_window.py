@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import asyncio
+
+import pytest
+
+from lib.components.azure_vm import AzureVM
+from lib.models.computeserver_static_imp import ComputeServer_STATIC_IMP
+
+
+VM_ID = "/subscriptions/s/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/vm1"
+INTERVAL = 300
+TIMESPAN = 1800
+
+
+def minute_value(minute: int) -> float:
+    return float((minute * 13) % 97)
+
+
+def source_points(start: datetime, end: datetime):
+    # Azure Monitor like source : one datapoint per minute, averaged per epoch-aligned interval bucket, clipped to [start, end)
+    start, end = start.timestamp(), end.timestamp()
+    points = []
+    bucket = int(start // INTERVAL)
+    while bucket * INTERVAL < end:
+        low, high = max(start, bucket * INTERVAL), min(end, (bucket + 1) * INTERVAL)
+        minutes = [minute for minute in range(int(low // 60), int(high // 60) + 1) if low <= minute * 60 < high]
+        if minutes:
+            points.append((datetime.fromtimestamp(bucket * INTERVAL, tz=timezone.utc), sum(minute_value(minute) for minute in minutes) / len(minutes)))
+        bucket += 1
+    return points
+
+
+def sdk_response(points):
+    data = [SimpleNamespace(time_stamp=timestamp, average=average) for timestamp, average in points]
+    return SimpleNamespace(value=[SimpleNamespace(name=SimpleNamespace(localized_value="Percentage CPU"), timeseries=[SimpleNamespace(data=data)])])
+
+
+def full_window(now: datetime):
+    # the whole window fetched at once, from the start of its first bucket
+    start = now - timedelta(seconds=TIMESPAN)
+    return [average for timestamp, average in source_points(datetime.fromtimestamp(start.timestamp() // INTERVAL * INTERVAL, tz=timezone.utc), now)]
+
+
+def test_incremental_window_matches_full_fetch():
+    vm = AzureVM("vm", ComputeServer_STATIC_IMP(), None, {}, {"subscription_id": "s", "incremental_observations": "true"}, {}, interval="PT5M", timespan="PT30M")
+    fetched = []
+
+    async def list_metrics(monitor_client, resource_uri, metricnames, timespan=None):
+        start, end = [datetime.strptime(bound, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc) for bound in timespan.split("/")]
+        fetched.append((start, end))
+        return sdk_response(source_points(start, end))
+
+    vm.list_metrics = list_metrics
+
+    async def cycle(now):
+        vm.observation_window.fetch_range(now)
+        series = await vm.fetch_metric_series(None, VM_ID, "Percentage CPU")
+        vm.observation_window.advance()
+        return series
+
+    # cycles shorter and longer than an interval, not aligned on the buckets, and a gap longer than the window
+    start = datetime(2026, 1, 1, 12, 3, 20, tzinfo=timezone.utc)
+    offsets = [0, 150, 300, 420, 1000, 1310, 2000, 5900, 6030, 6400]
+    for offset in offsets:
+        now = start + timedelta(seconds=offset)
+        assert asyncio.run(cycle(now)) == [("Percentage CPU", pytest.approx(full_window(now)))]
+
+    # only the first cycle, and the one after the gap, fetch the whole window
+    whole_window = [end - start_time for start_time, end in fetched if end - start_time > timedelta(seconds=TIMESPAN)]
+    assert len(whole_window) == 2
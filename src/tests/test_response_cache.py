@@ -0,0 +1,60 @@
+import asyncio
+
+from lib.ief.core import SCIImpactMetricsInterface
+from lib.service.response_cache import CACHE_HIT, CACHE_MISS, CACHE_STALE, ResponseCache
+
+
+def metrics_response(failed_components=None):
+    metadata = {"aggregated": "True"}
+    if failed_components:
+        metadata["failed_components"] = failed_components
+    metrics = {"name": "app", "type": "aggregatedimpactnode", "model": "SCI Impact Model", "timespan": "PT1H", "interval": "PT5M", "E_CPU": 1.0, "E_MEM": 0.0, "E_GPU": 0.0, "E": 1.0, "I": 100.0, "M": 0.0, "SCI": 100.0}
+    return {"app": SCIImpactMetricsInterface(metrics=metrics, metadata=metadata, observations={}, static_params={}, components_list=[])}
+
+
+def calculator(responses):
+    calls = []
+
+    async def calculate():
+        calls.append(1)
+        return responses[min(len(calls), len(responses)) - 1]
+    return calculate, calls
+
+
+def test_complete_responses_are_cached():
+    cache = ResponseCache(ttl=60, stale_ttl=300)
+    calculate, calls = calculator([metrics_response()])
+
+    async def run():
+        return [(await cache.get("key", calculate))[1] for _ in range(2)]
+
+    assert asyncio.run(run()) == [CACHE_MISS, CACHE_HIT]
+    assert len(calls) == 1
+
+
+def test_partial_responses_are_not_cached():
+    cache = ResponseCache(ttl=60, stale_ttl=300)
+    calculate, calls = calculator([metrics_response({"vm": "TimeoutError: "}), metrics_response()])
+
+    async def run():
+        return [(await cache.get("key", calculate))[1] for _ in range(3)]
+
+    # the partial response is recalculated on the next request, and the complete one is then cached
+    assert asyncio.run(run()) == [CACHE_MISS, CACHE_MISS, CACHE_HIT]
+    assert len(calls) == 2
+
+
+def test_partial_refresh_drops_the_stale_response():
+    cache = ResponseCache(ttl=0, stale_ttl=300)
+    calculate, calls = calculator([metrics_response(), metrics_response({"vm": "TimeoutError: "})])
+
+    async def run():
+        statuses = [(await cache.get("key", calculate))[1]]
+        statuses.append((await cache.get("key", calculate))[1])
+        # wait for the background recalculation of the stale response
+        await asyncio.gather(*cache.inflight.values())
+        return statuses
+
+    assert asyncio.run(run()) == [CACHE_MISS, CACHE_STALE]
+    assert len(calls) == 2
+    assert "key" not in cache.entries